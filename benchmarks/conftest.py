@@ -0,0 +1,45 @@
+import os
+import shutil
+
+import pytest
+
+from benchmarks.specs import (
+    COMPLETIONS_PATH, SHIPPED_COMMANDS, TREE_SIZES, generate_cyclic_tree, generate_tree, install_spec,
+)
+from sufler import spec
+
+
+@pytest.fixture(scope='session')
+def sufler_home(tmpdir_factory):
+    home = tmpdir_factory.mktemp('home')
+    environ = dict(os.environ)
+    os.environ['HOME'] = str(home)
+    os.environ['SUFLER_SOCKET'] = str(home.join('missing.sock'))
+
+    home.mkdir('.sufler').mkdir('completions')
+    for command in SHIPPED_COMMANDS:
+        shutil.copyfile(
+            os.path.join(COMPLETIONS_PATH, command + '.yml'),
+            spec.get_spec_path(command),
+        )
+        spec.load_spec(command)
+
+    for nodes in TREE_SIZES:
+        install_spec('tree{0}'.format(nodes), generate_tree(nodes))
+    install_spec('cycle', generate_cyclic_tree(100))
+
+    yield home
+    os.environ.clear()
+    os.environ.update(environ)
+
+
+@pytest.fixture
+def files_tree(tmpdir, monkeypatch):
+    """ Directory with 10000 files and 100 directories of 100 files """
+    for i in range(100):
+        directory = tmpdir.mkdir('dir{0:02d}'.format(i))
+        for j in range(100):
+            tmpdir.join('file{0:02d}{1:02d}'.format(i, j)).write('')
+            directory.join('file{0:02d}'.format(j)).write('')
+    monkeypatch.chdir(tmpdir)
+    return tmpdir
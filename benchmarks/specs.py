@@ -0,0 +1,93 @@
+import os
+
+from sufler import bundle, spec
+
+PACKAGE_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+COMPLETIONS_PATH = os.path.join(PACKAGE_PATH, 'completions')
+
+SHIPPED_COMMANDS = ('pip', 'npm')
+TREE_SIZES = (10 ** 4, 10 ** 5, 10 ** 6)
+TREE_WIDTH = 10
+
+
+def generate_tree(nodes, width=TREE_WIDTH):
+    """ Generate balanced completions tree
+
+    Keys of every node are 'opt0', 'opt1', ... so argument 'opt0'
+    repeated n times selects node on depth n.
+
+    :param nodes: Number of nodes in tree
+    :param width: Number of children of every node
+    :return: Root dict of tree
+    """
+    root = {}
+    count = 1
+    level = [root]
+    while count < nodes:
+        next_level = []
+        for node in level:
+            for i in range(min(width, nodes - count)):
+                child = {}
+                node['opt{0}'.format(i)] = child
+                next_level.append(child)
+                count += 1
+        level = next_level
+    return root
+
+
+def generate_cyclic_tree(depth, width=TREE_WIDTH):
+    """ Generate chain of nodes whose options lead back to root
+
+    Same as YAML with anchor on root used on every level, e.g.
+    'cmd': &cmd {'-v': *cmd, 'next': {'-v': *cmd, ...}}
+
+    :param depth: Length of chain
+    :param width: Number of options pointing to root on every level
+    :return: Root dict of tree
+    """
+    root = {}
+    node = root
+    for _ in range(depth):
+        for i in range(width):
+            node['-o{0}'.format(i)] = root
+        node['next'] = {}
+        node = node['next']
+    return root
+
+
+def generate_exec_fanout(markers, command='printf "one\\ntwo\\nthree"'):
+    """ Generate node with sibling <Exec> markers
+
+    :param markers: Number of sibling markers
+    :param command: Command run by every marker, number of marker
+        is appended so commands differ
+    :return: Root dict of tree
+    """
+    return dict(
+        ('<Exec ttl=0> {0} {1}'.format(command, i), {'leaf': None})
+        for i in range(markers)
+    )
+
+
+def install_spec(command, document):
+    """ Write compiled spec cache and mapped cache of command without
+    going through .yml
+
+    Synthetic trees are too large to be dumped and parsed as YAML,
+    so .yml file is placeholder identified by header of cache.
+
+    :param command: Name of command
+    :param document: Document with completions tree of command
+    :return: None
+    """
+    source_path = spec.get_spec_path(command)
+    with open(source_path, 'w') as f:
+        f.write('# synthetic spec\n')
+    header = spec.get_spec_header(source_path)
+    documents = [spec.compile_tree({command: document})]
+    spec.write_spec_cache(spec.get_spec_cache_path(command), header, documents)
+
+    mapped_path = bundle.get_mapped_spec_path(command)
+    if not os.path.exists(os.path.dirname(mapped_path)):
+        os.makedirs(os.path.dirname(mapped_path))
+    bundle.write_bundle(mapped_path, [(command, header, documents)])
@@ -0,0 +1,22 @@
+import sys
+
+import pytest
+
+from sufler.backends.bash.bash import bash_parse
+from sufler.backends.fish.fish import fish_parse
+from sufler.backends.powershell.powershell import powershell_parse
+
+
+@pytest.mark.benchmark(group='backends')
+@pytest.mark.parametrize('parse, argv', [
+    (bash_parse, ['bash.py', '2', 'pip', 'install', '--']),
+    (fish_parse, ['fish.py', 'pip install --']),
+    (powershell_parse, ['powershell.py', 'pip install --', '--']),
+    (bash_parse, ['bash.py', '3', 'npm', 'list', '-depth=', '']),
+    (fish_parse, ['fish.py', 'npm access ']),
+])
+def test_backend_parse(benchmark, sufler_home, capsys, monkeypatch, parse, argv):
+    monkeypatch.setattr(sys, 'argv', argv)
+
+    benchmark(parse)
+    assert capsys.readouterr()[0]
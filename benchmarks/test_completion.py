@@ -0,0 +1,166 @@
+import os
+import subprocess
+import sys
+import tracemalloc
+
+import pytest
+
+from benchmarks.specs import PACKAGE_PATH, TREE_SIZES, generate_exec_fanout
+from sufler import base, bundle, spec
+
+SHIPPED_ARGUMENTS = [
+    ['pip', ''],
+    ['pip', 'install', '--'],
+    ['npm', 'list', '-depth=', '3', ''],
+    ['npm', 'adduser', '--scope=', '@scope', '--always-auth', ''],
+]
+
+
+def run_exec(command, ttl, timeout, swr, prefix=None, limit=None, cwd=None):
+    return 'one\ntwo\nthree'
+
+
+def complete(arguments, **kwargs):
+    return base.completion(
+        arguments[0], ['path', str(len(arguments) - 1)] + arguments,
+        run_exec=run_exec, **kwargs
+    )
+
+
+@pytest.mark.benchmark(group='cold-start')
+@pytest.mark.parametrize('arguments', SHIPPED_ARGUMENTS[:2] + [['tree10000', 'opt0', '']])
+def test_cold_start(benchmark, sufler_home, arguments):
+    script = os.path.join(PACKAGE_PATH, 'sufler', 'backends', 'bash', 'bash.py')
+    command = [sys.executable, script, str(len(arguments) - 1)] + arguments
+    env = dict(os.environ, PYTHONPATH=PACKAGE_PATH)
+
+    output = benchmark.pedantic(
+        subprocess.check_output, args=(command,), kwargs={'env': env}, rounds=10,
+    )
+    assert output
+
+
+@pytest.mark.benchmark(group='warm')
+@pytest.mark.parametrize('arguments', SHIPPED_ARGUMENTS)
+def test_warm_shipped_spec(benchmark, sufler_home, arguments):
+    assert benchmark(complete, arguments) is not None
+
+
+@pytest.mark.benchmark(group='daemon')
+@pytest.mark.parametrize('arguments', SHIPPED_ARGUMENTS)
+def test_loaded_shipped_spec(benchmark, sufler_home, arguments):
+    documents = spec.load_spec(arguments[0])
+
+    assert benchmark(complete, arguments, documents=documents) is not None
+
+
+@pytest.mark.benchmark(group='load-spec')
+@pytest.mark.parametrize('nodes', TREE_SIZES)
+def test_load_spec_cache(benchmark, sufler_home, nodes):
+    documents = benchmark.pedantic(spec.load_spec, args=('tree{0}'.format(nodes),), rounds=3)
+
+    assert documents[0].children
+
+
+@pytest.mark.benchmark(group='mapped-spec')
+@pytest.mark.parametrize('nodes', TREE_SIZES)
+@pytest.mark.parametrize('load_spec', [spec.load_spec, bundle.load_mapped_spec], ids=['pickle', 'mmap'])
+def test_load_and_complete(benchmark, sufler_home, nodes, load_spec):
+    """ Load spec and complete 3 levels deep, as on every Tab without daemon """
+    command = 'tree{0}'.format(nodes)
+
+    def load_and_complete():
+        return sorted(complete([command, 'opt0', 'opt0', ''], documents=load_spec(command)))
+
+    tracemalloc.start()
+    options = load_and_complete()
+    benchmark.extra_info['peak_memory'] = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    assert benchmark.pedantic(load_and_complete, rounds=3) == options
+
+
+@pytest.mark.benchmark(group='depth')
+@pytest.mark.parametrize('nodes', TREE_SIZES)
+@pytest.mark.parametrize('depth', [1, 2, 3, 4])
+def test_completion_depth(benchmark, sufler_home, nodes, depth):
+    command = 'tree{0}'.format(nodes)
+    documents = spec.load_spec(command)
+    benchmark.extra_info['depth'] = depth
+
+    options = benchmark(complete, [command] + ['opt0'] * (depth - 1) + [''], documents=documents)
+    assert options is not None
+
+
+@pytest.mark.benchmark(group='depth')
+@pytest.mark.parametrize('depth', [10, 50, 100])
+def test_completion_anchor_cycle(benchmark, sufler_home, depth):
+    documents = spec.load_spec('cycle')
+    arguments = ['cycle'] + ['-o1', 'next'] * (depth // 2) + ['-']
+
+    options = benchmark(complete, arguments, documents=documents, prefix='-')
+    assert len(options) == 10
+
+
+@pytest.mark.benchmark(group='exec-fanout')
+@pytest.mark.parametrize('markers', [1, 8, 64])
+def test_exec_fanout(benchmark, markers):
+    documents = [spec.compile_tree({'cmd': generate_exec_fanout(markers)})]
+
+    options = benchmark(complete, ['cmd', ''], documents=documents)
+    assert set(options.keys()) == {'one', 'two', 'three'}
+
+
+@pytest.mark.benchmark(group='exec-fanout')
+@pytest.mark.parametrize('markers', [1, 8])
+def test_exec_fanout_processes(benchmark, sufler_home, markers):
+    documents = [spec.compile_tree({'cmd': generate_exec_fanout(markers)})]
+    arguments = ['path', '1', 'cmd', '']
+
+    options = benchmark(base.completion, 'cmd', arguments, documents=documents)
+    assert set(options.keys()) == {'one', 'two', 'three'}
+
+
+@pytest.mark.benchmark(group='exec-stream')
+@pytest.mark.parametrize('lines', [10000, 100000])
+@pytest.mark.parametrize('limit', [None, 20])
+def test_exec_stream(benchmark, sufler_home, lines, limit):
+    documents = [spec.compile_tree({'cmd': {'<Exec ttl=0> seq {0}'.format(lines): None}})]
+    arguments = ['path', '1', 'cmd', '9']
+
+    def complete_and_trace():
+        tracemalloc.start()
+        try:
+            output = base.completion('cmd', arguments, documents=documents, prefix='9', limit=limit)
+            return output, tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    output, peak = benchmark.pedantic(complete_and_trace, rounds=3)
+    benchmark.extra_info['peak_memory'] = peak
+    assert output.startswith('9\n')
+    if limit:
+        assert len(output.split('\n')) == limit
+
+
+@pytest.mark.benchmark(group='file-fanout')
+@pytest.mark.parametrize('marker, typed, expected_value', [
+    ('<File>', 'file50', 100),
+    ('<File rec>', 'dir05/', 100),
+    ('<File rec depth=2>', 'dir', 10100),
+])
+def test_file_fanout(benchmark, files_tree, marker, typed, expected_value):
+    documents = [spec.compile_tree({'cmd': {marker: None}})]
+
+    def complete_without_cache():
+        base.FILES_CACHE.clear()
+        return complete(['cmd', typed], documents=documents, prefix=typed)
+
+    assert len(benchmark(complete_without_cache)) == expected_value
+
+
+@pytest.mark.benchmark(group='file-fanout')
+def test_file_fanout_cached(benchmark, files_tree):
+    documents = [spec.compile_tree({'cmd': {'<File rec depth=2>': None}})]
+
+    assert len(benchmark(complete, ['cmd', 'dir'], documents=documents, prefix='dir')) == 10100
@@ -32,6 +32,7 @@ setup(
     packages=find_packages(),
     include_package_data=True,
     install_requires=requirements,
+    python_requires='>=3.5',
     entry_points="""\
       [console_scripts]
       sufler = sufler.cli:main
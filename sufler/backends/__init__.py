@@ -0,0 +1,26 @@
+import os
+
+
+def parse_options(arguments):
+    """ Take options passed to completer script before completion arguments
+
+    :param arguments: Arguments of completer script
+    :return: Tuple with limit of candidates and rest of arguments
+    """
+    limit = int(os.environ.get('SUFLER_LIMIT', 0)) or None
+    arguments = list(arguments)
+    if len(arguments) > 1 and arguments[1].startswith('--limit='):
+        limit = int(arguments.pop(1)[len('--limit='):]) or None
+    return limit, arguments
+
+
+def get_prefix(line, arguments):
+    """ Currently typed part of last argument
+
+    :param line: Command line typed before cursor
+    :param arguments: Arguments split from line
+    :return: Last argument or empty string if line ends with space
+    """
+    if not arguments or line.endswith(' '):
+        return ''
+    return arguments[-1]
@@ -2,16 +2,23 @@
 
 import sys
 
-from sufler.base import completion
+from sufler.backends import parse_options
+from sufler.client import completion
 
 
 def bash_parse():
     """ Pare arguments to list for completer function
 
         """
+    limit, arguments = parse_options(sys.argv)
+    words = arguments[2:]
+    current_word = int(arguments[1])
+
     options = completion(
-        command_name=sys.argv[2],
-        all_arguments=sys.argv,
+        command_name=arguments[2],
+        all_arguments=arguments,
+        prefix=words[current_word] if current_word < len(words) else '',
+        limit=limit,
     )
 
     if isinstance(options, dict):
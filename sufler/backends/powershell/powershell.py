@@ -2,14 +2,16 @@
 
 import sys
 
-from sufler.base import completion
+from sufler.backends import get_prefix, parse_options
+from sufler.client import completion
 
 
 def powershell_parse():
-    list_of_arguments = [sys.argv[0]]
+    limit, script_arguments = parse_options(sys.argv)
+    list_of_arguments = [script_arguments[0]]
     arguments = list(
                     item
-                    for item in sys.argv[1].split(' ') if item
+                    for item in script_arguments[1].split(' ') if item
                     )
     list_of_arguments.append(len(arguments))
     list_of_arguments += arguments
@@ -17,6 +19,8 @@ def powershell_parse():
     options = completion(
         command_name=list_of_arguments[2],
         all_arguments=list_of_arguments,
+        prefix=get_prefix(script_arguments[1], arguments),
+        limit=limit,
     )
 
     if isinstance(options, dict):
@@ -2,50 +2,130 @@
 
 import logging
 import os
-import re
-import subprocess
+import time
+from bisect import bisect_left
 
-import yaml
+from sufler.bundle import is_spec_large, load_bundle_spec, load_mapped_spec
+from sufler.cache import (exec_command_lock, finish_exec_refresh, get_ttl,
+                          read_exec_cache, read_stale_exec_cache,
+                          start_exec_refresh, write_exec_cache)
+from sufler.spec import compile_tree, get_spec_path, load_spec
+from sufler.trace import NO_TRACE, start_trace
 
 logger = logging.getLogger(__file__)
 
 SUFLER_BASE_PATH = os.path.abspath(os.path.dirname(__file__))
 os.environ['SUFLER_HOME'] = SUFLER_BASE_PATH
 
+COMPLETION_TIMEOUT = float(os.environ.get('SUFLER_TIMEOUT', 2))
+EXEC_WORKERS = 8
+EXEC_OUTPUT_LIMIT = int(os.environ.get('SUFLER_EXEC_OUTPUT_LIMIT', 100000))
+EXEC_CANDIDATES_LIMIT = int(
+    os.environ.get('SUFLER_EXEC_CANDIDATES_LIMIT', 10000)
+)
+# time for reading output of <Exec> commands killed at deadline
+EXEC_KILL_GRACE = 0.1
 
-def get_files_autocomplete(already_typed):
-    """ Get files list for <File> marker in .yml file
+FILES_CACHE_TTL = float(os.environ.get('SUFLER_FILES_CACHE_TTL', 2))
+FILES_CACHE_SIZE = 256
+FILES_CACHE = {}
 
-    :param already_typed: Already typed string
-    :return: List of files in directory or already typed path to file
+
+def list_directory(path):
+    """ List directory, reuse listing for FILES_CACHE_TTL seconds
+
+    Listing is reused only while modification time of directory
+    is unchanged.
+
+    :param path: Path to directory
+    :return: Tuple with sorted names and DirEntry objects of directory
+        or None if directory can't be listed
     """
-    if os.path.exists(already_typed) and os.path.isfile(already_typed):
-            return [already_typed]
+    now = time.time()
+    try:
+        mtime = os.stat(path).st_mtime
+    except OSError:
+        return None
+
+    cached = FILES_CACHE.get(path)
+    if cached and cached[0] == mtime and now - cached[1] < FILES_CACHE_TTL:
+        return cached[2]
 
-    path = '/'.join(already_typed.split('/')[:-1])
     try:
-        res = list(map(
-            lambda file:
-            file + '/'
-            if os.path.isdir(file)
-            else
-            file, os.listdir('{0}/{1}'.format(os.getcwd(), path))
-        ))
+        entries = sorted(os.scandir(path), key=lambda entry: entry.name)
     except OSError:
-        res = [already_typed]
+        return None
+
+    if len(FILES_CACHE) >= FILES_CACHE_SIZE:
+        FILES_CACHE.clear()
+    listing = ([entry.name for entry in entries], entries)
+    FILES_CACHE[path] = (mtime, now, listing)
+    return listing
+
+
+def get_files_autocomplete(already_typed, depth=1):
+    """ Get files list for <File> marker in .yml file
+
+    Entries of typed directory are filtered by typed part of name before
+    checking which of them are directories. Matching directories are
+    listed down to depth levels.
+
+    :param already_typed: Already typed string
+    :param depth: Number of listed directory levels
+    :return: List of matching paths, where directories end with '/',
+        or already typed path to file
+    """
+    if os.path.exists(already_typed) and os.path.isfile(already_typed):
+        return [already_typed]
+
+    prefix = os.path.basename(already_typed)
+    typed_directory = already_typed[:len(already_typed) - len(prefix)]
+    path = os.path.expanduser(typed_directory) or os.curdir
+    if list_directory(path) is None:
+        return [already_typed]
+
+    res = []
+    stack = [(path, typed_directory, prefix, depth)]
+    while stack:
+        path, typed_directory, prefix, depth = stack.pop()
+        listing = list_directory(path)
+        if listing is None:
+            continue
+
+        names, entries = listing
+        for entry in entries[bisect_left(names, prefix):]:
+            if not entry.name.startswith(prefix):
+                break
+
+            candidate = typed_directory + entry.name
+            try:
+                is_dir = entry.is_dir()
+            except OSError:
+                is_dir = False
+            if is_dir:
+                candidate += '/'
+                if depth > 1:
+                    stack.append((entry.path, candidate, '', depth - 1))
+            res.append(candidate)
     return res
 
 
 def get_autocomplete_file_for_command(command):
-    """ Read completion for command from .yml file
+    """ Read completion for command from bundle or compiled .yml file cache
+
+    Large .yml files are walked in memory mapped cache, so only nodes
+    on typed path are decoded.
 
     :param command: The command for which read completions
-    :return: Dict of completions for command
+    :return: List of completion documents for command
     """
-    path_to_command = os.path.expanduser(
-        '~/.sufler/completions/{0}.yml'.format(command)
-    )
-    return yaml.load_all(open(path_to_command, "r"))
+    documents = load_bundle_spec(command)
+    if documents is None:
+        if is_spec_large(command):
+            documents = load_mapped_spec(command)
+        else:
+            documents = load_spec(command)
+    return documents
 
 
 def replace_tree_marks(key, arguments):
@@ -69,84 +149,649 @@ def replace_tree_marks(key, arguments):
     return key
 
 
-def completion(command_name, all_arguments):
-    """ Parse already typed arguments for command and return matching arguments
+def run_exec_command(command, env=None, timeout=None, prefix=None,
+                     limit=None):
+    """ Run command of <Exec> marker and filter its output as it is read
+
+    Command is run without shell when it has no shell syntax. Lines
+    of output go through stages as they come, distinct lines starting
+    with prefix are kept as candidates and command is killed when
+    limit of candidates, at most EXEC_CANDIDATES_LIMIT, is reached.
+    Whole output is kept for cache only when command finished
+    and output has at most EXEC_OUTPUT_LIMIT lines.
+
+    :param command: Body of <Exec> marker with TREE marks replaced
+    :param env: Environment for command, current one if None
+    :param timeout: Seconds after which command is killed
+    :param prefix: Only lines starting with prefix are candidates
+    :param limit: Number of candidates after which command is killed,
+        EXEC_CANDIDATES_LIMIT if None
+    :return: Tuple with list of candidates, output and return code,
+        return code is None if command timed out and output is None
+        if command failed or it was not read whole
+    """
+    # imported only when command is run, most completions don't need it
+    import signal
+    import subprocess
+    import threading
 
-    :param command_name: Command for which we make completion
-    :param all_arguments: Arguments already typed for command
-    :return: Dict with matching arguments
+    from sufler.filters import parse_exec, split_command, stream_stages
+
+    try:
+        shell_command, stages = parse_exec(command)
+    except ValueError as e:
+        logger.warning("Wrong <Exec>{0}: {1}".format(command, e))
+        return [], None, 1
+
+    arguments = split_command(shell_command)
+    try:
+        process = subprocess.Popen(
+            arguments or shell_command, shell=arguments is None, env=env,
+            stdout=subprocess.PIPE, start_new_session=True,
+        )
+    except OSError as e:
+        logger.info("Can't run <Exec> command {0}: {1}".format(command, e))
+        return [], None, 127
+
+    def kill():
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except OSError:
+            pass
+
+    timed_out = []
+
+    def expire():
+        timed_out.append(True)
+        kill()
+
+    timer = None
+    if timeout is not None:
+        timer = threading.Timer(timeout, expire)
+        timer.daemon = True
+        timer.start()
+
+    finished = []
+    # output of command without stages is cached as it was printed
+    newline = ['\n']
+
+    def read_lines():
+        for line in process.stdout:
+            if not stages and not line.endswith(b'\n'):
+                newline[0] = ''
+            yield line.decode('utf-8', 'replace').rstrip('\n')
+        finished.append(True)
+
+    limit = min(limit, EXEC_CANDIDATES_LIMIT) if limit else \
+        EXEC_CANDIDATES_LIMIT
+    candidates = []
+    seen = set()
+    lines = []
+    truncated = False
+    try:
+        for line in stream_stages(read_lines(), stages):
+            if lines is not None:
+                lines.append(line)
+                if len(lines) > EXEC_OUTPUT_LIMIT:
+                    lines = None
+            if line in seen or \
+                    prefix is not None and not line.startswith(prefix):
+                continue
+            seen.add(line)
+            candidates.append(line)
+            if len(candidates) >= limit:
+                truncated = True
+                break
+    finally:
+        if timer is not None:
+            timer.cancel()
+        if not finished:
+            # enough candidates or stages don't need rest of output
+            kill()
+        process.stdout.close()
+        process.wait()
+
+    if timed_out:
+        logger.info("Timeout of <Exec> command " + command)
+        return candidates, None, None
+    if finished and process.returncode:
+        return [], None, process.returncode
+    if truncated or lines is None:
+        logger.debug("Output of <Exec> command not cached " + command)
+        return candidates, None, 0
+    return candidates, ('\n'.join(lines) + newline[0]) if lines else '', 0
+
+
+def refresh_exec_cache(command, env=None, cwd=None):
+    """ Refresh cached output of command in detached process
+
+    Refresh outlives completion, so expired output can be returned
+    immediately. Only one refresh of command runs at a time.
+
+    :param command: Shell command from <Exec> marker
+    :param env: Environment for command, current one if None
+    :param cwd: Working directory output depends on or None
+    :return: None
+    """
+    if not start_exec_refresh(command, env, cwd):
+        return
+
+    import subprocess
+    import sys
+
+    logger.debug("Refresh <Exec> command in background " + command)
+    try:
+        subprocess.Popen(
+            [sys.executable, '-m', 'sufler.refresh', command] +
+            ([cwd] if cwd else []),
+            env=env, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL, start_new_session=True,
+        )
+    except OSError:
+        finish_exec_refresh(command, env, cwd)
+
+
+class PartialOutput(str):
+    """ Candidates read from <Exec> command before it was killed
+
+    Partial output is returned to completion, but it is never cached.
+    """
+
+
+def get_exec_autocomplete(command, env=None, ttl=None, timeout=None,
+                          swr=None, prefix=None, limit=None, cwd=None):
+    """ Get output of shell command for <Exec> marker in .yml file
+
+    Output is cached in ~/.sufler/cache/exec for ttl seconds, separately
+    for every environment and, for <Exec cwd> markers, for every working
+    directory. For swr seconds after ttl expired output is returned
+    and refreshed in background. Command killed after timeout is run
+    again in background, so its output is cached. Concurrent sufler
+    processes run the same command once, others wait for its output.
+
+    :param command: Shell command from <Exec> marker
+    :param env: Environment for command, current one if None
+    :param ttl: Time to live of cached output, SUFLER_CACHE_TTL if None
+    :param timeout: Seconds after which command is killed
+    :param swr: Seconds for which expired output is served, 0 if None
+    :param prefix: Currently typed part of argument or None
+    :param limit: Number of lines starting with prefix after which
+        command is killed, only these lines are returned then
+    :param cwd: Working directory output depends on, None if output
+        is the same in every directory
+    :return: Output of command, empty string if command failed,
+        PartialOutput with candidates read before command timed out
+        or None if command timed out waiting for other process
+    """
+    output = read_exec_cache(command, ttl, env, cwd)
+    if output is not None:
+        return output
+
+    if swr is not None:
+        output = read_stale_exec_cache(command, ttl, swr, env, cwd)
+        if output is not None:
+            refresh_exec_cache(command, env, cwd)
+            return output
+
+    if get_ttl(ttl) <= 0:
+        candidates, output, returncode = run_exec_command(
+            command, env, timeout, prefix, limit
+        )
+        if returncode is None:
+            return PartialOutput('\n'.join(candidates))
+        if returncode:
+            return ''
+        return '\n'.join(candidates) if output is None else output
+
+    deadline = None if timeout is None else time.time() + timeout
+    with exec_command_lock(command, timeout, env, cwd) as waited:
+        if waited is None:
+            return None
+        # other process may have run the command since cache was read
+        output = read_exec_cache(command, ttl, env, cwd)
+        if output is not None:
+            return output
+
+        candidates, output, returncode = run_exec_command(
+            command, env,
+            None if deadline is None else max(deadline - time.time(), 0),
+            prefix, limit,
+        )
+        if returncode is None:
+            # command is finished in background, so its output
+            # is cached for next completion
+            refresh_exec_cache(command, env, cwd)
+            return PartialOutput('\n'.join(candidates))
+        if returncode:
+            return ''
+
+        if output is None:
+            # output was not read whole, only candidates for prefix
+            return '\n'.join(candidates)
+
+        write_exec_cache(command, output, env, cwd)
+        return output
+
+
+def run_exec_autocomplete(command, ttl, timeout, swr, prefix, limit, cwd):
+    """ Get output of <Exec> command for completion in current environment
+
+    :param command: Shell command from <Exec> marker
+    :param ttl: Time to live of cached output from <Exec> marker
+    :param timeout: Seconds after which command is killed
+    :param swr: Seconds for which expired output is served
+    :param prefix: Currently typed part of argument or None
+    :param limit: Maximal number of candidates from command or None
+    :param cwd: Working directory output depends on or None
+    :return: Output of command, partial if command timed out
+    """
+    return get_exec_autocomplete(
+        command, ttl=ttl, timeout=timeout, swr=swr, prefix=prefix,
+        limit=limit, cwd=cwd,
+    )
+
+
+def run_execs(commands, run_exec, deadline, prefix=None, limit=None):
+    """ Run <Exec> commands concurrently and wait for them until deadline
+
+    :param commands: List of tuples with command, its ttl and swr options
+        and working directory its output depends on
+    :param run_exec: Function used to get output of <Exec> commands
+    :param deadline: Time after which commands are not awaited
+    :param prefix: Currently typed part of argument or None
+    :param limit: Maximal number of candidates from command or None
+    :return: Dict with output of commands, partial for commands
+        killed at deadline
+    """
+    outputs = {}
+    commands = dict(
+        (command, (ttl, swr, cwd)) for command, ttl, swr, cwd in commands
+    )
+    if not commands:
+        return outputs
+
+    timeout = max(deadline - time.time(), 0)
+    if len(commands) == 1:
+        command, (ttl, swr, cwd) = commands.popitem()
+        output = run_exec(command, ttl, timeout, swr, prefix, limit, cwd)
+        if output is not None:
+            outputs[command] = output
+        return outputs
+
+    from concurrent.futures import ThreadPoolExecutor, wait
+
+    executor = ThreadPoolExecutor(max_workers=min(len(commands), EXEC_WORKERS))
+    futures = dict(
+        (
+            executor.submit(
+                run_exec, command, ttl, timeout, swr, prefix, limit, cwd
+            ),
+            command,
+        )
+        for command, (ttl, swr, cwd) in commands.items()
+    )
+    # killed commands return candidates read before deadline
+    done, not_done = wait(futures, timeout=timeout + EXEC_KILL_GRACE)
+    executor.shutdown(wait=False)
+
+    for future in not_done:
+        logger.info("Timeout of <Exec> command " + futures[future])
+
+    for future in done:
+        output = future.result()
+        if output is not None:
+            outputs[futures[future]] = output
+    return outputs
+
+
+class Overlay(object):
+    """ Node of completions tree with markers expanded during completion
+
+    Compiled nodes are shared, so candidates of expanded markers are kept
+    only in overlay, which lives as long as one completion step.
+    """
+    __slots__ = ('node', 'expanded')
+
+    def __init__(self, node):
+        self.node = node
+        self.expanded = {}
+
+
+def get_file_candidates(marker, argument):
+    """ Expand <File> marker to candidates
+
+    <File> completes paths in typed directory, <File rec> lists
+    also depth levels of it.
+
+    :param marker: Compiled <File> marker
+    :param argument: Argument following node with marker
+    :return: List of files
+    """
+    depth = 1
+    if 'rec' in marker.options:
+        depth = int(marker.options.get('depth', 1))
+    return get_files_autocomplete(argument or '', depth)
+
+
+def expand_exec_markers(markers, arguments, run_commands, prefix=None,
+                        limit=None):
+    """ Expand sibling <Exec> markers to candidates concurrently
+
+    :param markers: List of compiled <Exec> markers
+    :param arguments: Arguments already typed for command
+    :param run_commands: Function which runs list of <Exec> commands
+    :param prefix: Currently typed part of argument or None
+    :param limit: Maximal number of candidates from command or None
+    :return: Dict with candidates for markers, output of <Exec>
+        is not split when marker has no nested node
+    """
+    # only output of <Exec cwd> markers depends on working directory
+    cwd = None
+    if any('cwd' in marker.options for marker in markers):
+        try:
+            cwd = os.getcwd()
+        except OSError:
+            logger.debug("Working directory of <Exec cwd> was removed")
+
+    commands = [
+        (
+            replace_tree_marks(marker.body, arguments),
+            marker.options.get('ttl'), marker.options.get('swr'),
+            cwd if 'cwd' in marker.options else None,
+        )
+        for marker in markers
+    ]
+    outputs = run_commands(commands, prefix, limit)
+
+    expanded = {}
+    for marker, (command, _, _, _) in zip(markers, commands):
+        output = outputs.get(command, '')
+        expanded[marker] = output.split('\n') \
+            if marker.child is not None else output
+    return expanded
+
+
+def find_child(overlay, argument, arguments, run_commands, prefix=None,
+               trace=NO_TRACE):
+    """ Find node selected by argument
+
+    Markers are expanded only when there is no key equal to argument.
+
+    :param overlay: Overlay of current node, filled with candidates
+        of expanded markers
+    :param argument: Argument which selects child of current node
+    :param arguments: Arguments already typed for command
+    :param run_commands: Function which runs list of <Exec> commands
+    :param prefix: Only lines of <Exec> output starting with prefix
+        are read, whole output if None
+    :param trace: Trace recording time of <File> and <Regex> expansion
+    :return: Tuple with flag if child was found and child node
+    """
+    node = overlay.node
+    if argument in node.children:
+        return True, node.children[argument]
+
+    exec_markers = []
+    for marker in node.markers:
+        if marker.name == 'Regex':
+            started = time.time()
+            pattern = marker.pattern
+            if pattern is None and 'TREE~' in marker.body:
+                import re
+
+                pattern = re.compile(
+                    replace_tree_marks(marker.body, arguments)
+                )
+            matched = argument and pattern is not None and \
+                pattern.search(argument)
+            trace.add('regex', started, marker.body)
+            if matched:
+                return True, marker.child
+
+        elif marker.name == 'File':
+            started = time.time()
+            overlay.expanded[marker] = get_file_candidates(marker, argument)
+            trace.add('file', started, argument)
+            if argument in overlay.expanded[marker]:
+                return True, marker.child
+
+        # <Exec> without nested node is shown only as output
+        elif marker.name == 'Exec' and marker.child is not None:
+            exec_markers.append(marker)
+
+    # output read for prefix is not kept for expand_node,
+    # it is reused by run_commands only for longer prefixes
+    expanded = expand_exec_markers(
+        exec_markers, arguments, run_commands, prefix
+    )
+    for marker in exec_markers:
+        if argument in expanded[marker]:
+            return True, marker.child
+
+    return False, None
+
+
+def filter_keys(sorted_keys, prefix):
+    """ Select keys starting with prefix from sorted keys of node
+
+    :param sorted_keys: Sorted tuple of literal keys
+    :param prefix: Currently typed part of argument
+    :return: Matching keys
+    """
+    start = bisect_left(sorted_keys, prefix)
+    end = start
+    while end < len(sorted_keys) and sorted_keys[end].startswith(prefix):
+        end += 1
+    return sorted_keys[start:end]
+
+
+def filter_output(output, prefix, limit):
+    """ Select lines of <Exec> output starting with prefix
+
+    :param output: Output of <Exec> command
+    :param prefix: Currently typed part of argument or None
+    :param limit: Maximal number of lines or None
+    :return: Output with matching lines
+    """
+    if prefix is None and not limit:
+        return output
+
+    lines = [
+        line
+        for line in output.split('\n')
+        if prefix is None or line.startswith(prefix)
+    ]
+    return '\n'.join(lines[:limit] if limit else lines)
+
+
+def expand_node(overlay, argument, arguments, run_commands, prefix=None,
+                limit=None, trace=NO_TRACE):
+    """ Expand markers of node selected for output
+
+    :param overlay: Overlay of node selected for output, with candidates
+        of markers already expanded by find_child
+    :param argument: Argument not matching any key of node
+    :param arguments: Arguments already typed for command
+    :param run_commands: Function which runs list of <Exec> commands
+    :param prefix: Only candidates starting with prefix are returned
+    :param limit: Maximal number of returned candidates
+    :param trace: Trace recording time of <File> expansion
+    :return: Dict with matching arguments or output of <Exec> command
     """
-    autocomplete_dict = get_autocomplete_file_for_command(command_name)
-    root = list(autocomplete_dict)[0]
+    node = overlay.node
+    exec_markers = []
+    for marker in node.markers:
+        if marker in overlay.expanded:
+            continue
+
+        if marker.name == 'File':
+            started = time.time()
+            overlay.expanded[marker] = get_file_candidates(marker, argument)
+            trace.add('file', started, argument)
+        elif marker.name == 'Exec':
+            exec_markers.append(marker)
+
+    overlay.expanded.update(
+        expand_exec_markers(
+            exec_markers, arguments, run_commands, prefix, limit
+        )
+    )
 
+    keys = node.keys if prefix is None else filter_keys(
+        node.sorted_keys, prefix
+    )
+    options = dict((key, node.children[key]) for key in keys)
+    for marker in node.markers:
+        candidates = overlay.expanded.get(marker, [])
+        if not isinstance(candidates, list):
+            return filter_output(candidates, prefix, limit)
+
+        options.update({
+            candidate: marker.child
+            for candidate in candidates
+            if prefix is None or candidate.startswith(prefix)
+        })
+
+    if limit:
+        options = dict(
+            (candidate, options[candidate])
+            for candidate in sorted(options)[:limit]
+        )
+    return options
+
+
+def walk_tree(root, all_arguments, run_commands, prefix=None, limit=None,
+              trace=NO_TRACE):
+    """ Walk completions tree along typed arguments and expand last node
+
+    :param root: Root node of completions tree
+    :param all_arguments: Arguments already typed for command
+    :param run_commands: Function which runs list of <Exec> commands
+    :param prefix: Currently typed part of argument
+    :param limit: Maximal number of returned arguments
+    :param trace: Trace recording time of marker expansions
+    :return: Dict with matching arguments or output of <Exec> command
+    """
     number_of_arguments = int(all_arguments[1])
     rest_arguments = all_arguments[2:]
 
     if number_of_arguments == 0:
-        return root
-
-    for i, argument in enumerate(rest_arguments):
-        try:
-            root = root[argument]
-        except KeyError:
-            try:
-                root = root[argument + ' ']
-            except KeyError:
-                return root
-
-        if not isinstance(root, dict):
-            break
-
-        current_keys = list(root.keys())
-        next_argument = rest_arguments[i + 1] \
-            if i + 1 < len(rest_arguments) else None
-
-        for key in current_keys:
-
-            old_key = key
-            key = replace_tree_marks(key, rest_arguments)
-
-            if key.startswith('<File'):
-                recursive = True if 'rec' in key else False
-
-                already_typed = next_argument \
-                    if next_argument and recursive else argument
-                files_matching = get_files_autocomplete(already_typed)
-                rest_of_tree = root.pop(key)
-                root.update({
-                    file_matching: rest_of_tree
-                    for file_matching in files_matching
-                })
-
-            if key.startswith('<Exec'):
-                try:
-                    autocomplete_from_command = subprocess.check_output(
-                        key.replace('<Exec>', ''), shell=True).decode('utf-8')
-                except subprocess.CalledProcessError:
-                    autocomplete_from_command = ''
-                rest_of_tree = root.pop(old_key)
-                if not rest_of_tree:
-                    return autocomplete_from_command
-
-                root.update({
-                    item: rest_of_tree
-                    for item in autocomplete_from_command.split('\n')
-                })
-
-            if key.startswith('<Regex') and next_argument:
-                pattern = re.compile(key.replace('<Regex>', ''))
-                rest_of_tree = root.pop(key)
-
-                if re.search(pattern, next_argument):
-                    root.update({
-                        next_argument: rest_of_tree
-                    })
-
-            if key.startswith('<Run'):
-                end_command = key.replace('<Run>', '')
+        return expand_node(
+            Overlay(root), None, rest_arguments, run_commands, trace=trace
+        )
+
+    last = len(rest_arguments) - 1
+    for index, argument in enumerate(rest_arguments):
+        overlay = Overlay(root)
+        # node of last argument is listed whole when it isn't found
+        exec_prefix = None if index == last and prefix is None else argument
+        found, root_child = find_child(
+            overlay, argument, rest_arguments, run_commands, exec_prefix,
+            trace
+        )
+        if not found:
+            return expand_node(
+                overlay, argument, rest_arguments, run_commands, prefix,
+                limit, trace
+            )
+
+        root = root_child
+        if root is None:
+            return None
+
+        for marker in root.markers:
+            if marker.name == 'Run':
+                end_command = replace_tree_marks(marker.body, rest_arguments)
                 print(r'&>/dev/null |  sufler run \"{end_command}\"'.format(
                     end_command=end_command)
                 )
-                root = {}
+                return {}
 
-    return root
+    return expand_node(
+        Overlay(root), None, rest_arguments, run_commands, prefix, limit,
+        trace
+    )
+
+
+def completion(command_name, all_arguments, documents=None, run_exec=None,
+               prefix=None, limit=None):
+    """ Parse already typed arguments for command and return matching arguments
+
+    Time of loading completions, traversal and every marker expansion
+    is written to trace file when SUFLER_TRACE is set.
+
+    :param command_name: Command for which we make completion
+    :param all_arguments: Arguments already typed for command
+    :param documents: Already loaded completion documents for command,
+        compiled or loaded from .yml file
+    :param run_exec: Function used to get output of <Exec> commands
+    :param prefix: Currently typed part of argument, all arguments
+        are returned if None
+    :param limit: Maximal number of returned arguments
+    :return: Dict with matching arguments
+    """
+    trace = start_trace(command_name, get_spec_path(command_name))
+    try:
+        if documents is None:
+            started = time.time()
+            documents = get_autocomplete_file_for_command(command_name)
+            trace.add('load', started)
+        if run_exec is None:
+            run_exec = run_exec_autocomplete
+
+        def run_traced_exec(command, *args):
+            started = time.time()
+            try:
+                return run_exec(command, *args)
+            finally:
+                trace.add('exec', started, command)
+
+        deadline = time.time() + COMPLETION_TIMEOUT
+
+        # the same command is run once per completion, output read
+        # for prefix without limit is reused for longer prefixes
+        exec_outputs = {}
+
+        def find_output(command, prefix, limit):
+            for key, output in exec_outputs.items():
+                read_command, read_prefix, read_limit = key
+                if read_command != command:
+                    continue
+                if (read_prefix, read_limit) == (prefix, limit):
+                    return output
+                if read_limit is None and (
+                        read_prefix is None or prefix is not None and
+                        prefix.startswith(read_prefix)):
+                    return output
+            return None
+
+        def run_commands(commands, prefix=None, limit=None):
+            outputs = {}
+            pending = []
+            for command in commands:
+                output = find_output(command[0], prefix, limit)
+                if output is None:
+                    pending.append(command)
+                else:
+                    outputs[command[0]] = output
+            if pending:
+                finished = run_execs(
+                    pending, run_traced_exec, deadline, prefix, limit
+                )
+                for command, output in finished.items():
+                    exec_outputs[(command, prefix, limit)] = output
+                outputs.update(finished)
+            return outputs
+
+        root = list(documents)[0]
+        if isinstance(root, dict):
+            root = compile_tree(root)
+
+        started = time.time()
+        options = walk_tree(
+            root, all_arguments, run_commands, prefix, limit, trace
+        )
+        trace.add('traverse', started)
+        return options
+    finally:
+        trace.write()
@@ -0,0 +1,530 @@
+import logging
+import os
+import struct
+
+from sufler.spec import (Marker, compile_pattern, compile_tree,
+                         get_spec_header, get_spec_path, parse_marker,
+                         parse_spec)
+
+logger = logging.getLogger(__name__)
+
+BUNDLE_MAGIC = b'SUFLERB\0'
+BUNDLE_VERSION = 2
+
+# magic, version and (offset, count) of strings, nodes, entries, markers,
+# roots and commands sections
+HEADER = struct.Struct('<8sI12I')
+# offset and length of utf-8 encoded string
+STRING = struct.Struct('<II')
+# start and count of literal keys, start of sorted literal keys,
+# start and count of index and of markers
+NODE = struct.Struct('<7I')
+# key string and child node, used by literal keys and by index
+ENTRY = struct.Struct('<II')
+# marker key string and child node
+MARKER = struct.Struct('<II')
+ROOT = struct.Struct('<I')
+# name string, start and count of roots, mtime and size of .yml file
+COMMAND = struct.Struct('<3Idq')
+
+NO_NODE = 0xFFFFFFFF
+
+SPEC_MMAP_THRESHOLD = int(
+    os.environ.get('SUFLER_MMAP_THRESHOLD', 1024 * 1024)
+)
+
+
+def get_bundle_path():
+    """ Path to bundle with compiled completions
+
+    :return: Path to bundle file
+    """
+    return os.environ.get('SUFLER_BUNDLE') or os.path.expanduser(
+        '~/.sufler/completions.bundle'
+    )
+
+
+def format_marker(marker):
+    """ Build marker key parsed by parse_marker
+
+    :param marker: Compiled marker
+    :return: Marker key, e.g. '<Exec ttl=300> ls'
+    """
+    options = [
+        name if value is True else '{0}={1}'.format(name, value)
+        for name, value in sorted(marker.options.items())
+    ]
+    return '<{0}>{1}'.format(' '.join([marker.name] + options), marker.body)
+
+
+class BundleWriter(object):
+    """ Pack compiled documents of commands to sections of bundle
+
+    Nodes reachable from more paths are written once, so cycles made
+    by YAML anchors are kept. Equal strings are written once.
+    """
+
+    def __init__(self):
+        self.strings = {}
+        self.blob = bytearray()
+        self.string_records = bytearray()
+        self.node_ids = {}
+        self.node_records = []
+        self.entries = bytearray()
+        self.markers = bytearray()
+        self.roots = bytearray()
+        self.commands = []
+
+    def add_string(self, value):
+        if value not in self.strings:
+            encoded = value.encode('utf-8')
+            self.strings[value] = len(self.strings)
+            self.string_records += STRING.pack(len(self.blob), len(encoded))
+            self.blob += encoded
+        return self.strings[value]
+
+    def add_node(self, node, stack):
+        if node is None:
+            return NO_NODE
+        if id(node) not in self.node_ids:
+            self.node_ids[id(node)] = len(self.node_records)
+            self.node_records.append(None)
+            stack.append(node)
+        return self.node_ids[id(node)]
+
+    def write_node(self, node, stack):
+        keys_start = len(self.entries) // ENTRY.size
+        for key in node.keys:
+            self.entries += ENTRY.pack(
+                self.add_string(key), self.add_node(node.children[key], stack)
+            )
+
+        sorted_start = len(self.entries) // ENTRY.size
+        for key in node.sorted_keys:
+            self.entries += ENTRY.pack(
+                self.add_string(key), self.add_node(node.children[key], stack)
+            )
+
+        # index is sorted by utf-8 bytes, which is order of code points
+        index_start = len(self.entries) // ENTRY.size
+        for key in sorted(node.children):
+            self.entries += ENTRY.pack(
+                self.add_string(key), self.add_node(node.children[key], stack)
+            )
+
+        markers_start = len(self.markers) // MARKER.size
+        for marker in node.markers:
+            self.markers += MARKER.pack(
+                self.add_string(format_marker(marker)),
+                self.add_node(marker.child, stack),
+            )
+
+        self.node_records[self.node_ids[id(node)]] = NODE.pack(
+            keys_start, len(node.keys), sorted_start,
+            index_start, len(node.children),
+            markers_start, len(node.markers),
+        )
+
+    def add_command(self, command, header, documents):
+        roots_start = len(self.roots) // ROOT.size
+        stack = []
+        for document in documents:
+            self.roots += ROOT.pack(self.add_node(document, stack))
+        while stack:
+            self.write_node(stack.pop(), stack)
+
+        self.commands.append((
+            command, roots_start, len(documents),
+            header['mtime'], header['size'],
+        ))
+
+    def pack(self):
+        commands = bytearray()
+        for command in sorted(self.commands):
+            commands += COMMAND.pack(self.add_string(command[0]), *command[1:])
+
+        sections = [
+            (self.string_records, len(self.strings)),
+            (b''.join(self.node_records), len(self.node_records)),
+            (self.entries, len(self.entries) // ENTRY.size),
+            (self.markers, len(self.markers) // MARKER.size),
+            (self.roots, len(self.roots) // ROOT.size),
+            (commands, len(self.commands)),
+        ]
+
+        offset = HEADER.size
+        descriptors = []
+        for data, count in sections:
+            descriptors.extend((offset, count))
+            offset += len(data)
+
+        blob_offset = offset
+        string_records = bytearray()
+        for i in range(len(self.strings)):
+            string_offset, length = STRING.unpack_from(
+                self.string_records, i * STRING.size
+            )
+            string_records += STRING.pack(blob_offset + string_offset, length)
+        sections[0] = (string_records, len(self.strings))
+
+        return b''.join(
+            [HEADER.pack(BUNDLE_MAGIC, BUNDLE_VERSION, *descriptors)] +
+            [bytes(data) for data, _ in sections] +
+            [bytes(self.blob)]
+        )
+
+
+def write_bundle(bundle_path, specs):
+    """ Write compiled completions of commands to bundle file
+
+    :param bundle_path: Path where bundle will be written
+    :param specs: List of tuples with command, header of .yml file
+        and list of compiled documents
+    :return: None
+    """
+    writer = BundleWriter()
+    for command, header, documents in specs:
+        writer.add_command(command, header, documents)
+
+    logger.debug("Write bundle " + bundle_path)
+    tmp_path = '{0}.{1}.tmp'.format(bundle_path, os.getpid())
+    with open(tmp_path, 'wb') as f:
+        f.write(writer.pack())
+    os.rename(tmp_path, bundle_path)
+
+
+class Bundle(object):
+    """ Read-only view of bundle file
+
+    Nothing is decoded when bundle is opened, nodes are decoded
+    from buffer only when they are visited.
+    """
+
+    def __init__(self, buffer):
+        values = HEADER.unpack_from(buffer, 0)
+        if values[0] != BUNDLE_MAGIC or values[1] != BUNDLE_VERSION:
+            raise ValueError("Unsupported bundle version")
+
+        self.buffer = buffer
+        (self.strings_offset, _, self.nodes_offset, _,
+         self.entries_offset, _, self.markers_offset, _,
+         self.roots_offset, _, self.commands_offset,
+         self.commands_count) = values[2:]
+
+    def string_bytes(self, string_id):
+        offset, length = STRING.unpack_from(
+            self.buffer, self.strings_offset + string_id * STRING.size
+        )
+        return self.buffer[offset:offset + length]
+
+    def string(self, string_id):
+        return self.string_bytes(string_id).decode('utf-8')
+
+    def node(self, node_id):
+        return None if node_id == NO_NODE else BundleNode(self, node_id)
+
+    def find_command(self, command):
+        """ Find record of command with binary search
+
+        :param command: Name of command
+        :return: Tuple from COMMAND record or None if command is missing
+        """
+        encoded = command.encode('utf-8')
+        low, high = 0, self.commands_count
+        while low < high:
+            middle = (low + high) // 2
+            record = COMMAND.unpack_from(
+                self.buffer, self.commands_offset + middle * COMMAND.size
+            )
+            name = self.string_bytes(record[0])
+            if name == encoded:
+                return record
+            if name < encoded:
+                low = middle + 1
+            else:
+                high = middle
+        return None
+
+    def get_header(self, command):
+        """ Header of .yml file from which command was compiled
+
+        :param command: Name of command
+        :return: Dict with mtime and size or None if command is missing
+        """
+        record = self.find_command(command)
+        if record is None:
+            return None
+        return {'mtime': record[3], 'size': record[4]}
+
+    def get_documents(self, command):
+        """ Root nodes of command documents
+
+        :param command: Name of command
+        :return: List of root nodes or None if command is missing
+        """
+        record = self.find_command(command)
+        if record is None:
+            return None
+        return [
+            self.node(ROOT.unpack_from(
+                self.buffer, self.roots_offset + i * ROOT.size
+            )[0])
+            for i in range(record[1], record[1] + record[2])
+        ]
+
+
+class BundleChildren(object):
+    """ Lookup of children of bundle node by key
+
+    Keys are found with binary search in sorted index of node,
+    which contains also keys without trailing whitespace.
+    """
+    __slots__ = ('bundle', 'start', 'count')
+
+    def __init__(self, bundle, start, count):
+        self.bundle = bundle
+        self.start = start
+        self.count = count
+
+    def find(self, key):
+        bundle = self.bundle
+        encoded = key.encode('utf-8')
+        low, high = self.start, self.start + self.count
+        while low < high:
+            middle = (low + high) // 2
+            string_id, child = ENTRY.unpack_from(
+                bundle.buffer, bundle.entries_offset + middle * ENTRY.size
+            )
+            candidate = bundle.string_bytes(string_id)
+            if candidate == encoded:
+                return child
+            if candidate < encoded:
+                low = middle + 1
+            else:
+                high = middle
+        return None
+
+    def __contains__(self, key):
+        return key is not None and self.find(key) is not None
+
+    def __getitem__(self, key):
+        child = self.find(key) if key is not None else None
+        if child is None:
+            raise KeyError(key)
+        return self.bundle.node(child)
+
+    def __len__(self):
+        return self.count
+
+
+class BundleKeys(object):
+    """ Sequence of keys of bundle node decoded on access
+
+    Sorted keys can be searched with bisect, so only keys around
+    typed prefix are decoded.
+    """
+    __slots__ = ('bundle', 'start', 'count')
+
+    def __init__(self, bundle, start, count):
+        self.bundle = bundle
+        self.start = start
+        self.count = count
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return tuple(self[i] for i in range(*index.indices(self.count)))
+        if index < 0:
+            index += self.count
+        if not 0 <= index < self.count:
+            raise IndexError(index)
+
+        bundle = self.bundle
+        string_id, _ = ENTRY.unpack_from(
+            bundle.buffer,
+            bundle.entries_offset + (self.start + index) * ENTRY.size,
+        )
+        return bundle.string(string_id)
+
+
+class BundleNode(object):
+    """ Read-only node of completions tree decoded from bundle
+
+    Has the same interface as spec.Node. Keys are decoded when they
+    are read, markers once per node object and children when they
+    are selected, so memory doesn't grow with size of bundle.
+    """
+    __slots__ = ('bundle', 'id', 'record', 'decoded_markers')
+
+    def __init__(self, bundle, node_id):
+        self.bundle = bundle
+        self.id = node_id
+        self.record = NODE.unpack_from(
+            bundle.buffer, bundle.nodes_offset + node_id * NODE.size
+        )
+        self.decoded_markers = None
+
+    @property
+    def children(self):
+        return BundleChildren(self.bundle, self.record[3], self.record[4])
+
+    @property
+    def keys(self):
+        return BundleKeys(self.bundle, self.record[0], self.record[1])
+
+    @property
+    def sorted_keys(self):
+        return BundleKeys(self.bundle, self.record[2], self.record[1])
+
+    @property
+    def markers(self):
+        if self.decoded_markers is None:
+            bundle = self.bundle
+            start, count = self.record[5], self.record[6]
+            markers = []
+            for i in range(start, start + count):
+                string_id, child = MARKER.unpack_from(
+                    bundle.buffer, bundle.markers_offset + i * MARKER.size
+                )
+                name, options, body = parse_marker(bundle.string(string_id))
+                pattern = compile_pattern(body, {}) \
+                    if name == 'Regex' else None
+                markers.append(
+                    Marker(name, options, body, bundle.node(child), pattern)
+                )
+            self.decoded_markers = tuple(markers)
+        return self.decoded_markers
+
+
+def open_bundle(bundle_path=None):
+    """ Map bundle file to memory
+
+    :param bundle_path: Path to bundle, get_bundle_path() if None
+    :return: Bundle or None if file is missing or has other version
+    """
+    import mmap
+
+    bundle_path = bundle_path or get_bundle_path()
+    try:
+        with open(bundle_path, 'rb') as f:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return Bundle(buffer)
+    except (IOError, OSError, ValueError, struct.error):
+        return None
+
+
+def load_bundle_spec(command, bundle_path=None):
+    """ Load completions for command from bundle
+
+    Bundle is used when .yml file of command is missing or was not
+    changed since bundle was compiled.
+
+    :param command: The command for which read completions
+    :param bundle_path: Path to bundle, get_bundle_path() if None
+    :return: List of root nodes or None if bundle has no current
+        completions for command
+    """
+    bundle = open_bundle(bundle_path)
+    if bundle is None:
+        return None
+
+    header = bundle.get_header(command)
+    if header is None:
+        return None
+
+    try:
+        stat = os.stat(get_spec_path(command))
+    except OSError:
+        return bundle.get_documents(command)
+
+    if header != {'mtime': stat.st_mtime, 'size': stat.st_size}:
+        logger.debug("Bundle is outdated for " + command)
+        return None
+    return bundle.get_documents(command)
+
+
+def get_mapped_spec_path(command):
+    """ Path to memory mapped completions cache for command
+
+    :param command: The command for which completions are defined
+    :return: Path to cache file
+    """
+    return os.path.expanduser(
+        '~/.sufler/cache/specs/{0}.bundle'.format(command)
+    )
+
+
+def is_spec_large(command):
+    """ Check if .yml file is large enough to be read from mapped cache
+
+    Large trees are not loaded to memory, they are walked
+    in memory mapped cache instead.
+
+    :param command: The command for which completions are defined
+    :return: True if size of .yml file reaches SUFLER_MMAP_THRESHOLD
+    """
+    try:
+        return os.path.getsize(get_spec_path(command)) >= SPEC_MMAP_THRESHOLD
+    except OSError:
+        return False
+
+
+def read_mapped_spec(command, header):
+    """ Open mapped cache if it was built from same .yml file
+
+    :param command: The command for which completions are defined
+    :param header: Header of current .yml file
+    :return: Bundle or None if cache is missing or outdated
+    """
+    bundle = open_bundle(get_mapped_spec_path(command))
+    if bundle is None or bundle.get_header(command) != {
+            'mtime': header['mtime'], 'size': header['size']}:
+        return None
+    return bundle
+
+
+def is_mapped_spec_fresh(command):
+    """ Check if mapped cache was built from current .yml file
+
+    :param command: The command for which completions are defined
+    :return: True if cache is up to date
+    """
+    try:
+        header = get_spec_header(get_spec_path(command))
+    except OSError:
+        return False
+    return read_mapped_spec(command, header) is not None
+
+
+def load_mapped_spec(command):
+    """ Load completions for command from memory mapped cache,
+    compile them when .yml file changed
+
+    :param command: The command for which read completions
+    :return: List of root nodes
+    """
+    source_path = get_spec_path(command)
+    header = get_spec_header(source_path)
+
+    bundle = read_mapped_spec(command, header)
+    if bundle is not None:
+        return bundle.get_documents(command)
+
+    documents = [
+        compile_tree(document) for document in parse_spec(source_path)
+    ]
+    cache_path = get_mapped_spec_path(command)
+    try:
+        cache_dir = os.path.dirname(cache_path)
+        if not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+        write_bundle(cache_path, [(command, header, documents)])
+    except (IOError, OSError):
+        logger.debug("Can't write spec cache " + cache_path)
+        return documents
+
+    # compiled tree isn't kept, e.g. by daemon, when cache is written
+    bundle = read_mapped_spec(command, header)
+    return documents if bundle is None else bundle.get_documents(command)
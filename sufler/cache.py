@@ -0,0 +1,356 @@
+import logging
+import os
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+EXEC_CACHE_TTL = int(os.environ.get('SUFLER_CACHE_TTL', 60))
+EXEC_CACHE_SIZE = int(os.environ.get('SUFLER_CACHE_SIZE', 10 * 1024 * 1024))
+EXEC_REFRESH_TIMEOUT = int(os.environ.get('SUFLER_REFRESH_TIMEOUT', 60))
+EXEC_LOCK_POLL_INTERVAL = 0.02
+
+# output of commands like 'npm ls' or 'pip freeze' depends on these
+EXEC_CACHE_ENVIRONMENT = ('PATH', 'VIRTUAL_ENV', 'CONDA_PREFIX')
+
+
+def get_exec_cache_path():
+    """ Directory with cached output of <Exec> commands
+
+    :return: Path to directory
+    """
+    return os.path.expanduser('~/.sufler/cache/exec')
+
+
+def get_exec_environment(env=None):
+    """ Values of environment variables output of command depends on
+
+    :param env: Environment of command, current one if None
+    :return: Tuple with values of EXEC_CACHE_ENVIRONMENT variables
+    """
+    env = os.environ if env is None else env
+    return tuple(env.get(name, '') for name in EXEC_CACHE_ENVIRONMENT)
+
+
+def get_exec_cache_file(command, env=None, cwd=None):
+    """ Path to cache entry for command
+
+    Entries differ for environments, so e.g. packages of one virtualenv
+    are not served in other one. Output of <Exec cwd> markers differs
+    also for working directories.
+
+    :param command: Shell command from <Exec> marker
+    :param env: Environment of command, current one if None
+    :param cwd: Working directory output depends on, None if output
+        is the same in every directory
+    :return: Path to cache entry
+    """
+    # cache is used only by <Exec>, so its imports are deferred
+    import hashlib
+
+    key = '\0'.join((command, cwd or '') + get_exec_environment(env))
+    return '{0}/{1}.json'.format(
+        get_exec_cache_path(), hashlib.sha1(key.encode('utf-8')).hexdigest()
+    )
+
+
+def get_ttl(ttl):
+    """ Convert ttl option of <Exec> marker to seconds
+
+    :param ttl: Value of ttl option or None
+    :return: Number of seconds output of command is valid
+    """
+    if ttl is None:
+        return EXEC_CACHE_TTL
+    try:
+        return int(ttl)
+    except ValueError:
+        logger.debug("Wrong ttl value " + str(ttl))
+        return EXEC_CACHE_TTL
+
+
+def get_swr(swr):
+    """ Convert swr option of <Exec> marker to seconds
+
+    :param swr: Value of swr option or None
+    :return: Number of seconds expired output of command can be served
+        while it is refreshed
+    """
+    if swr is None:
+        return 0
+    try:
+        return max(int(swr), 0)
+    except ValueError:
+        logger.debug("Wrong swr value " + str(swr))
+        return 0
+
+
+def read_exec_cache_entry(command, max_age, env=None, cwd=None):
+    """ Read output of command if cached not earlier than max_age seconds ago
+
+    :param command: Shell command from <Exec> marker
+    :param max_age: Maximal age of cached output in seconds
+    :param env: Environment of command, current one if None
+    :param cwd: Working directory output depends on or None
+    :return: Cached output or None
+    """
+    import json
+
+    cache_file = get_exec_cache_file(command, env, cwd)
+    try:
+        with open(cache_file, 'r') as f:
+            entry = json.load(f)
+    except (IOError, OSError, ValueError):
+        return None
+
+    if entry.get('command') != command or \
+            entry['created'] + max_age < time.time():
+        return None
+
+    try:
+        # modification time is used as last access for eviction
+        os.utime(cache_file, None)
+    except OSError:
+        pass
+    return entry['output']
+
+
+def read_exec_cache(command, ttl=None, env=None, cwd=None):
+    """ Read output of command if cached not earlier than ttl seconds ago
+
+    :param command: Shell command from <Exec> marker
+    :param ttl: Time to live of cached output in seconds
+    :param env: Environment of command, current one if None
+    :param cwd: Working directory output depends on or None
+    :return: Cached output or None
+    """
+    ttl = get_ttl(ttl)
+    if ttl <= 0:
+        return None
+    return read_exec_cache_entry(command, ttl, env, cwd)
+
+
+def read_stale_exec_cache(command, ttl=None, swr=None, env=None, cwd=None):
+    """ Read expired output of command which can be served while refreshed
+
+    :param command: Shell command from <Exec> marker
+    :param ttl: Time to live of cached output in seconds
+    :param swr: Seconds after ttl for which expired output is served
+    :param env: Environment of command, current one if None
+    :param cwd: Working directory output depends on or None
+    :return: Cached output or None if it is older than ttl + swr
+    """
+    ttl = get_ttl(ttl)
+    swr = get_swr(swr)
+    if ttl <= 0 or swr <= 0:
+        return None
+    return read_exec_cache_entry(command, ttl + swr, env, cwd)
+
+
+def start_exec_refresh(command, env=None, cwd=None):
+    """ Mark that output of command is refreshed in background
+
+    Marker older than EXEC_REFRESH_TIMEOUT is left by refresh
+    which was killed, so it is taken over.
+
+    :param command: Shell command from <Exec> marker
+    :param env: Environment of command, current one if None
+    :param cwd: Working directory output depends on or None
+    :return: True if no other refresh of command is running
+    """
+    refresh_file = get_exec_cache_file(command, env, cwd) + '.refresh'
+    try:
+        if time.time() - os.stat(refresh_file).st_mtime < EXEC_REFRESH_TIMEOUT:
+            return False
+        os.remove(refresh_file)
+    except OSError:
+        pass
+
+    try:
+        os.close(os.open(refresh_file, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+    except OSError:
+        return False
+    return True
+
+
+def finish_exec_refresh(command, env=None, cwd=None):
+    """ Remove marker of background refresh of command
+
+    :param command: Shell command from <Exec> marker
+    :param env: Environment of command, current one if None
+    :param cwd: Working directory output depends on or None
+    :return: None
+    """
+    try:
+        os.remove(get_exec_cache_file(command, env, cwd) + '.refresh')
+    except OSError:
+        pass
+
+
+@contextmanager
+def exec_command_lock(command, timeout=None, env=None, cwd=None):
+    """ Lock command, so concurrent sufler processes run it only once
+
+    Lock is flock of lock file next to cache entry, it is released
+    also when process holding it is killed. Commands are not locked
+    when platform has no flock.
+
+    :param command: Shell command from <Exec> marker
+    :param timeout: Seconds to wait for lock, no limit if None
+    :param env: Environment of command, current one if None
+    :param cwd: Working directory output depends on or None
+    :return: Context manager which gives None if lock was not acquired
+        before timeout, otherwise flag if other process held lock,
+        so its output may be already cached
+    """
+    try:
+        import fcntl
+    except ImportError:
+        yield False
+        return
+
+    try:
+        # directory may be created by concurrent process meanwhile
+        os.makedirs(get_exec_cache_path(), exist_ok=True)
+        lock_file = open(
+            get_exec_cache_file(command, env, cwd) + '.lock', 'a'
+        )
+    except (IOError, OSError):
+        logger.debug("Can't open lock file of " + command)
+        yield False
+        return
+
+    try:
+        deadline = None if timeout is None else time.time() + timeout
+        waited = False
+        while True:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                break
+            except (IOError, OSError):
+                if deadline is not None and time.time() >= deadline:
+                    logger.info("Timeout of waiting for " + command)
+                    yield None
+                    return
+                waited = True
+                time.sleep(EXEC_LOCK_POLL_INTERVAL)
+        yield waited
+    finally:
+        lock_file.close()
+
+
+def write_exec_cache(command, output, env=None, cwd=None):
+    """ Write output of command to cache and evict old entries
+
+    :param command: Shell command from <Exec> marker
+    :param output: Output of command
+    :param env: Environment of command, current one if None
+    :param cwd: Working directory output depends on or None
+    :return: None
+    """
+    import json
+
+    cache_path = get_exec_cache_path()
+    cache_file = get_exec_cache_file(command, env, cwd)
+    tmp_file = '{0}.{1}.tmp'.format(cache_file, os.getpid())
+    try:
+        if not os.path.exists(cache_path):
+            os.makedirs(cache_path)
+
+        with open(tmp_file, 'w') as f:
+            json.dump({
+                'command': command,
+                'created': time.time(),
+                'output': output,
+            }, f)
+        os.rename(tmp_file, cache_file)
+    except (IOError, OSError):
+        logger.debug("Can't write exec cache " + cache_file)
+        return
+
+    evict_exec_cache(EXEC_CACHE_SIZE)
+
+
+def remove_exec_lock(lock_file):
+    """ Remove lock file of command unless other process holds it
+
+    :param lock_file: Path to lock file
+    :return: None
+    """
+    try:
+        import fcntl
+    except ImportError:
+        return
+
+    try:
+        with open(lock_file, 'a') as f:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            os.remove(lock_file)
+    except (IOError, OSError):
+        pass
+
+
+def evict_exec_cache(max_size):
+    """ Remove least recently used entries until cache fits in max_size
+
+    Lock files are removed with their entries. Lock files of commands
+    which never cached output are removed after EXEC_REFRESH_TIMEOUT.
+
+    :param max_size: Maximal size of cache directory in bytes
+    :return: None
+    """
+    cache_path = get_exec_cache_path()
+    entries = []
+    locks = []
+    for file in os.listdir(cache_path):
+        if file.endswith('.lock'):
+            locks.append(file)
+        # refresh markers of commands are empty
+        if not file.endswith('.json'):
+            continue
+        try:
+            stat = os.stat('{0}/{1}'.format(cache_path, file))
+        except OSError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, file))
+
+    evicted = set()
+    size = sum(entry[1] for entry in entries)
+    for _, file_size, file in sorted(entries):
+        if size <= max_size:
+            break
+        logger.debug("Evict exec cache " + file)
+        try:
+            os.remove('{0}/{1}'.format(cache_path, file))
+        except OSError:
+            pass
+        evicted.add(file)
+        size -= file_size
+
+    cached = set(entry[2] for entry in entries) - evicted
+    now = time.time()
+    for lock in locks:
+        entry = lock[:-len('.lock')]
+        if entry in cached:
+            continue
+        lock_file = '{0}/{1}'.format(cache_path, lock)
+        if entry not in evicted:
+            # command may be just running for the first time
+            try:
+                if now - os.stat(lock_file).st_mtime < EXEC_REFRESH_TIMEOUT:
+                    continue
+            except OSError:
+                continue
+        remove_exec_lock(lock_file)
+
+
+def clear_exec_cache():
+    """ Remove all cached output of <Exec> commands
+
+    :return: None
+    """
+    import shutil
+
+    cache_path = get_exec_cache_path()
+    if os.path.exists(cache_path):
+        shutil.rmtree(cache_path)
@@ -1,16 +1,30 @@
+import json
 import logging
 import os
-import shutil
 import subprocess
 import sys
-import zipfile
+import time
 
 import click
 import click_log
-import requests
 import yaml
 from six.moves import input
-from sufler.base import SUFLER_BASE_PATH
+from sufler import version
+from sufler.base import SUFLER_BASE_PATH, get_autocomplete_file_for_command
+from sufler.bundle import (get_bundle_path, is_mapped_spec_fresh,
+                           is_spec_large, load_mapped_spec, write_bundle)
+from sufler.cache import clear_exec_cache
+from sufler.client import get_socket_path
+from sufler.codegen import generate_bash, generate_fish, remove_bash_function
+from sufler.daemon import serve
+from sufler.download import download_archives, extract_completions
+from sufler.manifest import (artifacts_unchanged, hash_content, hash_file,
+                             read_manifest, write_manifest)
+from sufler.spec import (get_spec_header, get_spec_path, is_spec_cache_fresh,
+                         load_spec)
+from sufler.trace import (PERCENTILES, aggregate_traces, get_trace_path,
+                          read_traces)
+from sufler.warm import collect_exec_commands, warm_exec_cache
 
 logger = logging.getLogger(__name__)
 click_log.basic_config(logger)
@@ -76,14 +90,31 @@ class BaseShell(object):
         """
         pass
 
-    def install(self, commands):
+    def install_static_commands(self, commands):
+        """ Add completions generated from .yml files to completer for shell
+
+        :param commands: List of commands found in completions directory
+        :return: None
+        """
+        pass
+
+    def install(self, commands, static=False):
         """ Install completion file for shell
 
         :param commands: List of commands found in completions directory
+        :param static: Generate shell code instead of calling python
         :return: None
         """
         pass
 
+    def get_artifact_paths(self, commands):
+        """ Files written by install for commands
+
+        :param commands: List of installed commands
+        :return: List of paths
+        """
+        return [self.install_file_path]
+
     def get_install_path(self):
         """ Check that install directory from PATH_FOR_SHELL exists and return him
 
@@ -158,10 +189,25 @@ class BashZshInstallCommandsMixin:
         logger.debug("Install commands for " + self.shell_name)
         logger.debug("Read completer content")
         with open(self.install_file_path, 'r') as f:
-            completer_content = f.read()
+            installed_content = f.read()
+
+        # function from static install would shadow python completer
+        completer_content = installed_content
+        for command in commands:
+            completer_content = remove_bash_function(
+                completer_content, command
+            )
+
+        not_installed_commands = commands_not_installed(
+            commands, completer_content
+        )
+        if not not_installed_commands and \
+                completer_content == installed_content:
+            logger.debug("All commands installed")
+            return
 
         logger.debug("Append commands")
-        for command in commands_not_installed(commands, completer_content):
+        for command in not_installed_commands:
             completer_content += COMMAND_FOR_SHELL[
                 self.shell_name
             ].format(command)
@@ -170,6 +216,26 @@ class BashZshInstallCommandsMixin:
         with open(self.install_file_path, 'w') as f:
             f.write(completer_content)
 
+    def install_static_commands(self, commands):
+        logger.debug("Install static commands for " + self.shell_name)
+        with open(self.install_file_path, 'r') as f:
+            completer_content = f.read()
+
+        for command in commands:
+            root = get_command_tree(command)
+            if root is None:
+                continue
+
+            logger.debug("Generate completion for " + command)
+            completer_content = remove_bash_function(
+                completer_content, command
+            )
+            completer_content += '\n' + generate_bash(command, root)
+
+        logger.debug("Write completer " + self.install_file_path)
+        with open(self.install_file_path, 'w') as f:
+            f.write(completer_content)
+
 
 class Bash(BashZshInstallCommandsMixin, BaseShell):
     shell_name = 'bash'
@@ -207,11 +273,14 @@ class Bash(BashZshInstallCommandsMixin, BaseShell):
 
         logger.debug("Install bash end")
 
-    def install(self, commands):
+    def install(self, commands, static=False):
         if not os.path.exists(self.install_file_path):
             self.initialize()
 
-        self.install_commands(commands)
+        if static:
+            self.install_static_commands(commands)
+        else:
+            self.install_commands(commands)
 
 
 class Zsh(BashZshInstallCommandsMixin, BaseShell):
@@ -267,18 +336,52 @@ class Zsh(BashZshInstallCommandsMixin, BaseShell):
 
         logger.debug("Zsh install end")
 
-    def install(self, commands):
+    def install(self, commands, static=False):
         if not os.path.exists(self.install_file_path):
             self.initialize()
 
-        self.install_commands(commands)
+        if static:
+            self.install_static_commands(commands)
+        else:
+            self.install_commands(commands)
 
 
 class Fish(BaseShell):
     shell_name = 'fish'
 
-    def install(self, commands):
+    def get_artifact_paths(self, commands):
+        return [
+            '{0}{1}.fish'.format(self.install_path, command)
+            for command in commands
+        ]
+
+    def install_static_commands(self, commands):
+        logger.debug("Install static commands for fish")
+        dynamic_command = '{0} "{1}/backends/fish/fish.py" ' \
+                          '(commandline -cp)'.format(sys.executable,
+                                                     SUFLER_BASE_PATH)
+
+        for command in commands:
+            root = get_command_tree(command)
+            if root is None:
+                continue
+
+            command_completer_file = '{0}{1}.fish'.format(
+                self.install_path,
+                command
+            )
+
+            logger.debug("Write script file in " + command_completer_file)
+            with open(command_completer_file, 'w') as f:
+                f.write(generate_fish(command, root, dynamic_command))
+
+    def install(self, commands, static=False):
         logger.debug("Install fish")
+        if static:
+            self.install_static_commands(commands)
+            logger.debug("Fish install end")
+            return
+
         current_installed_commands = [
             file
             for file in os.listdir(self.install_path)
@@ -316,11 +419,19 @@ class PowerShell(BaseShell):
             self.install_path
         )
 
-    def install(self, commands):
+    @property
+    def completer_script_path(self):
+        return "{0}/backends/powershell/completer.ps1".format(
+            SUFLER_BASE_PATH
+        )
+
+    def get_artifact_paths(self, commands):
+        return [self.completer_script_path, self.install_file_path]
+
+    def install(self, commands, static=False):
         logger.debug("Install powershell")
 
-        completer_script_path = "{0}/backends/powershell/" \
-                                "completer.ps1".format(SUFLER_BASE_PATH)
+        completer_script_path = self.completer_script_path
 
         if not os.path.exists(self.install_file_path):
             logger.debug("Add completer to powershell startup")
@@ -428,62 +539,112 @@ def get_commands(name):
     ]
 
 
-def get_completions_directory_from_git():
-    """Download zip file from git and extrack to dir"""
-    for urls in CONFIG_DATA['repos']:
-        zip_file_path = '{0}/.sufler/zip_completions.zip'.format(
-            os.path.expanduser('~')
-        )
-        zip_dir_path = '{0}/.sufler/zip_completions/'.format(
-            os.path.expanduser('~')
-        )
-        logger.debug("Download zip file")
-        if urls['url'].endswith('.zip'):
-            result = requests.get(urls['url'])
+def get_command_tree(command):
+    """ Get completions tree of command from its .yml file
 
-            with open(zip_file_path, 'wb') as out_zip_file:
-                out_zip_file.write(result.content)
+    :param command: Command found in completions directory
+    :return: Compiled node of command or None if .yml file doesn't
+        define it
+    """
+    root = load_spec(command)[0]
+    if root is None or command not in root.children:
+        logger.debug("Completions for {0} not found".format(command))
+        return None
+    return root.children[command]
 
-            logger.debug("Save zip file")
 
-            with zipfile.ZipFile(zip_file_path) as zip_file:
-                zip_file.extractall(path=zip_dir_path)
+def install_shell(shell, commands, static, manifest, spec_hashes):
+    """ Install commands for shell, skip work recorded in manifest
 
-            logger.debug("Extract zip file")
+    Shell is installed again when sufler, python or install mode changed
+    or when installed files were modified. Otherwise only new commands,
+    and in static mode also commands with changed .yml file, are
+    installed.
 
-            os.remove(zip_file_path)
+    :param shell: Shell instance
+    :param commands: List of commands found in completions directory
+    :param static: Generate shell code instead of calling python
+    :param manifest: Manifest dict, updated with installed files
+    :param spec_hashes: Dict from command to hash of its .yml file
+    :return: List of installed commands
+    """
+    inputs = hash_content(json.dumps(
+        [shell.shell_name, static, sys.executable, SUFLER_BASE_PATH, version]
+    ))
+    entry = manifest['shells'].get(shell.shell_name)
 
+    installed = {}
+    if entry and entry['inputs'] == inputs and \
+            artifacts_unchanged(entry['artifacts']):
+        installed = entry['commands']
 
-def install_completion_files():
+    changed_commands = [
+        command
+        for command in commands
+        if command not in installed or
+        (static and installed[command] != spec_hashes[command])
+    ]
+    if not changed_commands:
+        logger.debug("{0} is up to date".format(shell.shell_name))
+        return []
+
+    shell.install(changed_commands, static=static)
+
+    installed = dict(installed)
+    installed.update(
+        (command, spec_hashes[command]) for command in changed_commands
+    )
+    manifest['shells'][shell.shell_name] = {
+        'inputs': inputs,
+        'commands': installed,
+        'artifacts': dict(
+            (path, hash_file(path))
+            for path in shell.get_artifact_paths(sorted(installed))
+        ),
+    }
+    return changed_commands
+
+
+def get_repository_urls():
+    """ Urls of completion repositories from sufler config file
+
+    :return: List of urls of zip archives
     """
-    Check difference between sufler completions folder
-    and git completions folder.
-    After check copy only files not in sufler completions folder.
+    config_data = CONFIG_DATA
+    try:
+        with open(os.path.expanduser('~/.sufler/.config'), 'r') as f:
+            config_data = yaml.safe_load(f) or CONFIG_DATA
+    except (IOError, OSError, yaml.YAMLError):
+        logger.debug("Can't read sufler config file, use default repos")
+    return [
+        repo['url'] for repo in config_data.get('repos') or []
+        if repo.get('url', '').endswith('.zip')
+    ]
 
-    :param name: completion fle name
+
+def install_completion_files():
     """
-    get_completions_directory_from_git()
+    Install completion files from git repositories.
 
-    sufler_completions_files = os.listdir(
-        os.path.expanduser('~/.sufler/completions')
-    )
-    zip_completions_path = os.path.expanduser(
-        '~/.sufler/zip_completions/sufler-completions-master/completions'
-    )
-    zip_completions_files = os.listdir(zip_completions_path)
+    Archives are downloaded concurrently, then extracted in order of
+    repositories in config, so when repositories have file with the same
+    name, file from first one is installed. Also archives not changed
+    since last install are read, only files not in sufler completions
+    folder are installed, so deleted files are restored.
 
-    completions_not_installed = set(zip_completions_files).difference(
-        sufler_completions_files
-    )
+    :return: List of installed completion file names
+    """
+    completions_path = os.path.expanduser('~/.sufler/completions')
+    installed = []
+    for url, zip_file_path, zip_changed in download_archives(
+            get_repository_urls()):
+        if zip_file_path is None:
+            logger.debug("No archive of " + url)
+            continue
 
-    logger.debug("Copy files")
-    for file in completions_not_installed:
-        logger.debug("Install completion file " + file)
-        shutil.copyfile(
-            '{0}/{1}'.format(zip_completions_path, file),
-            os.path.expanduser('~/.sufler/completions/' + file)
-        )
-    shutil.rmtree(os.path.expanduser('~/.sufler/zip_completions'))
+        logger.debug("Extract completions from " + url)
+        installed.extend(extract_completions(zip_file_path, completions_path))
+    return installed
 
 
 @cli.command('install')
@@ -492,9 +653,14 @@ def install_completion_files():
     '-n',
     default=None,
     help='install specified completion')
+@click.option(
+    '--static',
+    is_flag=True,
+    default=False,
+    help='generate shell code, python is called only for <Exec> and <Run>')
 @click.pass_context
 @click_log.simple_verbosity_option(logger)
-def install_command(ctx, name):
+def install_command(ctx, name, static):
     """install completions"""
 
     ctx.invoke(init_command)
@@ -505,8 +671,50 @@ def install_command(ctx, name):
 
     commands = get_commands(name)
 
+    manifest = read_manifest()
+    spec_hashes = dict(
+        (command, hash_file(get_spec_path(command))) for command in commands
+    )
+
     for shell in shells:
-        shell.install(commands)
+        install_shell(shell, commands, static, manifest, spec_hashes)
+
+    logger.debug("Compile completions")
+    for command in commands:
+        if is_spec_large(command):
+            is_fresh, load = is_mapped_spec_fresh, load_mapped_spec
+        else:
+            is_fresh, load = is_spec_cache_fresh, load_spec
+        if manifest['specs'].get(command) != spec_hashes[command] or \
+                not is_fresh(command):
+            load(command)
+        manifest['specs'][command] = spec_hashes[command]
+
+    write_manifest(manifest)
+
+
+@cli.command('compile')
+@click.option(
+    '--output',
+    '-o',
+    default=None,
+    help='path of bundle, ~/.sufler/completions.bundle by default')
+@click_log.simple_verbosity_option(logger)
+def compile_command(output):
+    """pack compiled completions to bundle file"""
+    specs = []
+    for command in get_commands(None):
+        logger.debug("Compile completions for " + command)
+        specs.append((
+            command, get_spec_header(get_spec_path(command)),
+            load_spec(command),
+        ))
+
+    bundle_path = output or get_bundle_path()
+    write_bundle(bundle_path, specs)
+    click.echo('Compiled {0} completions to {1}'.format(
+        len(specs), bundle_path
+    ))
 
 
 @cli.command('init')
@@ -541,6 +749,128 @@ def run_command(command):
     subprocess.Popen(command.split(' ')[1:])
 
 
+@cli.command('serve')
+@click.option(
+    '--socket',
+    '-s',
+    'socket_path',
+    default=None,
+    help='unix socket path, default ~/.sufler/sufler.sock')
+@click_log.simple_verbosity_option(logger)
+def serve_command(socket_path):
+    """run completion daemon"""
+    logger.debug("Serve command")
+    serve(socket_path or get_socket_path())
+
+
+def format_warm_results(results):
+    """ Format timings of warmed <Exec> commands as table
+
+    :param results: Result of warm_exec_cache
+    :return: List of lines
+    """
+    lines = ['{0:>10}  {1:<8}{2}'.format('time', 'status', 'command')]
+    for command, seconds, status in sorted(
+            results, key=lambda result: -result[1]):
+        lines.append('{0:>8.1f}ms  {1:<8}{2}'.format(
+            seconds * 1000, status, command
+        ))
+    return lines
+
+
+@cli.command('warm')
+@click.option(
+    '--name',
+    '-n',
+    default=None,
+    help='warm specified completion')
+@click_log.simple_verbosity_option(logger)
+def warm_command(name):
+    """run <Exec> commands of completions to fill cache"""
+    commands = []
+    for command_name in get_commands(name):
+        logger.debug("Collect <Exec> commands of " + command_name)
+        for command in collect_exec_commands(
+                get_autocomplete_file_for_command(command_name)):
+            if command not in commands:
+                commands.append(command)
+
+    if not commands:
+        click.echo('No <Exec> commands to warm')
+        return
+
+    started = time.time()
+    results = warm_exec_cache(commands)
+    lines = format_warm_results(results)
+    lines.append('Warmed {0} of {1} commands in {2:.1f}s'.format(
+        sum(1 for result in results if result[2] == 'ok'), len(results),
+        time.time() - started,
+    ))
+    click.echo('\n'.join(lines))
+
+
+@cli.group('cache')
+def cache_group():
+    """manage cached <Exec> results"""
+
+
+@cache_group.command('clear')
+@click_log.simple_verbosity_option(logger)
+def cache_clear_command():
+    """remove cached <Exec> results"""
+    logger.debug("Clear exec cache")
+    clear_exec_cache()
+
+
+def format_stats(title, stats):
+    """ Format percentiles of completion phases as table
+
+    :param title: Name of grouping, e.g. command or spec
+    :param stats: Result of aggregate_traces
+    :return: List of lines
+    """
+    lines = []
+    for group in sorted(stats, key=str):
+        phases = stats[group]
+        lines.append('{0} {1} ({2} requests)'.format(
+            title, group, phases['total'][0]
+        ))
+        lines.append('    {0:<10}{1}'.format('phase', ''.join(
+            '{0:>10}'.format('p{0}'.format(percent))
+            for percent in PERCENTILES
+        )))
+        names = ['total'] + sorted(name for name in phases if name != 'total')
+        for name in names:
+            lines.append('    {0:<10}{1}'.format(name, ''.join(
+                '{0:>8.1f}ms'.format(value * 1000)
+                for value in phases[name][1:]
+            )))
+    return lines
+
+
+@cli.command('stats')
+@click.option(
+    '--file',
+    '-f',
+    'trace_path',
+    default=None,
+    help='trace file, default ~/.sufler/trace.log')
+@click_log.simple_verbosity_option(logger)
+def stats_command(trace_path):
+    """show timings of completions traced with SUFLER_TRACE=1"""
+    trace_path = trace_path or get_trace_path()
+    logger.debug("Read traces from " + trace_path)
+    if not os.path.exists(trace_path):
+        click.echo('No traces in {0}, set SUFLER_TRACE=1 to record '
+                   'them'.format(trace_path))
+        return
+
+    traces = read_traces(trace_path)
+    lines = format_stats('command', aggregate_traces(traces, 'command'))
+    lines += format_stats('spec', aggregate_traces(traces, 'spec'))
+    click.echo('\n'.join(lines))
+
+
 def main():
     cli()
 
@@ -0,0 +1,91 @@
+import os
+import sys
+
+DAEMON_TIMEOUT = float(os.environ.get('SUFLER_DAEMON_TIMEOUT', 10))
+
+
+def get_socket_path():
+    """ Path to unix socket of completion daemon
+
+    :return: SUFLER_SOCKET environment variable or default socket path
+    """
+    return os.environ.get('SUFLER_SOCKET') or os.path.expanduser(
+        '~/.sufler/sufler.sock'
+    )
+
+
+def request_completion(command_name, all_arguments, prefix=None, limit=None):
+    """ Send completion request to daemon started by `sufler serve`
+
+    :param command_name: Command for which we make completion
+    :param all_arguments: Arguments already typed for command
+    :param prefix: Currently typed part of argument
+    :param limit: Maximal number of returned arguments
+    :return: Response dict or None if daemon is not running
+    """
+    socket_path = get_socket_path()
+    if not os.path.exists(socket_path):
+        return None
+
+    # imported only when daemon is running
+    import json
+    import socket
+
+    request = json.dumps({
+        'command_name': command_name,
+        'all_arguments': all_arguments,
+        'prefix': prefix,
+        'limit': limit,
+        'cwd': os.getcwd(),
+        'env': dict(os.environ),
+    })
+
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    client.settimeout(DAEMON_TIMEOUT)
+    chunks = []
+    try:
+        client.connect(socket_path)
+        client.sendall(request.encode('utf-8') + b'\n')
+        client.shutdown(socket.SHUT_WR)
+        chunk = client.recv(65536)
+        while chunk:
+            chunks.append(chunk)
+            chunk = client.recv(65536)
+    except socket.error:
+        return None
+    finally:
+        client.close()
+
+    try:
+        response = json.loads(b''.join(chunks).decode('utf-8'))
+    except ValueError:
+        return None
+
+    if 'error' in response:
+        return None
+    return response
+
+
+def completion(command_name, all_arguments, prefix=None, limit=None):
+    """ Get completions from daemon, fall back to in-process completion
+
+    :param command_name: Command for which we make completion
+    :param all_arguments: Arguments already typed for command
+    :param prefix: Currently typed part of argument
+    :param limit: Maximal number of returned arguments
+    :return: Dict with matching arguments or output of <Exec> command
+    """
+    response = request_completion(command_name, all_arguments, prefix, limit)
+
+    if response is None:
+        from sufler.base import completion as local_completion
+        return local_completion(
+            command_name, all_arguments, prefix=prefix, limit=limit
+        )
+
+    if response.get('stdout'):
+        sys.stdout.write(response['stdout'])
+
+    if 'output' in response:
+        return response['output']
+    return dict((option, None) for option in response['options'])
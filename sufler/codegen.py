@@ -0,0 +1,384 @@
+import re
+
+from sufler.spec import Node
+
+BASH_REGEX_ESCAPES = {
+    'd': '[0-9]',
+    'D': '[^0-9]',
+    'w': '[[:alnum:]_]',
+    'W': '[^[:alnum:]_]',
+    's': '[[:space:]]',
+    'S': '[^[:space:]]',
+}
+
+BASH_FUNCTION = """# sufler static {command}
+{function_name}()
+{{
+    local IFS=$'\\n'
+    local cur word state sufler_re i
+    COMPREPLY=()
+    cur="${{COMP_WORDS[COMP_CWORD]}}"
+    state=0
+    for (( i=1; i < COMP_CWORD; i++ )); do
+        word="${{COMP_WORDS[i]}}"
+        case "$state" in
+{transitions}
+        *) break ;;
+        esac
+    done
+    case "$state" in
+{outputs}
+    esac
+    return 0
+}}
+complete -F {function_name} -o default {command}
+# sufler static {command} end
+"""
+
+FISH_FUNCTION = """function {function_name}
+    set -l words (commandline -opc)
+    set -l state 0
+    for word in $words[2..-1]
+        switch $state
+{transitions}
+            case '*'
+                break
+        end
+    end
+    switch $state
+{outputs}
+    end
+end
+complete --command {command} --arguments '({function_name})' -f
+"""
+
+
+def get_function_name(prefix, command):
+    """ Name of shell function generated for command
+
+    :param prefix: Prefix of function name
+    :param command: Command for which completion is generated
+    :return: Function name
+    """
+    return prefix + re.sub(r'\W', '_', command)
+
+
+def quote_bash(value):
+    """ Quote string for bash
+
+    :param value: String to quote
+    :return: Single quoted string
+    """
+    return "'" + value.replace("'", "'\\''") + "'"
+
+
+def quote_fish(value):
+    """ Quote string for fish
+
+    :param value: String to quote
+    :return: Single quoted string
+    """
+    return "'" + value.replace('\\', '\\\\').replace("'", "\\'") + "'"
+
+
+def to_extended_regex(pattern):
+    """ Convert python regular expression to POSIX one used by bash =~
+
+    :param pattern: Pattern from <Regex> marker
+    :return: Converted pattern or None if pattern can't be converted
+    """
+    if '(?' in pattern or re.search(r'[*+?}]\?', pattern):
+        return None
+
+    result = []
+    in_brackets = False
+    i = 0
+    while i < len(pattern):
+        char = pattern[i]
+        if char == '\\' and i + 1 < len(pattern):
+            escaped = pattern[i + 1]
+            if in_brackets or escaped.isdigit():
+                return None
+            if escaped in BASH_REGEX_ESCAPES:
+                result.append(BASH_REGEX_ESCAPES[escaped])
+            elif escaped.isalpha():
+                return None
+            else:
+                result.append(char + escaped)
+            i += 2
+            continue
+
+        if char == '[':
+            in_brackets = True
+        elif char == ']':
+            in_brackets = False
+        result.append(char)
+        i += 1
+
+    return ''.join(result)
+
+
+def number_nodes(root):
+    """ Give numbers to nodes of compiled completions tree
+
+    Nodes shared by YAML anchors get one number, so cycles end.
+
+    :param root: Node of command from compiled completions tree
+    :return: Tuple with list of nodes and dict from node id to number
+    """
+    nodes = []
+    numbers = {}
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        if id(node) in numbers:
+            continue
+        numbers[id(node)] = len(nodes)
+        nodes.append(node)
+        if isinstance(node, Node):
+            children = [node.children[key] for key in node.keys]
+            children.extend(marker.child for marker in node.markers)
+            stack.extend(reversed(children))
+    return nodes, numbers
+
+
+def describe_node(node, numbers, convert_regex):
+    """ Describe transitions and candidates of node
+
+    :param node: Node from compiled completions tree
+    :param numbers: Dict from node id to number
+    :param convert_regex: Function converting <Regex> pattern for shell
+    :return: Dict with literal keys, patterns and flags of node
+    """
+    description = {
+        'literals': [],
+        'patterns': [],
+        'files': False,
+        # unmatched argument can still match output of <Exec>
+        'dynamic_walk': False,
+        'dynamic_output': False,
+        'run': False,
+    }
+    if not isinstance(node, Node):
+        return description
+
+    for key in node.keys:
+        description['literals'].append((key, numbers[id(node.children[key])]))
+
+    for marker in node.markers:
+        number = numbers[id(marker.child)]
+        name = marker.name
+        if 'TREE~' in marker.body:
+            name = 'Exec'
+
+        if name == 'Regex':
+            pattern = convert_regex(marker.body)
+            if pattern is None:
+                description['dynamic_walk'] = True
+            else:
+                description['patterns'].append((pattern, number))
+
+        elif name == 'File':
+            description['patterns'].append((None, number))
+            description['files'] = True
+
+        elif name == 'Exec':
+            description['dynamic_output'] = True
+            if marker.child is not None:
+                description['dynamic_walk'] = True
+
+        elif name == 'Run':
+            description['run'] = True
+
+    return description
+
+
+def generate_bash(command, root, dynamic_function='_completer'):
+    """ Generate bash function which completes command without python
+
+    Arguments which can be completed only by running python, because of
+    <Exec> or <Run> marker, are passed to dynamic completer function.
+
+    :param command: Command for which completion is generated
+    :param root: Node of command from compiled completions tree
+    :param dynamic_function: Bash function making completion with python
+    :return: Bash code
+    """
+    nodes, numbers = number_nodes(root)
+    descriptions = [
+        describe_node(node, numbers, to_extended_regex) for node in nodes
+    ]
+    delegate = '{0}; return 0'.format(dynamic_function)
+
+    def go_to(number):
+        if descriptions[number]['run']:
+            return delegate
+        return 'state={0}'.format(number)
+
+    transitions = []
+    outputs = []
+    for number, description in enumerate(descriptions):
+        lines = []
+        for key, child in description['literals']:
+            patterns = [quote_bash(key)]
+            if key.endswith(' '):
+                patterns.append(quote_bash(key[:-1]))
+            lines.append('            {0}) {1} ;;'.format(
+                '|'.join(patterns), go_to(child)
+            ))
+
+        conditions = []
+        for pattern, child in description['patterns']:
+            if pattern is None:
+                condition = '[[ -e "$word" ]]'
+            else:
+                condition = \
+                    'sufler_re={0}; [[ "$word" =~ $sufler_re ]]'.format(
+                        quote_bash(pattern)
+                    )
+            conditions.append((condition, go_to(child)))
+        fallback = delegate if description['dynamic_walk'] else 'break'
+
+        if lines or conditions or description['dynamic_walk']:
+            lines.append('            *)')
+            for i, (condition, action) in enumerate(conditions):
+                lines.append('                {0} {1}; then {2}'.format(
+                    'elif' if i else 'if', condition, action
+                ))
+            if conditions:
+                lines.append('                else {0}'.format(fallback))
+                lines.append('                fi ;;')
+            else:
+                lines.append('                {0} ;;'.format(fallback))
+
+            transitions.append('        {0})\n            case "$word" in\n'
+                               '{1}\n            esac ;;'.format(
+                                   number, '\n'.join(lines)))
+
+        if description['dynamic_output']:
+            outputs.append('    {0}) {1} ;;'.format(number, dynamic_function))
+            continue
+
+        candidates = [key for key, _ in description['literals']]
+        replies = []
+        if candidates:
+            replies.append('$( compgen -W {0} -- "$cur" )'.format(
+                quote_bash('\n'.join(candidates))
+            ))
+        if description['files']:
+            replies.append('$( compgen -f -- "$cur" )')
+        if replies:
+            outputs.append('    {0}) COMPREPLY=( {1} ) ;;'.format(
+                number, ' '.join(replies)
+            ))
+
+    return BASH_FUNCTION.format(
+        command=command,
+        function_name=get_function_name('_sufler_static_', command),
+        transitions='\n'.join(transitions),
+        outputs='\n'.join(outputs),
+    )
+
+
+def generate_fish(command, root, dynamic_command):
+    """ Generate fish function which completes command without python
+
+    Arguments which can be completed only by running python, because of
+    <Exec> or <Run> marker, are passed to dynamic completer command.
+
+    :param command: Command for which completion is generated
+    :param root: Node of command from compiled completions tree
+    :param dynamic_command: Fish command making completion with python
+    :return: Fish code
+    """
+    nodes, numbers = number_nodes(root)
+    descriptions = [
+        describe_node(node, numbers, lambda pattern: pattern)
+        for node in nodes
+    ]
+    delegate = '{0}; return'.format(dynamic_command)
+
+    def go_to(number):
+        if descriptions[number]['run']:
+            return delegate
+        return 'set state {0}'.format(number)
+
+    transitions = []
+    outputs = []
+    for number, description in enumerate(descriptions):
+        conditions = []
+        for key, child in description['literals']:
+            words = [quote_fish(key)]
+            if key.endswith(' '):
+                words.append(quote_fish(key[:-1]))
+            conditions.extend(
+                ('test "$word" = {0}'.format(word), go_to(child))
+                for word in words
+            )
+        for pattern, child in description['patterns']:
+            if pattern is None:
+                condition = 'test -e "$word"'
+            else:
+                condition = 'string match -rq -- {0} "$word"'.format(
+                    quote_fish(pattern)
+                )
+            conditions.append((condition, go_to(child)))
+
+        if conditions or description['dynamic_walk']:
+            lines = ['            case {0}'.format(number)]
+            for i, (condition, action) in enumerate(conditions):
+                lines.append('                {0} {1}'.format(
+                    'else if' if i else 'if', condition
+                ))
+                lines.append('                    {0}'.format(action))
+            fallback = delegate if description['dynamic_walk'] else 'break'
+            if conditions:
+                lines.append('                else')
+                lines.append('                    {0}'.format(fallback))
+                lines.append('                end')
+            else:
+                lines.append('                {0}'.format(fallback))
+            transitions.append('\n'.join(lines))
+
+        if description['dynamic_output']:
+            outputs.append('        case {0}\n            {1}'.format(
+                number, dynamic_command
+            ))
+            continue
+
+        lines = []
+        candidates = [key for key, _ in description['literals']]
+        if candidates:
+            lines.append('            printf \'%s\\n\' {0}'.format(
+                ' '.join(quote_fish(candidate) for candidate in candidates)
+            ))
+        if description['files']:
+            lines.append('            __fish_complete_path (commandline -ct)')
+        if lines:
+            outputs.append('        case {0}\n{1}'.format(
+                number, '\n'.join(lines)
+            ))
+
+    return FISH_FUNCTION.format(
+        command=command,
+        function_name=get_function_name('__sufler_static_', command),
+        transitions='\n'.join(transitions),
+        outputs='\n'.join(outputs),
+    )
+
+
+def remove_bash_function(completer_content, command):
+    """ Remove function generated by generate_bash from completer
+
+    :param completer_content: Content of completer file
+    :param command: Command for which completion was generated
+    :return: Completer content without function
+    """
+    return re.sub(
+        r'\n?# sufler static {0}\n.*?# sufler static {0} end\n'.format(
+            re.escape(command)
+        ),
+        '',
+        completer_content,
+        flags=re.DOTALL,
+    )
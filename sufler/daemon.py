@@ -0,0 +1,187 @@
+import json
+import logging
+import os
+import sys
+import time
+
+from six import StringIO
+from six.moves import socketserver
+from sufler.base import (PartialOutput, completion,
+                         get_autocomplete_file_for_command,
+                         get_exec_autocomplete)
+from sufler.bundle import get_bundle_path
+from sufler.cache import get_exec_environment, get_ttl
+from sufler.spec import get_spec_path
+
+logger = logging.getLogger(__name__)
+
+DAEMON_EXEC_TTL = 30
+DAEMON_EXEC_RESULTS_LIMIT = 1024
+
+
+def get_file_version(path):
+    """ Modification time and size which identify version of file
+
+    :param path: Path to file
+    :return: Tuple with mtime and size or None if file is missing
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime, stat.st_size
+
+
+class CompletionRequestHandler(socketserver.StreamRequestHandler):
+    """ Handle single completion request sent as JSON line
+
+    """
+
+    def handle(self):
+        try:
+            request = json.loads(self.rfile.readline().decode('utf-8'))
+            response = self.server.complete(request)
+        except Exception as e:
+            logger.exception("Completion request failed")
+            response = {'error': str(e)}
+
+        self.wfile.write(json.dumps(response).encode('utf-8'))
+
+
+class CompletionServer(socketserver.UnixStreamServer):
+    """ Unix socket server which keeps completions and <Exec> results warm
+
+    Requests are handled one by one, because completion depends
+    on working directory of the client.
+    """
+
+    def __init__(self, socket_path):
+        old_umask = os.umask(0o077)
+        try:
+            socketserver.UnixStreamServer.__init__(
+                self, socket_path, CompletionRequestHandler
+            )
+        finally:
+            os.umask(old_umask)
+
+        self.specs = {}
+        self.exec_results = {}
+
+    def get_documents(self, command):
+        """ Get completion documents, reload them when .yml file
+        or bundle changed
+
+        Documents are loaded from bundle, memory mapped cache of large
+        .yml file or .yml file, like in completer process.
+
+        :param command: The command for which read completions
+        :return: List of compiled completion documents, shared
+            by all requests
+        """
+        sources = (
+            get_file_version(get_spec_path(command)),
+            get_file_version(get_bundle_path()),
+        )
+        cached = self.specs.get(command)
+        if cached is None or cached[0] != sources:
+            logger.debug("Load completions for " + command)
+            cached = (sources, get_autocomplete_file_for_command(command))
+            self.specs[command] = cached
+        return cached[1]
+
+    def run_exec(self, command, ttl, timeout, cwd, env, swr=None,
+                 prefix=None, limit=None):
+        """ Get output of <Exec> command, reuse result for DAEMON_EXEC_TTL
+
+        :param command: Shell command from <Exec> marker
+        :param ttl: Time to live of cached output from <Exec> marker
+        :param timeout: Seconds after which command is killed
+        :param cwd: Working directory output depends on or None
+        :param env: Environment of the client
+        :param swr: Seconds for which expired output is served
+        :param prefix: Currently typed part of argument or None
+        :param limit: Maximal number of candidates from command or None
+        :return: Output of command, partial if command timed out
+        """
+        now = time.time()
+        # output read for prefix holds only lines matching it
+        key = (cwd, get_exec_environment(env), command, prefix, limit)
+        max_age = min(get_ttl(ttl), DAEMON_EXEC_TTL)
+
+        cached = self.exec_results.get(key)
+        if cached and now - cached[0] < max_age:
+            return cached[1]
+
+        if len(self.exec_results) >= DAEMON_EXEC_RESULTS_LIMIT:
+            self.exec_results = dict(
+                (cached_key, result)
+                for cached_key, result in self.exec_results.items()
+                if now - result[0] < DAEMON_EXEC_TTL
+            )
+
+        output = get_exec_autocomplete(
+            command, env=env, ttl=ttl, timeout=timeout, swr=swr,
+            prefix=prefix, limit=limit, cwd=cwd,
+        )
+        # partial output is completed by refresh in background
+        if output is not None and not isinstance(output, PartialOutput):
+            self.exec_results[key] = (now, output)
+        return output
+
+    def complete(self, request):
+        """ Make completion for request from client
+
+        :param request: Dict with command name, arguments, prefix, limit,
+            cwd and env
+        :return: Response dict for client
+        """
+        env = request['env']
+        os.chdir(request['cwd'])
+
+        def run_exec(command, ttl, timeout, swr, prefix, limit, cwd):
+            return self.run_exec(
+                command, ttl, timeout, cwd, env, swr, prefix, limit
+            )
+
+        stdout = sys.stdout
+        sys.stdout = StringIO()
+        try:
+            options = completion(
+                request['command_name'],
+                request['all_arguments'],
+                documents=self.get_documents(request['command_name']),
+                run_exec=run_exec,
+                prefix=request.get('prefix'),
+                limit=request.get('limit'),
+            )
+            printed = sys.stdout.getvalue()
+        finally:
+            sys.stdout = stdout
+
+        response = {'stdout': printed, 'options': []}
+        if isinstance(options, dict):
+            response['options'] = list(options.keys())
+        elif options is not None:
+            response['output'] = options
+        return response
+
+
+def serve(socket_path):
+    """ Run completion daemon until interrupted
+
+    :param socket_path: Path of unix socket to listen on
+    :return: None
+    """
+    if os.path.exists(socket_path):
+        logger.debug("Remove stale socket " + socket_path)
+        os.remove(socket_path)
+
+    server = CompletionServer(socket_path)
+    logger.info("Listening on " + socket_path)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        os.remove(socket_path)
@@ -0,0 +1,222 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import zipfile
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+DOWNLOAD_TIMEOUT = 30
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+DOWNLOAD_WORKERS = 4
+
+
+def get_download_cache_path():
+    """ Directory with downloaded archives of completion repositories
+
+    :return: Path to directory
+    """
+    return os.path.expanduser('~/.sufler/cache/downloads')
+
+
+def get_download_cache_files(url):
+    """ Paths of cached archive and its HTTP validators for url
+
+    :param url: Url of archive
+    :return: Tuple with path to archive and path to metadata file
+    """
+    key = hashlib.sha1(url.encode('utf-8')).hexdigest()
+    cache_path = get_download_cache_path()
+    return (
+        '{0}/{1}.zip'.format(cache_path, key),
+        '{0}/{1}.json'.format(cache_path, key),
+    )
+
+
+def read_validators(meta_path, url):
+    """ Read ETag and Last-Modified of cached archive
+
+    :param meta_path: Path to metadata file
+    :param url: Url of archive
+    :return: Dict with etag and last_modified, empty if not cached
+    """
+    try:
+        with open(meta_path, 'r') as f:
+            meta = json.load(f)
+    except (IOError, OSError, ValueError):
+        return {}
+    if meta.get('url') != url:
+        return {}
+    return meta
+
+
+def get_conditional_headers(validators):
+    """ Headers which make request conditional on cached archive
+
+    :param validators: Dict with etag and last_modified
+    :return: Dict with request headers
+    """
+    headers = {}
+    if validators.get('etag'):
+        headers['If-None-Match'] = validators['etag']
+    if validators.get('last_modified'):
+        headers['If-Modified-Since'] = validators['last_modified']
+    return headers
+
+
+def download_archive(url, session=None):
+    """ Download archive unless cached one is still current
+
+    Cached archive is kept in ~/.sufler/cache/downloads with ETag
+    and Last-Modified of response, which are sent with next request,
+    so unchanged archive costs single 304 response.
+
+    :param url: Url of archive
+    :param session: requests.Session used for request
+    :return: Tuple with path to archive and flag if it was changed
+    """
+    archive_path, meta_path = get_download_cache_files(url)
+    validators = {}
+    if os.path.exists(archive_path):
+        validators = read_validators(meta_path, url)
+
+    logger.debug("Download " + url)
+    tmp_path = '{0}.{1}.tmp'.format(archive_path, os.getpid())
+    try:
+        response = (session or requests).get(
+            url, headers=get_conditional_headers(validators),
+            timeout=DOWNLOAD_TIMEOUT, stream=True,
+        )
+        try:
+            if response.status_code == 304:
+                logger.debug("Archive not modified " + url)
+                return archive_path, False
+            response.raise_for_status()
+
+            cache_path = get_download_cache_path()
+            if not os.path.exists(cache_path):
+                os.makedirs(cache_path)
+
+            with open(tmp_path, 'wb') as f:
+                for chunk in response.iter_content(DOWNLOAD_CHUNK_SIZE):
+                    f.write(chunk)
+        finally:
+            response.close()
+    except requests.RequestException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        if not os.path.exists(archive_path):
+            raise
+        logger.info("Can't download {0}, use cached archive".format(url))
+        return archive_path, False
+    os.rename(tmp_path, archive_path)
+
+    tmp_path = '{0}.{1}.tmp'.format(meta_path, os.getpid())
+    with open(tmp_path, 'w') as f:
+        json.dump({
+            'url': url,
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+        }, f)
+    os.rename(tmp_path, meta_path)
+
+    return archive_path, True
+
+
+def try_download_archive(url, session):
+    """ Download archive, log error instead of raising it
+
+    :param url: Url of archive
+    :param session: requests.Session used for request
+    :return: Tuple with path to archive and flag if it was changed,
+        path is None if archive can't be downloaded
+    """
+    try:
+        return download_archive(url, session)
+    except requests.RequestException as e:
+        logger.error("Can't download {0}: {1}".format(url, e))
+        return None, False
+
+
+def download_archives(urls):
+    """ Download archives of repositories concurrently
+
+    Requests share pooled connections of one session. Every url has own
+    files in download cache, so repositories don't overwrite each other.
+
+    :param urls: List of archive urls
+    :return: List of (url, archive path, changed flag) in order of urls,
+        repeated urls are downloaded once
+    """
+    urls = [url for i, url in enumerate(urls) if url not in urls[:i]]
+    if not urls:
+        return []
+
+    with requests.Session() as session:
+        if len(urls) == 1:
+            results = [try_download_archive(urls[0], session)]
+        else:
+            from concurrent.futures import ThreadPoolExecutor
+
+            executor = ThreadPoolExecutor(
+                max_workers=min(len(urls), DOWNLOAD_WORKERS)
+            )
+            try:
+                results = list(executor.map(
+                    lambda url: try_download_archive(url, session), urls
+                ))
+            finally:
+                executor.shutdown()
+    return [
+        (url, archive_path, changed)
+        for url, (archive_path, changed) in zip(urls, results)
+    ]
+
+
+def get_completion_members(zip_file):
+    """ Members of archive with completion files
+
+    Only .yml files placed directly in completions/ directory
+    of repository are selected, archive of repository has its files
+    in single root directory, e.g. sufler-completions-master/.
+
+    :param zip_file: zipfile.ZipFile with repository
+    :return: Dict from completion file name to archive member
+    """
+    members = {}
+    for member in zip_file.infolist():
+        parts = member.filename.split('/')
+        if len(parts) == 3 and parts[1] == 'completions' and \
+                parts[2].endswith('.yml'):
+            members[parts[2]] = member
+    return members
+
+
+def extract_completions(archive_path, completions_path):
+    """ Install completion files from archive which are not installed yet
+
+    Selected members are streamed from archive to temporary files
+    in completions_path and renamed, so half written file is never
+    visible and rest of archive is not extracted at all.
+
+    :param archive_path: Path to zip file with repository
+    :param completions_path: Directory with installed completions
+    :return: Sorted list of installed file names
+    """
+    installed = set(os.listdir(completions_path))
+    extracted = []
+    with zipfile.ZipFile(archive_path) as zip_file:
+        members = get_completion_members(zip_file)
+        for name in sorted(set(members).difference(installed)):
+            logger.debug("Install completion file " + name)
+            file_path = os.path.join(completions_path, name)
+            tmp_path = '{0}.{1}.tmp'.format(file_path, os.getpid())
+            with zip_file.open(members[name]) as source, \
+                    open(tmp_path, 'wb') as target:
+                shutil.copyfileobj(source, target, DOWNLOAD_CHUNK_SIZE)
+            os.rename(tmp_path, file_path)
+            extracted.append(name)
+    return extracted
@@ -0,0 +1,198 @@
+import logging
+import re
+import shlex
+from itertools import islice
+
+logger = logging.getLogger(__name__)
+
+STAGE_SEPARATOR = '|>'
+
+# characters which have to be interpreted by shell
+SHELL_CHARACTERS = frozenset('|&;<>()$`\\*?[]{}~!#')
+
+
+def lines_stage(start='', end=''):
+    """ Keep slice of lines, e.g. 'lines 1:' works like tail -n+2
+
+    Slice counted from end of output waits for whole output.
+
+    :param start: Index of first line, empty for start of output
+    :param end: Index after last line, empty for end of output
+    :return: Function filtering iterable of lines
+    """
+    start = int(start) if start else None
+    end = int(end) if end else None
+    if (start or 0) < 0 or (end or 0) < 0:
+        return lambda lines: list(lines)[start:end]
+    return lambda lines: islice(lines, start, end)
+
+
+def replace_stage(pattern, replacement):
+    """ Replace first match of pattern in every line like sed 's/a/b/'
+
+    :param pattern: Regular expression
+    :param replacement: Replacement, may refer to groups like \\1
+    :return: Function filtering iterable of lines
+    """
+    compiled = re.compile(pattern)
+    return lambda lines: (
+        compiled.sub(replacement, line, count=1) for line in lines
+    )
+
+
+def extract_stage(pattern):
+    """ Keep first group or whole match of pattern, drop other lines
+
+    Whole match is kept also when first group didn't take part in it.
+
+    :param pattern: Regular expression
+    :return: Function filtering iterable of lines
+    """
+    compiled = re.compile(pattern)
+
+    def extract(lines):
+        for line in lines:
+            match = compiled.search(line)
+            if match:
+                group = match.group(1) if compiled.groups else None
+                yield match.group(0) if group is None else group
+    return extract
+
+
+def grep_stage(pattern):
+    """ Keep lines matching pattern like grep
+
+    :param pattern: Regular expression
+    :return: Function filtering iterable of lines
+    """
+    compiled = re.compile(pattern)
+    return lambda lines: (line for line in lines if compiled.search(line))
+
+
+def field_stage(separator, number):
+    """ Keep field of every line like cut -d separator -f number
+
+    Lines without separator are kept whole, like cut does.
+
+    :param separator: Field separator
+    :param number: Number of field, starting from 1
+    :return: Function filtering iterable of lines
+    """
+    index = int(number) - 1
+    if index < 0:
+        raise ValueError('field number starts from 1')
+
+    def field(lines):
+        for line in lines:
+            fields = line.split(separator)
+            if len(fields) == 1:
+                yield line
+            elif index < len(fields):
+                yield fields[index]
+            else:
+                yield ''
+    return field
+
+
+def unique_stage():
+    """ Remove repeated lines, first occurrence is kept
+
+    :return: Function filtering iterable of lines
+    """
+    def unique(lines):
+        seen = set()
+        for line in lines:
+            if line not in seen:
+                seen.add(line)
+                yield line
+    return unique
+
+
+def sort_stage():
+    """ Sort lines, waits for whole output
+
+    :return: Function filtering iterable of lines
+    """
+    return sorted
+
+
+STAGES = {
+    'lines': lambda arguments: lines_stage(*arguments[0].split(':', 1)),
+    'replace': lambda arguments: replace_stage(*arguments),
+    'extract': lambda arguments: extract_stage(*arguments),
+    'grep': lambda arguments: grep_stage(*arguments),
+    'field': lambda arguments: field_stage(*arguments),
+    'unique': lambda arguments: unique_stage(*arguments),
+    'sort': lambda arguments: sort_stage(*arguments),
+}
+
+
+def parse_exec(body):
+    """ Split body of <Exec> marker to command and filter stages
+
+    E.g. 'npm ls |> lines 1: |> replace ".* " ""' runs 'npm ls',
+    skips first line of output and removes everything to last space.
+
+    :param body: Body of <Exec> marker with TREE marks replaced
+    :return: Tuple with shell command and list of stage functions
+    :raise ValueError: When stage is unknown or has wrong arguments
+    """
+    parts = body.split(STAGE_SEPARATOR)
+    stages = []
+    for part in parts[1:]:
+        arguments = shlex.split(part)
+        if not arguments or arguments[0] not in STAGES:
+            raise ValueError('unknown stage {0!r}'.format(part.strip()))
+        try:
+            stages.append(STAGES[arguments[0]](arguments[1:]))
+        except (TypeError, IndexError, ValueError, re.error) as e:
+            raise ValueError('wrong stage {0!r}: {1}'.format(
+                part.strip(), e
+            ))
+    return parts[0].strip(), stages
+
+
+def split_command(command):
+    """ Split command to arguments when it can be run without shell
+
+    :param command: Shell command from <Exec> marker
+    :return: List of arguments or None if command needs shell
+    """
+    if SHELL_CHARACTERS.intersection(command):
+        return None
+    try:
+        arguments = shlex.split(command)
+    except ValueError:
+        return None
+    # variable assignment before command, e.g. 'LANG=C ls'
+    if not arguments or '=' in arguments[0]:
+        return None
+    return arguments
+
+
+def stream_stages(lines, stages):
+    """ Filter lines of output with stages as they are read
+
+    :param lines: Iterable of lines without line endings
+    :param stages: List of stage functions
+    :return: Iterable of filtered lines
+    """
+    for stage in stages:
+        lines = stage(lines)
+    return lines
+
+
+def apply_stages(output, stages):
+    """ Filter output of command with stages
+
+    :param output: Output of command
+    :param stages: List of stage functions
+    :return: Filtered output, one line per candidate
+    """
+    if not stages:
+        return output
+
+    lines = output.split('\n')
+    if lines and lines[-1] == '':
+        lines.pop()
+    return ''.join(line + '\n' for line in stream_stages(lines, stages))
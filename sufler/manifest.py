@@ -0,0 +1,98 @@
+import hashlib
+import json
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_VERSION = 1
+
+
+def get_manifest_path():
+    """ Path to manifest of installed completions
+
+    :return: Path to manifest file
+    """
+    return os.path.expanduser('~/.sufler/manifest.json')
+
+
+def hash_content(content):
+    """ Hash of content
+
+    :param content: String or bytes
+    :return: Hex digest of content
+    """
+    if not isinstance(content, bytes):
+        content = content.encode('utf-8')
+    return hashlib.sha1(content).hexdigest()
+
+
+def hash_file(path):
+    """ Hash of file content
+
+    :param path: Path to file
+    :return: Hex digest of file content or None if file can't be read
+    """
+    try:
+        with open(path, 'rb') as f:
+            return hash_content(f.read())
+    except (IOError, OSError):
+        return None
+
+
+def empty_manifest():
+    """ Manifest without installed completions
+
+    :return: Manifest dict
+    """
+    return {'version': MANIFEST_VERSION, 'specs': {}, 'shells': {}}
+
+
+def read_manifest(manifest_path=None):
+    """ Read manifest of installed completions
+
+    :param manifest_path: Path to manifest, get_manifest_path() if None
+    :return: Manifest dict, empty if file is missing, broken or written
+        by other version
+    """
+    manifest_path = manifest_path or get_manifest_path()
+    try:
+        with open(manifest_path, 'r') as f:
+            manifest = json.load(f)
+    except (IOError, OSError, ValueError):
+        return empty_manifest()
+
+    if not isinstance(manifest, dict) or \
+            manifest.get('version') != MANIFEST_VERSION:
+        return empty_manifest()
+    return manifest
+
+
+def write_manifest(manifest, manifest_path=None):
+    """ Write manifest of installed completions
+
+    :param manifest: Manifest dict
+    :param manifest_path: Path to manifest, get_manifest_path() if None
+    :return: None
+    """
+    manifest_path = manifest_path or get_manifest_path()
+    tmp_path = '{0}.{1}.tmp'.format(manifest_path, os.getpid())
+    logger.debug("Write manifest " + manifest_path)
+    try:
+        with open(tmp_path, 'w') as f:
+            json.dump(manifest, f, indent=2, sort_keys=True)
+        os.rename(tmp_path, manifest_path)
+    except (IOError, OSError):
+        logger.debug("Can't write manifest " + manifest_path)
+
+
+def artifacts_unchanged(artifacts):
+    """ Check that installed files were not changed or removed
+
+    :param artifacts: Dict from path of file to hash of its content
+    :return: True if all files have recorded content
+    """
+    return all(
+        hash_file(path) == content_hash
+        for path, content_hash in artifacts.items()
+    )
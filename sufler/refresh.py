@@ -0,0 +1,32 @@
+import sys
+
+from sufler.base import run_exec_command
+from sufler.cache import (EXEC_REFRESH_TIMEOUT, exec_command_lock,
+                          finish_exec_refresh, write_exec_cache)
+
+
+def refresh(command, cwd=None):
+    """ Run <Exec> command and write its output to cache
+
+    Run in detached process started by refresh_exec_cache.
+
+    :param command: Shell command from <Exec> marker
+    :param cwd: Working directory output depends on or None
+    :return: None
+    """
+    try:
+        with exec_command_lock(
+                command, EXEC_REFRESH_TIMEOUT, cwd=cwd) as waited:
+            if waited is None:
+                return
+            _, output, _ = run_exec_command(
+                command, timeout=EXEC_REFRESH_TIMEOUT
+            )
+            if output is not None:
+                write_exec_cache(command, output, cwd=cwd)
+    finally:
+        finish_exec_refresh(command, cwd=cwd)
+
+
+if __name__ == "__main__":
+    refresh(*sys.argv[1:3])
@@ -0,0 +1,283 @@
+import logging
+import os
+import pickle
+from sys import intern
+
+logger = logging.getLogger(__name__)
+
+SPEC_CACHE_VERSION = 4
+
+MARKERS = ('<File', '<Exec', '<Regex', '<Run')
+
+
+class Node(object):
+    """ Read-only node of compiled completions tree
+
+    Nodes are shared by all paths joined with YAML anchors and by all
+    completions made from loaded spec, so they are never modified
+    after compile.
+
+    Children are indexed by literal keys and by keys without trailing
+    whitespace, e.g. 'dairy: ' is found also by typed 'dairy:'.
+    """
+    __slots__ = ('id', 'children', 'keys', 'sorted_keys', 'markers')
+
+    def __init__(self, node_id):
+        self.id = node_id
+        self.children = {}
+        self.keys = ()
+        self.sorted_keys = ()
+        self.markers = ()
+
+
+class Marker(object):
+    """ Read-only marker key of compiled completions tree
+
+    Pattern of <Regex> marker is compiled with spec, unless it contains
+    TREE marks, which are replaced by typed arguments.
+    """
+    __slots__ = ('name', 'options', 'body', 'child', 'pattern')
+
+    def __init__(self, name, options, body, child, pattern=None):
+        self.name = name
+        self.options = options
+        self.body = body
+        self.child = child
+        self.pattern = pattern
+
+
+def parse_marker(key):
+    """ Split marker key to name, options and rest of key
+
+    E.g. '<Exec ttl=300> ls' gives ('Exec', {'ttl': '300'}, ' ls')
+
+    :param key: The currently processed key from .yaml file
+    :return: Tuple with marker name, dict of options and rest of key
+    """
+    end = key.find('>')
+    name_and_options = key[1:end].split()
+
+    options = {}
+    for option in name_and_options[1:]:
+        name, separator, value = option.partition('=')
+        options[name] = value if separator else True
+
+    return name_and_options[0], options, key[end + 1:]
+
+
+def compile_pattern(body, patterns):
+    """ Compile pattern of <Regex> marker, reuse already compiled ones
+
+    Invalid patterns are reported and never match.
+
+    :param body: Pattern from <Regex> marker
+    :param patterns: Dict from pattern to already compiled pattern
+    :return: Compiled pattern or None if pattern is invalid
+        or contains TREE marks
+    """
+    if 'TREE~' in body:
+        return None
+
+    if body not in patterns:
+        import re
+
+        try:
+            patterns[body] = re.compile(body)
+        except re.error as e:
+            logger.warning("Invalid pattern of <Regex>{0}: {1}".format(
+                body, e
+            ))
+            patterns[body] = None
+    return patterns[body]
+
+
+def compile_tree(document):
+    """ Convert completions tree loaded from .yml file to read-only nodes
+
+    Dicts shared by YAML anchors become one node, so cycles are kept.
+    Empty nodes become None. Nodes are numbered in order of discovery
+    from root, so ids are stable for the same .yml file.
+
+    :param document: Document loaded from .yml file
+    :return: Root node
+    """
+    nodes = {}
+    patterns = {}
+    stack = []
+
+    def get_node(value):
+        if not value or not isinstance(value, dict):
+            return None
+        if id(value) not in nodes:
+            nodes[id(value)] = Node(len(nodes))
+            stack.append(value)
+        return nodes[id(value)]
+
+    root = get_node(document)
+    while stack:
+        value = stack.pop()
+        node = nodes[id(value)]
+
+        keys = []
+        markers = []
+        for key, rest_of_tree in value.items():
+            key = intern(str(key))
+            child = get_node(rest_of_tree)
+            if key.startswith(MARKERS):
+                name, options, body = parse_marker(key)
+                pattern = compile_pattern(body, patterns) \
+                    if name == 'Regex' else None
+                markers.append(Marker(name, options, body, child, pattern))
+            else:
+                node.children[key] = child
+                keys.append(key)
+
+        for key in keys:
+            normalized = intern(key.rstrip())
+            if normalized not in node.children:
+                node.children[normalized] = node.children[key]
+
+        node.keys = tuple(keys)
+        node.sorted_keys = tuple(sorted(keys))
+        node.markers = tuple(markers)
+
+    return root
+
+
+def get_spec_path(command):
+    """ Path to .yml file with completions for command
+
+    :param command: The command for which completions are defined
+    :return: Path to .yml file
+    """
+    return os.path.expanduser(
+        '~/.sufler/completions/{0}.yml'.format(command)
+    )
+
+
+def get_spec_cache_path(command):
+    """ Path to compiled completions cache for command
+
+    :param command: The command for which completions are defined
+    :return: Path to cache file
+    """
+    return os.path.expanduser(
+        '~/.sufler/cache/specs/{0}.pickle'.format(command)
+    )
+
+
+def get_spec_header(source_path):
+    """ Build header which identifies version of .yml file
+
+    :param source_path: Path to .yml file
+    :return: Dict with cache format version, mtime and size of .yml file
+    """
+    stat = os.stat(source_path)
+    return {
+        'version': SPEC_CACHE_VERSION,
+        'mtime': stat.st_mtime,
+        'size': stat.st_size,
+    }
+
+
+def parse_spec(source_path):
+    """ Parse .yml file with completions
+
+    :param source_path: Path to .yml file
+    :return: List of documents from .yml file
+    """
+    # yaml is imported only when cache has to be rebuilt
+    import yaml
+
+    loader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+    with open(source_path, 'r') as f:
+        return list(yaml.load_all(f, Loader=loader))
+
+
+def compile_spec(source_path, cache_path):
+    """ Parse and compile .yml file and write documents to binary cache
+
+    :param source_path: Path to .yml file
+    :param cache_path: Path where cache will be written
+    :return: List of compiled documents from .yml file
+    """
+    header = get_spec_header(source_path)
+    documents = [
+        compile_tree(document) for document in parse_spec(source_path)
+    ]
+    write_spec_cache(cache_path, header, documents)
+    return documents
+
+
+def write_spec_cache(cache_path, header, documents):
+    """ Write compiled documents to binary cache
+
+    Header is written as separate pickle so it can be checked
+    without loading whole completions tree.
+
+    :param cache_path: Path where cache will be written
+    :param header: Header of .yml file from which documents were compiled
+    :param documents: List of compiled documents
+    :return: None
+    """
+    logger.debug("Write spec cache " + cache_path)
+    tmp_path = '{0}.{1}.tmp'.format(cache_path, os.getpid())
+    try:
+        cache_dir = os.path.dirname(cache_path)
+        if not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(header, f, pickle.HIGHEST_PROTOCOL)
+            pickle.dump(documents, f, pickle.HIGHEST_PROTOCOL)
+        os.rename(tmp_path, cache_path)
+    except (IOError, OSError):
+        logger.debug("Can't write spec cache " + cache_path)
+
+
+def read_spec_cache(cache_path, header):
+    """ Read documents from cache if it was build from same .yml file
+
+    :param cache_path: Path to cache file
+    :param header: Header of current .yml file
+    :return: List of compiled documents or None if cache is missing
+        or outdated
+    """
+    try:
+        with open(cache_path, 'rb') as f:
+            if pickle.load(f) != header:
+                return None
+            return pickle.load(f)
+    except (IOError, OSError, EOFError, ValueError, pickle.UnpicklingError):
+        return None
+
+
+def is_spec_cache_fresh(command):
+    """ Check if spec cache was built from current .yml file
+
+    Only header of cache is read, documents are not loaded.
+
+    :param command: The command for which completions are defined
+    :return: True if cache is up to date
+    """
+    try:
+        header = get_spec_header(get_spec_path(command))
+        with open(get_spec_cache_path(command), 'rb') as f:
+            return pickle.load(f) == header
+    except (IOError, OSError, EOFError, ValueError, pickle.UnpicklingError):
+        return False
+
+
+def load_spec(command):
+    """ Load completions for command, compile them when .yml file changed
+
+    :param command: The command for which read completions
+    :return: List of compiled documents from .yml file
+    """
+    source_path = get_spec_path(command)
+    cache_path = get_spec_cache_path(command)
+
+    documents = read_spec_cache(cache_path, get_spec_header(source_path))
+    if documents is None:
+        documents = compile_spec(source_path, cache_path)
+    return documents
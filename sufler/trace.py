@@ -0,0 +1,177 @@
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+PERCENTILES = (50, 95, 99)
+# phases which are reported also separately for every command or pattern
+DETAILED_PHASES = ('exec', 'regex')
+
+
+def is_trace_enabled():
+    """ Check if completions should be traced
+
+    :return: True if SUFLER_TRACE environment variable is set
+    """
+    return os.environ.get('SUFLER_TRACE', '') not in ('', '0')
+
+
+def get_trace_path():
+    """ Path to file with traces of completions
+
+    :return: SUFLER_TRACE_FILE environment variable or default path
+    """
+    return os.environ.get('SUFLER_TRACE_FILE') or os.path.expanduser(
+        '~/.sufler/trace.log'
+    )
+
+
+class Trace(object):
+    """ Timings of phases of one completion request
+
+    """
+    __slots__ = ('command', 'spec_path', 'started', 'phases')
+
+    def __init__(self, command, spec_path):
+        self.command = command
+        self.spec_path = spec_path
+        self.started = time.time()
+        self.phases = []
+
+    def add(self, phase, started, detail=None):
+        """ Record phase which started at given time and ends now
+
+        :param phase: Name of phase, e.g. load, traverse, exec or file
+        :param started: Time when phase started
+        :param detail: Description of phase, e.g. command of <Exec>
+        :return: None
+        """
+        self.phases.append({
+            'phase': phase,
+            'duration': time.time() - started,
+            'detail': detail,
+        })
+
+    def write(self, trace_path=None):
+        """ Append trace as JSON line to trace file
+
+        :param trace_path: Path to trace file, get_trace_path() if None
+        :return: None
+        """
+        import json
+
+        trace_path = trace_path or get_trace_path()
+        line = json.dumps({
+            'time': self.started,
+            'command': self.command,
+            'spec': self.spec_path,
+            'total': time.time() - self.started,
+            'phases': self.phases,
+        })
+        try:
+            trace_dir = os.path.dirname(trace_path)
+            if not os.path.exists(trace_dir):
+                os.makedirs(trace_dir)
+            with open(trace_path, 'a') as f:
+                f.write(line + '\n')
+        except (IOError, OSError):
+            logger.debug("Can't write trace " + trace_path)
+
+
+class NoTrace(object):
+    """ Trace used when tracing is disabled, records nothing
+
+    """
+    __slots__ = ()
+
+    def add(self, phase, started, detail=None):
+        pass
+
+    def write(self, trace_path=None):
+        pass
+
+
+NO_TRACE = NoTrace()
+
+
+def start_trace(command, spec_path):
+    """ Start trace of completion request
+
+    :param command: Command for which completion is made
+    :param spec_path: Path to .yml file with completions for command
+    :return: Trace or NO_TRACE if tracing is disabled
+    """
+    if is_trace_enabled():
+        return Trace(command, spec_path)
+    return NO_TRACE
+
+
+def read_traces(trace_path):
+    """ Read traces written to trace file
+
+    :param trace_path: Path to trace file
+    :return: List of trace dicts, broken lines are skipped
+    """
+    import json
+
+    traces = []
+    with open(trace_path, 'r') as f:
+        for line in f:
+            try:
+                traces.append(json.loads(line))
+            except ValueError:
+                logger.debug("Skip broken trace line")
+    return traces
+
+
+def percentile(values, percent):
+    """ Nearest-rank percentile of values
+
+    :param values: Sorted list of values
+    :param percent: Percentile, e.g. 95
+    :return: Value below which percent of values fall
+    """
+    index = max(-(-len(values) * percent // 100) - 1, 0)
+    return values[index]
+
+
+def aggregate_traces(traces, key):
+    """ Compute percentiles of total time and phases grouped by key
+
+    Durations of same phase in one request, e.g. of each <Exec>, are
+    summed before computing percentiles. Phases in DETAILED_PHASES
+    are also reported for every command or pattern, e.g. 'exec ls'.
+
+    :param traces: List of trace dicts
+    :param key: Key of trace used for grouping, e.g. command or spec
+    :return: Dict from value of key to dict from phase name to tuple
+        with number of requests and percentiles in PERCENTILES order
+    """
+    durations = {}
+    for trace in traces:
+        group = durations.setdefault(trace.get(key), {})
+        group.setdefault('total', []).append(trace['total'])
+
+        phases = {}
+        for phase in trace['phases']:
+            names = [phase['phase']]
+            if phase['phase'] in DETAILED_PHASES and \
+                    isinstance(phase.get('detail'), str):
+                names.append(
+                    '{0} {1}'.format(phase['phase'], phase['detail'].strip())
+                )
+            for name in names:
+                phases[name] = phases.get(name, 0) + phase['duration']
+        for phase, duration in phases.items():
+            group.setdefault(phase, []).append(duration)
+
+    stats = {}
+    for group, phases in durations.items():
+        stats[group] = {}
+        for phase, values in phases.items():
+            values.sort()
+            stats[group][phase] = (len(values),) + tuple(
+                percentile(values, percent) for percent in PERCENTILES
+            )
+    return stats
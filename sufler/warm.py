@@ -0,0 +1,92 @@
+import logging
+import os
+import time
+
+from sufler.base import run_exec_command
+from sufler.cache import (EXEC_REFRESH_TIMEOUT, exec_command_lock, get_ttl,
+                          write_exec_cache)
+
+logger = logging.getLogger(__name__)
+
+WARM_WORKERS = int(os.environ.get('SUFLER_WARM_WORKERS', 4))
+
+
+def collect_exec_commands(documents):
+    """ Collect <Exec> commands which can be run before completion
+
+    Every node is visited once, so cycles made by YAML anchors
+    are walked only once. Commands with TREE marks depend on typed
+    arguments, commands of <Exec cwd> markers depend on working
+    directory and commands with ttl=0 are not cached, so they
+    are skipped.
+
+    :param documents: List of compiled documents of spec
+    :return: List of distinct commands in order of discovery
+    """
+    commands = []
+    visited = set()
+    stack = [document for document in reversed(documents) if document]
+    while stack:
+        node = stack.pop()
+        if node.id in visited:
+            continue
+        visited.add(node.id)
+
+        children = []
+        for marker in node.markers:
+            if marker.name == 'Exec' and 'TREE~' not in marker.body and \
+                    'cwd' not in marker.options and \
+                    get_ttl(marker.options.get('ttl')) > 0:
+                command = marker.body
+                if command not in commands:
+                    commands.append(command)
+            children.append(marker.child)
+        children.extend(node.children[key] for key in node.keys)
+        stack.extend(
+            child for child in reversed(children)
+            if child is not None and child.id not in visited
+        )
+    return commands
+
+
+def warm_exec_command(command):
+    """ Run <Exec> command and write its output to cache
+
+    Run in worker process of warm_exec_cache.
+
+    :param command: Shell command from <Exec> marker
+    :return: Tuple with command, seconds it took and status,
+        'ok', 'failed' or 'timeout', output too long for cache
+        is reported as failed
+    """
+    started = time.time()
+    status = 'timeout'
+    with exec_command_lock(command, EXEC_REFRESH_TIMEOUT) as waited:
+        if waited is not None:
+            _, output, returncode = run_exec_command(
+                command, timeout=EXEC_REFRESH_TIMEOUT
+            )
+            if returncode is not None and output is None:
+                status = 'failed'
+            elif output is not None:
+                write_exec_cache(command, output)
+                status = 'ok'
+    return command, time.time() - started, status
+
+
+def warm_exec_cache(commands, workers=WARM_WORKERS):
+    """ Fill cache with output of commands using pool of processes
+
+    :param commands: List of shell commands from <Exec> markers
+    :param workers: Maximal number of commands run at once
+    :return: List of tuples with command, seconds and status
+        in order of commands
+    """
+    if not commands:
+        return []
+
+    from concurrent.futures import ProcessPoolExecutor
+
+    with ProcessPoolExecutor(
+            max_workers=min(len(commands), workers)) as executor:
+        return list(executor.map(warm_exec_command, commands))
@@ -0,0 +1,18 @@
+import os
+import shutil
+
+import pytest
+
+from sufler import spec
+
+TEST_DATA_PATH = os.path.abspath(os.path.dirname(__file__)) + '/test_data.yml'
+
+
+@pytest.fixture
+def sufler_home(tmpdir, monkeypatch):
+    monkeypatch.setenv('HOME', str(tmpdir))
+    monkeypatch.setenv('SUFLER_SOCKET', str(tmpdir.join('sufler.sock')))
+    monkeypatch.delenv('SUFLER_BUNDLE', raising=False)
+    tmpdir.mkdir('.sufler').mkdir('completions')
+    shutil.copyfile(TEST_DATA_PATH, spec.get_spec_path('food'))
+    return tmpdir
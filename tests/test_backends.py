@@ -1,6 +1,7 @@
 import pytest
 from mock import call, patch
 
+from sufler import backends
 from sufler.backends.bash import bash
 from sufler.backends.fish import fish
 from sufler.backends.powershell import powershell
@@ -13,6 +14,7 @@ except ImportError:
 #bash.py
 @patch('sufler.backends.bash.bash.completion')
 @patch('sys.stdout')
+@patch('sys.argv', ['bash.py', '1', 'food', ''])
 @pytest.mark.parametrize('test_data, expected_value', [
     ('options', 'options'),
     ({'test': 'some', 'data': 'thing'}, 'test\ndata'),
@@ -86,3 +88,33 @@ def test_backends_powershell(mock_print, mock_completion, test_data, expected_va
 
     assert mock_completion.call_count == 1
     mock_print.assert_has_calls(calls, any_order=True)
+
+
+@pytest.mark.parametrize('arguments, expected_value', [
+    (['bash.py', '1', 'pip'], (None, ['bash.py', '1', 'pip'])),
+    (['bash.py', '--limit=20', '1', 'pip'], (20, ['bash.py', '1', 'pip'])),
+])
+def test_parse_options(arguments, expected_value):
+    assert backends.parse_options(arguments) == expected_value
+
+
+@pytest.mark.parametrize('line, arguments, expected_value', [
+    ('pip inst', ['pip', 'inst'], 'inst'),
+    ('pip install ', ['pip', 'install'], ''),
+    ('', [], ''),
+])
+def test_get_prefix(line, arguments, expected_value):
+    assert backends.get_prefix(line, arguments) == expected_value
+
+
+@patch('sufler.backends.bash.bash.completion', return_value={'install': None})
+@patch('sys.argv', ['bash.py', '--limit=5', '1', 'pip', 'ins'])
+def test_backends_bash_prefix(mock_completion):
+    bash.bash_parse()
+
+    mock_completion.assert_called_once_with(
+        command_name='pip',
+        all_arguments=['bash.py', '1', 'pip', 'ins'],
+        prefix='ins',
+        limit=5,
+    )
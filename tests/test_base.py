@@ -1,9 +1,15 @@
+import json
 import mock
 import os
 import pytest
+import subprocess
+import sys
+import threading
+import time
 import yaml
 
 from sufler import base
+from sufler.spec import compile_tree
 
 
 @mock.patch('sufler.base.os.path.exists', side_effect=[True, False])
@@ -18,13 +24,67 @@ def test_get_files_autocomplete(mock_exists, mock_isfile, file, expected_value):
     mock_isfile.assert_called()
 
 
-@mock.patch('sufler.base.yaml.load_all', return_value={'Yep': 'pancake'})
-def test_autocomplete_file_for_command(mock_load_all):
-    m = mock.mock_open(read_data="'Yep': 'pancake':")
-    with mock.patch('sufler.base.open', m):
-        autocomplete_dict = base.get_autocomplete_file_for_command('food')
-    assert isinstance(autocomplete_dict, dict)
-    mock_load_all.assert_called_once()
+@pytest.fixture
+def files_tree(tmpdir, monkeypatch):
+    monkeypatch.chdir(tmpdir)
+    monkeypatch.setattr(base, 'FILES_CACHE', {})
+    tmpdir.mkdir('docs').mkdir('api').join('index.rst').write('')
+    tmpdir.join('docs', 'index.rst').write('')
+    tmpdir.join('docs', 'conf.py').write('')
+    tmpdir.join('setup.py').write('')
+    return tmpdir
+
+
+@pytest.mark.parametrize('already_typed, depth, expected_value', [
+    ('', 1, ['docs/', 'setup.py']),
+    ('s', 1, ['setup.py']),
+    ('docs/', 1, ['docs/api/', 'docs/conf.py', 'docs/index.rst']),
+    ('docs/i', 1, ['docs/index.rst']),
+    ('docs', 2, ['docs/', 'docs/api/', 'docs/conf.py', 'docs/index.rst']),
+    ('docs/a', 3, ['docs/api/', 'docs/api/index.rst']),
+    ('missing/', 1, ['missing/']),
+])
+def test_get_files_autocomplete_lists_typed_directory(files_tree, already_typed, depth, expected_value):
+    assert sorted(base.get_files_autocomplete(already_typed, depth)) == expected_value
+
+
+def test_get_files_autocomplete_reuses_listing(files_tree):
+    assert base.get_files_autocomplete('docs/c') == ['docs/conf.py']
+
+    with mock.patch('sufler.base.os.scandir') as mock_scandir:
+        assert base.get_files_autocomplete('docs/c') == ['docs/conf.py']
+    mock_scandir.assert_not_called()
+
+    files_tree.join('docs', 'changes.rst').write('')
+    os.utime(str(files_tree.join('docs')), (0, 0))
+    assert base.get_files_autocomplete('docs/c') == ['docs/changes.rst', 'docs/conf.py']
+
+
+def test_completion_with_recursive_file_marker(files_tree):
+    documents = [{'food': {'<File rec depth=2>': None}}]
+
+    options = base.completion('food', ['path', '1', 'food', 'do'], documents=documents, prefix='do')
+
+    assert sorted(options.keys()) == ['docs/', 'docs/api/', 'docs/conf.py', 'docs/index.rst']
+
+
+@pytest.mark.parametrize('typed, expected_value', [
+    (['docs/conf.py', ''], ['--upgrade']),
+    (['docs/'], ['docs/api/', 'docs/conf.py', 'docs/index.rst']),
+])
+def test_completion_with_file_marker_in_typed_directory(files_tree, typed, expected_value):
+    documents = [{'pip': {'install': {'-r': {'<File>': {'--upgrade': None}}}}}]
+
+    options = base.completion('pip', ['path', str(len(typed) + 2), 'pip', 'install', '-r'] + typed, documents=documents)
+
+    assert sorted(options.keys()) == expected_value
+
+
+@mock.patch('sufler.base.load_spec', return_value=[{'Yep': 'pancake'}])
+def test_autocomplete_file_for_command(mock_load_spec):
+    autocomplete_dict = base.get_autocomplete_file_for_command('food')
+    assert autocomplete_dict == [{'Yep': 'pancake'}]
+    mock_load_spec.assert_called_once_with('food')
 
 
 @pytest.mark.parametrize('key, arguments, expected_value', [
@@ -44,7 +104,372 @@ def test_replace_tree_marks(key, arguments, expected_value):
 ])
 def test_completion(command_name, all_arguments, expected_value):
     path = os.path.abspath(os.path.dirname(__file__)) + '/test_data.yml'
-    test_data = yaml.load_all(open(path, "r"))
+    test_data = yaml.load_all(open(path, "r"), Loader=yaml.SafeLoader)
 
     with mock.patch('sufler.base.get_autocomplete_file_for_command', return_value=test_data):
         assert set(base.completion(command_name, all_arguments).keys()) == set(expected_value)
+
+
+@mock.patch('sufler.base.write_exec_cache')
+@mock.patch('sufler.base.read_exec_cache', return_value=None)
+def test_get_exec_autocomplete(mock_read_exec_cache, mock_write_exec_cache):
+    assert base.get_exec_autocomplete('echo one; echo two', ttl='300') == 'one\ntwo\n'
+    assert mock_read_exec_cache.call_args_list == [mock.call('echo one; echo two', '300', None, None)] * 2
+    mock_write_exec_cache.assert_called_once_with('echo one; echo two', 'one\ntwo\n', None, None)
+
+
+@mock.patch('sufler.base.run_exec_command')
+@mock.patch('sufler.base.read_exec_cache', side_effect=[None, 'cached'])
+def test_get_exec_autocomplete_cached_before_lock(mock_read_exec_cache, mock_run, tmpdir, monkeypatch):
+    monkeypatch.setenv('HOME', str(tmpdir))
+
+    # other process wrote output and released lock before it was taken
+    assert base.get_exec_autocomplete('ls', ttl='300') == 'cached'
+    mock_run.assert_not_called()
+
+
+@mock.patch('sufler.base.refresh_exec_cache')
+@mock.patch('sufler.base.write_exec_cache')
+@mock.patch('sufler.base.read_exec_cache', return_value=None)
+@pytest.mark.parametrize('command, timeout, expected_value, timed_out', [
+    ('exit 1', None, '', False),
+    ('sleep 5', 0.1, '', True),
+    ('seq 3; sleep 5', 0.5, '1\n2\n3', True),
+])
+def test_get_exec_autocomplete_not_finished(mock_read_exec_cache, mock_write_exec_cache, mock_refresh,
+                                            command, timeout, expected_value, timed_out):
+    output = base.get_exec_autocomplete(command, timeout=timeout)
+
+    assert output == expected_value
+    assert isinstance(output, base.PartialOutput) == timed_out
+    mock_write_exec_cache.assert_not_called()
+    assert mock_refresh.called == timed_out
+
+
+def test_get_exec_autocomplete_finishes_timed_out_command(tmpdir, monkeypatch):
+    monkeypatch.setenv('HOME', str(tmpdir))
+    monkeypatch.setenv('PYTHONPATH', os.path.dirname(base.SUFLER_BASE_PATH))
+
+    assert base.get_exec_autocomplete('sleep 0.5; echo done', ttl='300', timeout=0.1) == ''
+
+    deadline = time.time() + 10
+    while base.read_exec_cache('sleep 0.5; echo done', '300') is None and time.time() < deadline:
+        time.sleep(0.05)
+    assert base.read_exec_cache('sleep 0.5; echo done', '300') == 'done\n'
+
+
+def test_get_exec_autocomplete_per_directory(tmpdir, monkeypatch):
+    monkeypatch.setenv('HOME', str(tmpdir))
+    first = tmpdir.mkdir('d1')
+    for name in ('d1', 'd2'):
+        directory = tmpdir.join(name)
+        directory.ensure(dir=True)
+        monkeypatch.chdir(directory)
+        assert base.get_exec_autocomplete('pwd', ttl='300', cwd=str(directory)) == str(directory) + '\n'
+        assert base.get_exec_autocomplete('pwd', ttl='300') == str(first) + '\n'
+
+
+@mock.patch('subprocess.Popen')
+@mock.patch('sufler.base.read_exec_cache', return_value='cached')
+def test_get_exec_autocomplete_cached(mock_read_exec_cache, mock_popen):
+    assert base.get_exec_autocomplete('ls') == 'cached'
+    mock_popen.assert_not_called()
+
+
+@mock.patch('sufler.base.refresh_exec_cache')
+@mock.patch('sufler.base.run_exec_command')
+@mock.patch('sufler.base.read_stale_exec_cache', return_value='stale')
+@mock.patch('sufler.base.read_exec_cache', return_value=None)
+def test_get_exec_autocomplete_stale(mock_read_exec_cache, mock_read_stale, mock_run, mock_refresh):
+    assert base.get_exec_autocomplete('ls', env={}, ttl='60', swr='600') == 'stale'
+
+    mock_read_stale.assert_called_once_with('ls', '60', '600', {}, None)
+    mock_run.assert_not_called()
+    mock_refresh.assert_called_once_with('ls', {}, None)
+
+
+def test_get_exec_autocomplete_refreshes_in_background(tmpdir, monkeypatch):
+    monkeypatch.setenv('HOME', str(tmpdir))
+    monkeypatch.setenv('PYTHONPATH', os.path.dirname(base.SUFLER_BASE_PATH))
+    base.write_exec_cache('echo new', 'old\n')
+
+    with mock.patch('sufler.cache.time.time', return_value=time.time() + 120):
+        assert base.get_exec_autocomplete('echo new', ttl='60', swr='600') == 'old\n'
+
+    deadline = time.time() + 10
+    while base.read_exec_cache('echo new', '60') != 'new\n' and time.time() < deadline:
+        time.sleep(0.05)
+    assert base.read_exec_cache('echo new', '60') == 'new\n'
+
+
+def test_get_exec_autocomplete_single_flight(tmpdir, monkeypatch):
+    monkeypatch.setenv('HOME', str(tmpdir))
+    counter = tmpdir.join('counter')
+    command = 'echo run >> {0}; sleep 0.5; echo done'.format(counter)
+    script = 'from sufler import base; print(base.get_exec_autocomplete({0!r}, timeout=5), end="")'.format(command)
+    env = dict(os.environ, PYTHONPATH=os.path.dirname(base.SUFLER_BASE_PATH))
+
+    processes = [
+        subprocess.Popen([sys.executable, '-c', script], env=env, stdout=subprocess.PIPE)
+        for _ in range(4)
+    ]
+    outputs = [process.communicate()[0] for process in processes]
+
+    assert outputs == [b'done\n'] * 4
+    assert counter.read() == 'run\n'
+
+
+def test_completion_runs_same_exec_once():
+    documents = [{'food': {'<Exec> ls': {'<Exec> ls': None, 'x': None}}}]
+    run_exec = mock.Mock(return_value='apple\npear\n')
+
+    options = base.completion(
+        'food', ['path', '2', 'food', 'apple', 'apple'],
+        documents=documents, run_exec=run_exec, prefix='apple',
+    )
+
+    assert options == 'apple'
+    run_exec.assert_called_once_with(' ls', None, mock.ANY, None, 'apple', None, None)
+
+
+def test_run_execs_returns_finished_commands():
+    released = threading.Event()
+
+    def run_exec(command, ttl, timeout, swr, prefix, limit, cwd):
+        if command == 'slow':
+            released.wait(5)
+        return command + ' output'
+
+    outputs = base.run_execs(
+        [('fast', None, None, None), ('slow', None, None, None), ('other', '300', '600', None)],
+        run_exec,
+        time.time() + 0.1,
+    )
+    released.set()
+
+    assert outputs == {'fast': 'fast output', 'other': 'other output'}
+
+
+def load_test_data():
+    path = os.path.abspath(os.path.dirname(__file__)) + '/test_data.yml'
+    return list(yaml.load_all(open(path, "r"), Loader=yaml.SafeLoader))
+
+
+def test_completion_skips_exec_of_not_selected_branch():
+    run_exec = mock.Mock(return_value='')
+
+    options = base.completion(
+        'food', ['path', '4', 'food', 'fruit', 'grape', ''],
+        documents=load_test_data(), run_exec=run_exec,
+    )
+
+    assert set(options.keys()) == {'green', 'red'}
+    run_exec.assert_not_called()
+
+
+def test_completion_runs_exec_of_selected_node():
+    run_exec = mock.Mock(return_value='Desktop\nMovies\n')
+
+    options = base.completion(
+        'food', ['path', '2', 'food', 'fruit', 'ban'],
+        documents=load_test_data(), run_exec=run_exec,
+    )
+
+    assert {'banana', 'Desktop', 'Movies'} <= set(options.keys())
+    run_exec.assert_called_once_with('ls ~/', None, mock.ANY, None, None, None, None)
+
+
+def test_completion_runs_exec_per_directory():
+    documents = [{'food': {'<Exec cwd> ls': None}}]
+    run_exec = mock.Mock(return_value='apple\n')
+
+    base.completion('food', ['path', '1', 'food', ''], documents=documents, run_exec=run_exec)
+
+    run_exec.assert_called_once_with(' ls', None, mock.ANY, None, None, None, os.getcwd())
+
+
+def test_completion_runs_exec_matching_argument():
+    run_exec = mock.Mock(return_value='Desktop\nMovies\n')
+
+    options = base.completion(
+        'food', ['path', '4', 'food', 'fruit', 'Movies', ''],
+        documents=load_test_data(), run_exec=run_exec,
+    )
+
+    assert set(options.keys()) == {'cat'}
+    run_exec.assert_called_once_with('ls ~/', None, mock.ANY, None, 'Movies', None, None)
+
+
+def test_completion_matches_argument_in_long_exec_output():
+    documents = [{'foo': {'<Exec ttl=0> seq 300000': {'x': None}, 'y': None}}]
+
+    options = base.completion('foo', ['path', '2', 'foo', '250000', ''], documents=documents)
+
+    assert set(options.keys()) == {'x'}
+
+
+def test_completion_runs_sibling_execs_concurrently():
+    documents = [{'food': {
+        '<Exec> echo apple': None,
+        '<Exec> echo pear': None,
+        '<Exec> echo plum': None,
+    }}]
+    # commands run one after another never meet at barrier
+    barrier = threading.Barrier(3, timeout=5)
+
+    def meet(command, ttl, timeout, swr, prefix, limit, cwd):
+        barrier.wait()
+        return command.split()[-1] + '\n'
+
+    run_exec = mock.Mock(side_effect=meet)
+
+    with mock.patch('sufler.base.COMPLETION_TIMEOUT', 10):
+        options = base.completion(
+            'food', ['path', '1', 'food', 'a'],
+            documents=documents, run_exec=run_exec,
+        )
+
+    assert options == 'apple\n'
+    assert run_exec.call_count == 3
+
+
+@mock.patch('sufler.base.COMPLETION_TIMEOUT', 0.1)
+def test_completion_returns_partial_results_after_timeout():
+    documents = [{'food': {
+        'fruit': None,
+        '<Exec> slow': {'ripe': None},
+        '<Exec> fast': {'ripe': None},
+    }}]
+    run_exec = mock.Mock(side_effect=lambda command, ttl, timeout, swr, prefix, limit, cwd: (
+        time.sleep(0.5) if command == ' slow' else 'apple\n'
+    ))
+
+    options = base.completion(
+        'food', ['path', '1', 'food', 'a'],
+        documents=documents, run_exec=run_exec,
+    )
+
+    assert set(options.keys()) == {'fruit', 'apple', ''}
+
+
+@pytest.mark.parametrize('prefix, limit, expected_value', [
+    (None, None, ['-maybe', '-m', '-certain', '-c']),
+    ('-m', None, ['-maybe', '-m']),
+    ('-c', None, ['-certain', '-c']),
+    ('', 2, ['-c', '-certain']),
+    ('x', None, []),
+])
+def test_completion_with_prefix(prefix, limit, expected_value):
+    options = base.completion(
+        'food', ['path', '2', 'food', 'veg', ''],
+        documents=load_test_data(), prefix=prefix, limit=limit,
+    )
+
+    assert sorted(options.keys()) == sorted(expected_value)
+
+
+def test_completion_with_prefix_filters_exec_output():
+    documents = [{'food': {'<Exec> ls': None}}]
+    run_exec = mock.Mock(return_value='apple\napricot\nbanana\navocado\n')
+
+    options = base.completion(
+        'food', ['path', '1', 'food', 'ap'],
+        documents=documents, run_exec=run_exec, prefix='ap', limit=1,
+    )
+
+    assert options == 'apple'
+    run_exec.assert_called_once_with(' ls', None, mock.ANY, None, 'ap', 1, None)
+
+
+def test_completion_reuses_exec_output_for_longer_prefix():
+    documents = [{'food': {'<Exec> ls': {'<Exec> ls': None}}}]
+    run_exec = mock.Mock(return_value='ap\napricot\n')
+
+    options = base.completion(
+        'food', ['path', '3', 'food', 'ap', 'apr'],
+        documents=documents, run_exec=run_exec, prefix='apr',
+    )
+
+    assert options == 'apricot'
+    run_exec.assert_called_once_with(' ls', None, mock.ANY, None, 'ap', None, None)
+
+
+def test_run_execs_returns_partial_output_after_deadline():
+    outputs = base.run_execs(
+        [('seq 3; sleep 5', '0', None, None), ('echo done', '0', None, None)],
+        base.run_exec_autocomplete,
+        time.time() + 0.5,
+    )
+
+    assert outputs == {'seq 3; sleep 5': '1\n2\n3', 'echo done': 'done\n'}
+
+
+def test_get_exec_autocomplete_streams_output(tmpdir, monkeypatch):
+    monkeypatch.setenv('HOME', str(tmpdir))
+
+    assert base.get_exec_autocomplete('seq 1000000000', timeout=5, prefix='7', limit=2) == '7\n70'
+    assert base.read_exec_cache('seq 1000000000') is None
+
+    output = ''.join('{0}\n'.format(number) for number in range(1, 21))
+    assert base.get_exec_autocomplete('seq 20', timeout=5, prefix='1', limit=20) == output
+    assert base.read_exec_cache('seq 20') == output
+
+
+@pytest.mark.parametrize('prefix, expected_value', [
+    ('b', ('b', 'ba', 'bb')),
+    ('ba', ('ba',)),
+    ('', ('a', 'b', 'ba', 'bb', 'c')),
+    ('x', ()),
+])
+def test_filter_keys(prefix, expected_value):
+    assert base.filter_keys(('a', 'b', 'ba', 'bb', 'c'), prefix) == expected_value
+
+
+def test_completion_keeps_compiled_tree():
+    documents = [compile_tree({'food': {'<Exec> ls': {'<Exec> ls -a': None}}})]
+    node = documents[0].children['food']
+    run_exec = mock.Mock(return_value='apple\nbanana')
+
+    for _ in range(2):
+        options = base.completion(
+            'food', ['path', '2', 'food', 'apple', ''],
+            documents=documents, run_exec=run_exec,
+        )
+        assert options == 'apple\nbanana'
+
+    assert node.keys == () and node.children == {}
+    assert [marker.body for marker in node.markers] == [' ls']
+
+
+def test_completion_writes_trace(tmpdir, monkeypatch):
+    monkeypatch.setenv('SUFLER_TRACE', '1')
+    monkeypatch.setenv('SUFLER_TRACE_FILE', str(tmpdir.join('trace.log')))
+    monkeypatch.setenv('HOME', str(tmpdir))
+    documents = [{'food': {
+        '<Exec> ls': {'apple': None}, '<Exec> echo b': {'pear': None}, '<File>': None, '<Regex>^x': None,
+    }}]
+
+    base.completion('food', ['path', '2', 'food', 'a', ''], documents=documents, run_exec=lambda *args: 'a')
+
+    record = json.loads(tmpdir.join('trace.log').read())
+    assert record['command'] == 'food'
+    assert record['spec'] == str(tmpdir.join('.sufler', 'completions', 'food.yml'))
+    phases = sorted((phase['phase'], phase['detail']) for phase in record['phases'])
+    assert phases == [
+        ('exec', ' echo b'), ('exec', ' ls'), ('file', 'a'), ('regex', '^x'), ('traverse', None),
+    ]
+
+
+@pytest.mark.parametrize('typed, expected_value', [
+    (['food', 'apple', 'apple-pie', ''], {'slice'}),
+    (['food', 'apple', 'pear', ''], {'core'}),
+    (['food', 'apple', 'x', ''], {'core'}),
+])
+def test_completion_with_regex_markers(typed, expected_value):
+    documents = [{'food': {
+        'apple': {'<Regex>^TREE~3-': {'slice': None}, '<Regex>[x-': {'never': None}, 'core': None},
+    }}]
+
+    options = base.completion('food', ['path', str(len(typed) - 1)] + typed, documents=documents)
+
+    assert set(options.keys()) == expected_value
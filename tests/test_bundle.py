@@ -0,0 +1,136 @@
+import os
+
+import mock
+import pytest
+from click import testing
+
+from sufler import base, bundle, cli, spec
+
+TEST_DATA_PATH = os.path.abspath(os.path.dirname(__file__)) + '/test_data.yml'
+
+
+def compile_bundle():
+    header = spec.get_spec_header(spec.get_spec_path('food'))
+    bundle.write_bundle(
+        bundle.get_bundle_path(), [('food', header, spec.load_spec('food'))]
+    )
+
+
+def test_bundle_nodes(sufler_home):
+    compile_bundle()
+    compiled = spec.load_spec('food')[0].children['food']
+    food = bundle.open_bundle().get_documents('food')[0].children['food']
+
+    assert tuple(food.keys) == compiled.keys
+    assert tuple(food.sorted_keys) == compiled.sorted_keys
+    assert food.sorted_keys[-1] == compiled.sorted_keys[-1]
+    assert food.sorted_keys[1:3] == compiled.sorted_keys[1:3]
+    assert base.filter_keys(food.sorted_keys, 'b') == ('booze:',)
+    assert 'dairy:' in food.children
+    assert 'dairy: ' not in food.children
+    assert 'missing' not in food.children
+    with pytest.raises(KeyError):
+        food.children['missing']
+
+    fruit = food.children['fruit']
+    assert fruit.children['orange'].id == fruit.id
+    assert fruit.children['grape'].children['red'] is None
+
+    markers = food.children['--color'].markers
+    assert [(marker.name, marker.body) for marker in markers] == [('Regex', '.*ack')]
+    assert markers[0].pattern.search('black')
+    assert markers[0].child.id == food.children['veg'].children['-m'].id
+
+
+@pytest.mark.parametrize('arguments, prefix', [
+    (['path', '1', 'food', ''], None),
+    (['path', '2', 'food', 'fruit', 'or'], 'or'),
+    (['path', '3', 'food', 'veg', '-c'], None),
+    (['path', '3', 'food', 'fruit', '', 'cat'], None),
+    (['path', '3', 'food', '--color', 'black'], None),
+    (['path', '4', 'food', 'dairy:', 'cow=', 'milk'], None),
+])
+def test_bundle_completion(sufler_home, arguments, prefix):
+    compile_bundle()
+    run_exec = lambda command, ttl, timeout, swr, prefix, limit, cwd: 'a\nb'
+
+    expected = base.completion(
+        'food', arguments, documents=spec.load_spec('food'),
+        run_exec=run_exec, prefix=prefix,
+    )
+    options = base.completion(
+        'food', arguments, documents=bundle.load_bundle_spec('food'),
+        run_exec=run_exec, prefix=prefix,
+    )
+
+    assert sorted(options) == sorted(expected)
+
+
+def test_load_bundle_spec(sufler_home):
+    assert bundle.load_bundle_spec('food') is None
+
+    compile_bundle()
+    assert bundle.load_bundle_spec('food')[0].children['food'].id == 1
+    assert bundle.load_bundle_spec('pip') is None
+
+    os.remove(spec.get_spec_path('food'))
+    assert bundle.load_bundle_spec('food') is not None
+
+
+def test_load_bundle_spec_outdated(sufler_home):
+    compile_bundle()
+
+    with open(spec.get_spec_path('food'), 'a') as f:
+        f.write("\n'drinks':\n")
+
+    assert bundle.load_bundle_spec('food') is None
+    assert 'drinks' in base.get_autocomplete_file_for_command('food')[0].children
+
+
+def test_open_bundle_other_version(sufler_home):
+    with open(bundle.get_bundle_path(), 'wb') as f:
+        f.write(b'SUFLERB\0' + b'\0' * 100)
+
+    assert bundle.open_bundle() is None
+
+
+def test_compile_command(sufler_home):
+    output = str(sufler_home.join('food.bundle'))
+
+    result = testing.CliRunner().invoke(cli.cli, ['compile', '--output', output])
+
+    assert result.exit_code == 0
+    assert output in result.output
+    documents = bundle.load_bundle_spec('food', output)
+    assert 'veg' in documents[0].children['food'].children
+
+
+def test_load_mapped_spec(sufler_home):
+    documents = bundle.load_mapped_spec('food')
+    assert os.path.isfile(bundle.get_mapped_spec_path('food'))
+    assert bundle.is_mapped_spec_fresh('food')
+    assert 'veg' in documents[0].children['food'].children
+
+    with mock.patch('sufler.bundle.parse_spec') as mock_parse_spec:
+        documents = bundle.load_mapped_spec('food')
+
+    mock_parse_spec.assert_not_called()
+    assert isinstance(documents[0], bundle.BundleNode)
+
+    with open(spec.get_spec_path('food'), 'a') as f:
+        f.write("\n'drinks':\n")
+
+    assert not bundle.is_mapped_spec_fresh('food')
+    assert 'drinks' in bundle.load_mapped_spec('food')[0].children
+
+
+def test_autocomplete_file_for_large_spec(sufler_home, monkeypatch):
+    assert not isinstance(base.get_autocomplete_file_for_command('food')[0], bundle.BundleNode)
+
+    monkeypatch.setattr(bundle, 'SPEC_MMAP_THRESHOLD', 0)
+    base.get_autocomplete_file_for_command('food')
+    documents = base.get_autocomplete_file_for_command('food')
+
+    assert isinstance(documents[0], bundle.BundleNode)
+    options = base.completion('food', ['path', '2', 'food', 'veg', '-'], documents=documents, prefix='-')
+    assert sorted(options) == ['-c', '-certain', '-m', '-maybe']
@@ -0,0 +1,137 @@
+import os
+
+import mock
+import pytest
+
+from sufler import cache
+
+
+def test_exec_cache_roundtrip(sufler_home):
+    cache.write_exec_cache('npm list', 'express\nreact\n')
+
+    assert cache.read_exec_cache('npm list') == 'express\nreact\n'
+    assert cache.read_exec_cache('npm whoami') is None
+
+
+def test_exec_cache_expired(sufler_home):
+    cache.write_exec_cache('npm list', 'express\n')
+
+    with mock.patch('sufler.cache.time.time', return_value=10 ** 10):
+        assert cache.read_exec_cache('npm list', '300') is None
+    assert cache.read_exec_cache('npm list', '300') == 'express\n'
+
+
+def test_exec_cache_disabled_by_ttl(sufler_home):
+    cache.write_exec_cache('npm list', 'express\n')
+
+    assert cache.read_exec_cache('npm list', '0') is None
+
+
+def test_stale_exec_cache(sufler_home):
+    cache.write_exec_cache('npm list', 'express\n')
+    created = cache.time.time()
+
+    with mock.patch('sufler.cache.time.time', return_value=created + 400):
+        assert cache.read_exec_cache('npm list', '300') is None
+        assert cache.read_stale_exec_cache('npm list', '300', '200') == 'express\n'
+        assert cache.read_stale_exec_cache('npm list', '300', '50') is None
+        assert cache.read_stale_exec_cache('npm list', '300') is None
+        assert cache.read_stale_exec_cache('npm list', '0', '200') is None
+
+
+@pytest.mark.parametrize('swr, expected_value', [
+    (None, 0),
+    ('300', 300),
+    ('-1', 0),
+    ('wrong', 0),
+])
+def test_get_swr(swr, expected_value):
+    assert cache.get_swr(swr) == expected_value
+
+
+def test_exec_refresh_runs_once(sufler_home):
+    sufler_home.join('.sufler').mkdir('cache').mkdir('exec')
+
+    assert cache.start_exec_refresh('npm list')
+    assert not cache.start_exec_refresh('npm list')
+    cache.finish_exec_refresh('npm list')
+    assert cache.start_exec_refresh('npm list')
+
+    os.utime(cache.get_exec_cache_file('npm list') + '.refresh', (0, 0))
+    assert cache.start_exec_refresh('npm list')
+
+
+@pytest.mark.parametrize('ttl, expected_value', [
+    (None, cache.EXEC_CACHE_TTL),
+    ('300', 300),
+    ('wrong', cache.EXEC_CACHE_TTL),
+])
+def test_get_ttl(ttl, expected_value):
+    assert cache.get_ttl(ttl) == expected_value
+
+
+def test_evict_exec_cache_least_recently_used(sufler_home):
+    cache.write_exec_cache('old', 'x' * 100)
+    cache.write_exec_cache('new', 'x' * 100)
+    os.utime(cache.get_exec_cache_file('old'), (0, 0))
+
+    cache.evict_exec_cache(200)
+
+    assert not os.path.exists(cache.get_exec_cache_file('old'))
+    assert os.path.exists(cache.get_exec_cache_file('new'))
+
+
+def test_exec_cache_per_directory_and_environment(sufler_home):
+    cache.write_exec_cache('pip freeze', 'django\n', {'VIRTUAL_ENV': '/venvs/one'})
+    cache.write_exec_cache('npm ls', 'express\n', cwd='/projects/one')
+
+    assert cache.read_exec_cache('pip freeze', env={'VIRTUAL_ENV': '/venvs/one'}) == 'django\n'
+    assert cache.read_exec_cache('pip freeze', env={'VIRTUAL_ENV': '/venvs/two'}) is None
+    assert cache.read_exec_cache('npm ls', cwd='/projects/one') == 'express\n'
+    assert cache.read_exec_cache('npm ls', cwd='/projects/two') is None
+    assert cache.read_exec_cache('npm ls') is None
+
+
+def test_clear_exec_cache(sufler_home):
+    cache.write_exec_cache('npm list', 'express\n')
+
+    cache.clear_exec_cache()
+
+    assert not os.path.exists(cache.get_exec_cache_path())
+    cache.clear_exec_cache()
+
+
+def test_exec_command_lock(sufler_home):
+    with cache.exec_command_lock('npm list') as waited:
+        assert waited is False
+        with cache.exec_command_lock('npm list', timeout=0.05) as other_waited:
+            assert other_waited is None
+        with cache.exec_command_lock('npm whoami', timeout=0.05) as other_waited:
+            assert other_waited is False
+
+    with cache.exec_command_lock('npm list', timeout=0.05) as waited:
+        assert waited is False
+
+
+def test_evict_exec_cache_keeps_locks(sufler_home):
+    cache.write_exec_cache('npm list', 'x' * 100)
+    with cache.exec_command_lock('npm list'):
+        cache.evict_exec_cache(0)
+
+    assert os.listdir(cache.get_exec_cache_path()) == [
+        os.path.basename(cache.get_exec_cache_file('npm list')) + '.lock'
+    ]
+
+
+def test_evict_exec_cache_removes_locks(sufler_home):
+    cache.write_exec_cache('npm list', 'x' * 100)
+    for command in ('npm list', 'exit 1', 'sleep 1'):
+        with cache.exec_command_lock(command):
+            pass
+    os.utime(cache.get_exec_cache_file('exit 1') + '.lock', (0, 0))
+
+    cache.evict_exec_cache(0)
+
+    assert os.listdir(cache.get_exec_cache_path()) == [
+        os.path.basename(cache.get_exec_cache_file('sleep 1')) + '.lock'
+    ]
@@ -4,6 +4,7 @@ from click import testing
 from mock import mock_open, patch
 
 from sufler import cli
+from sufler.spec import compile_tree
 
 try:
     from StringIO import StringIO
@@ -37,26 +38,37 @@ def test_get_commands(mock_listdir, mock_isfile):
     mock_isfile.assert_called()
 
 
-@patch('sufler.cli.get_completions_directory_from_git')
-@patch('sufler.cli.os.path.expanduser', return_value='')
-@patch('sufler.cli.os.listdir', side_effect=['pip', 'food'])
-@patch('sufler.cli.shutil.copyfile')
-@patch('sufler.cli.shutil.rmtree')
-def test_install_completion_files(
-        mock_rmtree,
-        mock_copyfile,
-        mock_listdir,
-        mock_expand,
-        mock_get_completions):
+@patch('sufler.cli.extract_completions', side_effect=[['pip.yml'], ['npm.yml']])
+@patch('sufler.cli.download_archives', return_value=[
+    ('https://a/master.zip', '/cache/a.zip', True),
+    ('https://b/master.zip', None, False),
+    ('https://c/master.zip', '/cache/c.zip', True),
+])
+@patch('sufler.cli.get_repository_urls', return_value=['https://a/master.zip'])
+def test_install_completion_files(mock_urls, mock_download_archives, mock_extract):
+    assert cli.install_completion_files() == ['pip.yml', 'npm.yml']
 
-    cli.install_completion_files()
+    mock_download_archives.assert_called_once_with(['https://a/master.zip'])
+    completions_path = os.path.expanduser('~/.sufler/completions')
+    assert mock_extract.call_args_list == [
+        (('/cache/a.zip', completions_path),),
+        (('/cache/c.zip', completions_path),),
+    ]
 
-    mock_rmtree.assert_called_once_with('')
-    mock_copyfile.assert_called()
-    mock_listdir.assert_called()
-    mock_expand.assert_called()
-    assert len(mock_expand.mock_calls) == 6
-    mock_get_completions.assert_called()
+
+def test_get_repository_urls(tmpdir, monkeypatch):
+    monkeypatch.setenv('HOME', str(tmpdir))
+    assert cli.get_repository_urls() == [cli.CONFIG_DATA['repos'][0]['url']]
+
+    tmpdir.mkdir('.sufler').join('.config').write(
+        'repos:\n'
+        '- url: https://example.com/a/master.zip\n'
+        '- url: https://example.com/b.git\n'
+        '- url: https://example.com/c/master.zip\n'
+    )
+    assert cli.get_repository_urls() == [
+        'https://example.com/a/master.zip', 'https://example.com/c/master.zip',
+    ]
 
 
 SHELL_LIST = [
@@ -138,6 +150,24 @@ def test_bash_shell_initialize(mock_exists):
     mock_exists.assert_called()
 
 
+@patch('sufler.cli.BaseShell.get_install_path', return_value='')
+@pytest.mark.parametrize('shell_to_cls', [
+    (cli.SHELL_NAME_TO_CLASS['bash']),
+    (cli.SHELL_NAME_TO_CLASS['zsh']),
+])
+def test_bash_zsh_install_commands_removes_static(mock_get_install_path, shell_to_cls):
+    shell = shell_to_cls()
+
+    m = mock_open(read_data=(
+        'bash_completer\ncomplete -F _completer -o default food\n'
+        '# sufler static food\nold\n# sufler static food end\n'
+    ))
+    with patch('sufler.cli.open', m):
+        shell.install_commands(['food'])
+
+    assert m().write.call_args[0][0] == 'bash_completer\ncomplete -F _completer -o default food'
+
+
 @patch('sufler.cli.Bash.get_install_path', return_value='')
 @patch('sufler.cli.os.path.exists', return_value=False)
 @patch('sufler.cli.Bash.initialize')
@@ -225,3 +255,136 @@ def test_powershell_install(mock_check_output, mock_exists, mock_get_install_pat
     assert mock_check_output.call_count == 2
     assert mock_exists.call_count == 2
     assert mock_get_install_path.call_count == 2
+
+
+@patch('sufler.cli.get_command_tree', return_value=compile_tree({'veg': None}))
+@patch('sufler.cli.BaseShell.get_install_path', return_value='')
+@pytest.mark.parametrize('shell_to_cls', [
+    (cli.SHELL_NAME_TO_CLASS['bash']),
+    (cli.SHELL_NAME_TO_CLASS['zsh']),
+])
+def test_bash_zsh_install_static_commands(mock_get_install_path, mock_get_command_tree, shell_to_cls):
+    shell = shell_to_cls()
+
+    m = mock_open(read_data='bash_completer\n# sufler static food\nold\n# sufler static food end\n')
+    with patch('sufler.cli.open', m):
+        shell.install_static_commands(['food'])
+
+    written = m().write.call_args[0][0]
+    assert 'old' not in written
+    assert written.startswith('bash_completer\n# sufler static food\n')
+    assert 'complete -F _sufler_static_food -o default food' in written
+    mock_get_command_tree.assert_called_once_with('food')
+
+
+@patch('sufler.cli.Bash.get_install_path', return_value='')
+@patch('sufler.cli.os.path.exists', return_value=True)
+@patch('sufler.cli.Bash.install_static_commands')
+@patch('sufler.cli.Bash.install_commands')
+def test_bash_shell_install_static(mock_install_commands, mock_install_static_commands, mock_exists,
+                                   mock_get_install_path):
+    shell = cli.Bash()
+    commands = ['food', 'cargo', 'flake8']
+
+    shell.install(commands, static=True)
+
+    mock_install_static_commands.assert_called_once_with(commands)
+    mock_install_commands.assert_not_called()
+
+
+@patch('sufler.cli.get_command_tree', return_value=compile_tree({'veg': None}))
+@patch('sufler.cli.Fish.get_install_path', return_value='/fish/')
+def test_fish_shell_install_static(mock_get_install_path, mock_get_command_tree):
+    shell = cli.Fish()
+
+    m = mock_open()
+    with patch('sufler.cli.open', m):
+        shell.install(['food'], static=True)
+
+    m.assert_called_once_with('/fish/food.fish', 'w')
+    assert 'function __sufler_static_food' in m().write.call_args[0][0]
+
+
+@patch('sufler.cli.load_spec', return_value=[compile_tree({'food': {'veg': None}})])
+def test_get_command_tree(mock_load_spec):
+    assert cli.get_command_tree('food').keys == ('veg',)
+    assert cli.get_command_tree('cargo') is None
+
+
+def test_stats_command(tmpdir):
+    trace_path = tmpdir.join('trace.log')
+    trace_path.write('\n'.join([
+        '{"command": "food", "spec": "/food.yml", "total": 0.01, "phases": []}',
+        '{"command": "food", "spec": "/food.yml", "total": 0.03, '
+        '"phases": [{"phase": "exec", "duration": 0.02, "detail": "ls"}]}',
+    ]))
+
+    result = testing.CliRunner().invoke(cli.cli, ['stats', '--file', str(trace_path)])
+
+    assert result.exit_code == 0
+    assert 'command food (2 requests)' in result.output
+    assert 'spec /food.yml (2 requests)' in result.output
+    assert '    total         10.0ms    30.0ms    30.0ms' in result.output
+    assert '    exec          20.0ms    20.0ms    20.0ms' in result.output
+    assert '    exec ls       20.0ms    20.0ms    20.0ms' in result.output
+
+
+def test_stats_command_without_traces(tmpdir):
+    result = testing.CliRunner().invoke(cli.cli, ['stats', '--file', str(tmpdir.join('trace.log'))])
+
+    assert 'SUFLER_TRACE=1' in result.output
+
+
+class FakeShell(cli.BaseShell):
+    shell_name = 'fake'
+
+    def __init__(self, path):
+        self.path = path
+        self.installed = []
+
+    def install(self, commands, static=False):
+        self.installed.append(list(commands))
+        with open(self.path, 'a') as f:
+            f.write(' '.join(commands))
+
+    def get_artifact_paths(self, commands):
+        return [self.path]
+
+
+@pytest.mark.parametrize('static, expected_value', [
+    (False, [['food', 'cargo'], ['flake8']]),
+    (True, [['food', 'cargo'], ['food', 'flake8']]),
+])
+def test_install_shell_skips_unchanged(tmpdir, static, expected_value):
+    shell = FakeShell(str(tmpdir.join('completer')))
+    manifest = {'specs': {}, 'shells': {}}
+
+    cli.install_shell(shell, ['food', 'cargo'], static, manifest, {'food': 'a', 'cargo': 'b'})
+    cli.install_shell(shell, ['food', 'cargo'], static, manifest, {'food': 'a', 'cargo': 'b'})
+    cli.install_shell(shell, ['food', 'cargo', 'flake8'], static, manifest, {'food': 'c', 'cargo': 'b', 'flake8': 'd'})
+
+    assert shell.installed == expected_value
+    assert manifest['shells']['fake']['artifacts'] == {shell.path: cli.hash_file(shell.path)}
+
+
+def test_install_shell_reinstalls_modified_artifacts(tmpdir):
+    shell = FakeShell(str(tmpdir.join('completer')))
+    manifest = {'specs': {}, 'shells': {}}
+
+    cli.install_shell(shell, ['food'], False, manifest, {'food': 'a'})
+    tmpdir.join('completer').write('')
+    cli.install_shell(shell, ['food'], False, manifest, {'food': 'a'})
+    cli.install_shell(shell, ['food'], True, manifest, {'food': 'a'})
+
+    assert shell.installed == [['food'], ['food'], ['food']]
+
+
+@patch('sufler.cli.extract_completions', return_value=['pip.yml'])
+@patch('sufler.cli.download_archives', return_value=[
+    (cli.CONFIG_DATA['repos'][0]['url'], '/cache/master.zip', False),
+])
+def test_install_completion_files_not_modified(mock_download_archives, mock_extract):
+    assert cli.install_completion_files() == ['pip.yml']
+
+    mock_download_archives.assert_called_once()
+    mock_extract.assert_called_once_with('/cache/master.zip', os.path.expanduser('~/.sufler/completions'))
@@ -0,0 +1,94 @@
+import os
+import subprocess
+
+import pytest
+import yaml
+
+from sufler import codegen
+from sufler.spec import compile_tree
+
+TEST_DATA_PATH = os.path.abspath(os.path.dirname(__file__)) + '/test_data.yml'
+
+
+def load_food():
+    with open(TEST_DATA_PATH, 'r') as f:
+        return compile_tree(list(yaml.load_all(f, Loader=yaml.SafeLoader))[0]).children['food']
+
+
+def bash_complete(code, words):
+    script = code + '''
+_completer() {
+    COMPREPLY=( dynamic )
+}
+COMP_WORDS=( "$@" )
+COMP_CWORD=$(( ${#COMP_WORDS[@]} - 1 ))
+_sufler_static_food
+printf '%s\\n' "${COMPREPLY[@]}"
+'''
+    output = subprocess.check_output(['bash', '-c', script, 'bash'] + words)
+    return set(output.decode('utf-8').split('\n')) - {''}
+
+
+@pytest.mark.parametrize('words, expected_value', [
+    (['food', ''], {'-f', 'meat', 'candy', 'dairy:', 'veg', 'fruit', '-r', 'booze:', '--color', 'other'}),
+    (['food', 'veg', '-c', ''], {'asparagus', 'broccoli', 'brussel sprouts'}),
+    (['food', 'veg', '-c', 'b'], {'broccoli', 'brussel sprouts'}),
+    (['food', '--color', 'black', ''], {'tomato', 'avocado'}),
+    (['food', 'dairy:', 'cow=', 'milk', 't'], {'tomato'}),
+    (['food', 'unknown', 'me'], {'meat'}),
+    (['food', '-r', 'setup.py', 'fr'], {'fruit'}),
+    (['food', 'fruit', ''], {'dynamic'}),
+    (['food', 'fruit', 'grape', ''], {'green', 'red'}),
+    (['food', 'fruit', 'Movies', ''], {'dynamic'}),
+    (['food', '-f', 'x', ''], {'dynamic'}),
+])
+def test_generate_bash(words, expected_value):
+    code = codegen.generate_bash('food', load_food())
+
+    assert bash_complete(code, words) == expected_value
+
+
+def test_generate_bash_ends_anchor_cycles():
+    root = {'a': {}}
+    root['a']['b'] = root
+
+    code = codegen.generate_bash('food', compile_tree(root))
+
+    assert bash_complete(code, ['food', 'a', 'b', 'a', '']) == {'b'}
+
+
+@pytest.mark.parametrize('pattern, expected_value', [
+    ('^http:.*', '^http:.*'),
+    (r'^\d*', '^[0-9]*'),
+    (r'^a\.b', r'^a\.b'),
+    (r'[\d]', None),
+    (r'\bword', None),
+    ('(?i)abc', None),
+    ('a+?', None),
+])
+def test_to_extended_regex(pattern, expected_value):
+    assert codegen.to_extended_regex(pattern) == expected_value
+
+
+def test_generate_fish():
+    code = codegen.generate_fish('food', load_food(), 'python fish.py (commandline -cp)')
+
+    assert 'function __sufler_static_food' in code
+    assert "printf '%s\\n' 'green' 'red'" in code
+    assert "string match -rq -- '.*ack' \"$word\"" in code
+    assert 'python fish.py (commandline -cp); return' in code
+    assert "complete --command food --arguments '(__sufler_static_food)' -f" in code
+
+
+@pytest.mark.parametrize('value, expected_value', [
+    ("it's", "'it\\'s'"),
+    ('a\\b', "'a\\\\b'"),
+])
+def test_quote_fish(value, expected_value):
+    assert codegen.quote_fish(value) == expected_value
+
+
+def test_remove_bash_function():
+    content = 'header\n' + codegen.generate_bash('food', compile_tree({'a': None}))
+
+    assert codegen.remove_bash_function(content, 'food') == 'header'
@@ -0,0 +1,102 @@
+import os
+import threading
+
+import mock
+import pytest
+
+from sufler import base, bundle, client, daemon, spec
+
+
+@pytest.fixture
+def server(sufler_home):
+    cwd = os.getcwd()
+    server = daemon.CompletionServer(client.get_socket_path())
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+    os.chdir(cwd)
+
+
+def test_client_completion_from_daemon(server):
+    with mock.patch('sufler.base.completion') as mock_completion:
+        options = client.completion('food', ['path', '3', 'food', 'veg', '-c'])
+
+    mock_completion.assert_not_called()
+    assert set(options.keys()) == {'asparagus', 'broccoli', '"brussel sprouts"'}
+    assert 'food' in server.specs
+
+
+def test_client_completion_from_daemon_with_prefix(server):
+    options = client.completion('food', ['path', '2', 'food', 'veg', '-'], prefix='-m', limit=1)
+
+    assert list(options.keys()) == ['-m']
+
+
+def test_client_completion_from_daemon_with_bundle_only(server):
+    path = spec.get_spec_path('food')
+    bundle.write_bundle(bundle.get_bundle_path(), [('food', spec.get_spec_header(path), spec.load_spec('food'))])
+    os.remove(path)
+
+    with mock.patch('sufler.base.completion') as mock_completion:
+        options = client.completion('food', ['path', '3', 'food', 'veg', '-c'])
+
+    mock_completion.assert_not_called()
+    assert set(options.keys()) == {'asparagus', 'broccoli', '"brussel sprouts"'}
+    assert isinstance(server.specs['food'][1][0], bundle.BundleNode)
+
+
+def test_daemon_walks_large_spec_in_mapped_cache(server, monkeypatch):
+    monkeypatch.setattr(bundle, 'SPEC_MMAP_THRESHOLD', 0)
+
+    options = client.completion('food', ['path', '3', 'food', 'veg', '-c'])
+
+    assert set(options.keys()) == {'asparagus', 'broccoli', '"brussel sprouts"'}
+    assert isinstance(server.specs['food'][1][0], bundle.BundleNode)
+
+
+def test_client_completion_daemon_keeps_tree(server):
+    arguments = ['path', '3', 'food', '--color', 'black']
+
+    assert set(client.completion('food', arguments).keys()) == {'tomato', 'avocado'}
+    assert set(client.completion('food', arguments).keys()) == {'tomato', 'avocado'}
+
+
+@mock.patch('sufler.daemon.get_exec_autocomplete', return_value='one\ntwo\n')
+def test_daemon_reuses_exec_results(mock_exec, server):
+    assert server.run_exec('ls', None, 1, '/', {}) == 'one\ntwo\n'
+    assert server.run_exec('ls', None, 1, '/', {}) == 'one\ntwo\n'
+    mock_exec.assert_called_once_with('ls', env={}, ttl=None, timeout=1, swr=None, prefix=None, limit=None, cwd='/')
+
+    server.run_exec('ls', None, 1, '/', {}, None, 'o', 1)
+    assert mock_exec.call_count == 2
+
+
+@mock.patch('sufler.daemon.get_exec_autocomplete', return_value=base.PartialOutput('one'))
+def test_daemon_doesnt_keep_partial_exec_results(mock_exec, server):
+    assert server.run_exec('ls', None, 1, '/', {}) == 'one'
+    assert server.run_exec('ls', None, 1, '/', {}) == 'one'
+    assert mock_exec.call_count == 2
+
+
+@mock.patch('sufler.daemon.get_exec_autocomplete', return_value='one\ntwo\n')
+def test_daemon_exec_results_respect_ttl(mock_exec, server):
+    server.run_exec('ls', '0', 1, '/', {})
+    server.run_exec('ls', '0', 1, '/', {})
+    assert mock_exec.call_count == 2
+
+
+@mock.patch('sufler.base.completion', return_value={'veg': None})
+def test_client_completion_without_daemon(mock_completion, sufler_home):
+    assert client.completion('food', ['path', '1', 'food']) == {'veg': None}
+    mock_completion.assert_called_once_with('food', ['path', '1', 'food'], prefix=None, limit=None)
+
+
+@mock.patch('sufler.base.completion', return_value={'veg': None})
+def test_client_completion_stale_socket(mock_completion, sufler_home):
+    sufler_home.join('sufler.sock').write('')
+
+    assert client.completion('food', ['path', '1', 'food']) == {'veg': None}
+    mock_completion.assert_called_once()
@@ -0,0 +1,173 @@
+import threading
+import zipfile
+
+import pytest
+import requests
+from six.moves import BaseHTTPServer
+
+from sufler import download
+
+ARCHIVE = b'PK archive'
+ETAG = '"v1"'
+LAST_MODIFIED = 'Tue, 01 May 2018 10:00:00 GMT'
+
+
+class ArchiveHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """ Serve ARCHIVE with validators, answer 304 when they match """
+
+    def do_GET(self):
+        self.server.requests.append(dict(self.headers))
+        if self.headers.get('If-None-Match') == self.server.etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+
+        self.send_response(200)
+        self.send_header('ETag', self.server.etag)
+        self.send_header('Last-Modified', LAST_MODIFIED)
+        self.send_header('Content-Length', str(len(self.server.content)))
+        self.end_headers()
+        self.wfile.write(self.server.content)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_server(content):
+    server = BaseHTTPServer.HTTPServer(('127.0.0.1', 0), ArchiveHandler)
+    server.requests = []
+    server.etag = ETAG
+    server.content = content
+    server.url = 'http://127.0.0.1:{0}/master.zip'.format(server.server_address[1])
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server
+
+
+def stop_server(server):
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def server(tmpdir, monkeypatch):
+    monkeypatch.setenv('HOME', str(tmpdir))
+    server = start_server(ARCHIVE)
+    yield server
+    stop_server(server)
+
+
+def test_download_archive(server):
+    archive_path, changed = download.download_archive(server.url)
+
+    assert changed
+    with open(archive_path, 'rb') as f:
+        assert f.read() == ARCHIVE
+    assert 'If-None-Match' not in server.requests[0]
+
+
+def test_download_archive_not_modified(server):
+    download.download_archive(server.url)
+    archive_path, changed = download.download_archive(server.url)
+
+    assert not changed
+    assert server.requests[1]['If-None-Match'] == ETAG
+    assert server.requests[1]['If-Modified-Since'] == LAST_MODIFIED
+    with open(archive_path, 'rb') as f:
+        assert f.read() == ARCHIVE
+
+
+def test_download_archive_modified(server):
+    download.download_archive(server.url)
+    server.etag = '"v2"'
+    server.content = b'PK new archive'
+
+    archive_path, changed = download.download_archive(server.url)
+
+    assert changed
+    with open(archive_path, 'rb') as f:
+        assert f.read() == b'PK new archive'
+
+
+def test_download_archive_without_cached_archive(server):
+    archive_path, _ = download.download_archive(server.url)
+    download.os.remove(archive_path)
+
+    _, changed = download.download_archive(server.url)
+
+    assert changed
+    assert 'If-None-Match' not in server.requests[1]
+
+
+def test_download_archive_offline(server):
+    archive_path, _ = download.download_archive(server.url)
+    stop_server(server)
+
+    assert download.download_archive(server.url) == (archive_path, False)
+
+
+def test_download_archive_offline_without_cache(server):
+    stop_server(server)
+
+    with pytest.raises(requests.RequestException):
+        download.download_archive(server.url)
+
+
+def test_download_archives(server):
+    other = start_server(b'PK other')
+    try:
+        urls = [other.url, server.url, other.url]
+        results = download.download_archives(urls)
+        assert [(url, changed) for url, _, changed in results] == [
+            (other.url, True), (server.url, True),
+        ]
+        with open(results[0][1], 'rb') as f:
+            assert f.read() == b'PK other'
+        with open(results[1][1], 'rb') as f:
+            assert f.read() == ARCHIVE
+        assert len(other.requests) == 1
+
+        results = download.download_archives(urls)
+        assert [changed for _, _, changed in results] == [False, False]
+    finally:
+        stop_server(other)
+
+
+def test_download_archives_failed_repository(server):
+    other = start_server(b'PK other')
+    stop_server(other)
+
+    results = download.download_archives([other.url, server.url])
+
+    assert results[0] == (other.url, None, False)
+    assert results[1][0] == server.url
+    assert results[1][2]
+
+
+@pytest.fixture
+def repository_archive(tmpdir):
+    archive_path = str(tmpdir.join('master.zip'))
+    with zipfile.ZipFile(archive_path, 'w') as zip_file:
+        zip_file.writestr('sufler-completions-master/README.md', 'readme')
+        zip_file.writestr('sufler-completions-master/completions/npm.yml', 'npm:')
+        zip_file.writestr('sufler-completions-master/completions/pip.yml', 'pip:')
+        zip_file.writestr('sufler-completions-master/completions/notes.txt', '')
+        zip_file.writestr('sufler-completions-master/tests/completions/x/git.yml', '')
+        zip_file.writestr('sufler-completions-master/docs/completions/git.yml', '')
+    return archive_path
+
+
+def test_extract_completions(tmpdir, repository_archive):
+    completions = tmpdir.mkdir('completions')
+    completions.join('pip.yml').write('custom')
+
+    extracted = download.extract_completions(repository_archive, str(completions))
+
+    assert extracted == ['npm.yml']
+    assert sorted(completions.listdir()) == [
+        completions.join('npm.yml'), completions.join('pip.yml'),
+    ]
+    assert completions.join('npm.yml').read() == 'npm:'
+    assert completions.join('pip.yml').read() == 'custom'
+    assert not tmpdir.join('sufler-completions-master').check()
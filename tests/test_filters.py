@@ -0,0 +1,120 @@
+import subprocess
+import time
+
+import pytest
+
+from sufler import base, filters
+from sufler.base import run_exec_command
+
+NPM_LIST = '/usr/lib\n├── npm@6.1.0\n├─┬ yarn@1.7.0\n│ └── @scope/pkg@1.0.0\n└── ls@1.0\n'
+SIMPLE_INDEX = '<html>\n<a href="/simple/django/">django</a>\n<a href="/simple/dask/">dask</a>\n<a href="/simple/pip/">pip</a>\n'
+
+
+@pytest.mark.parametrize('output, pipeline, stages', [
+    (NPM_LIST, 'tail -n+2 | sed "s/.* //" | sed "s/@.*//"', '|> lines 1: |> replace ".* " "" |> replace "@.*" ""'),
+    (NPM_LIST, 'tail -n+2 | sed "s/.* //"', '|> lines 1: |> replace ".* " ""'),
+    ('pip==10.0\nsix==1.11\n', 'sed "s/=.*//"', '|> replace "=.*" ""'),
+    (SIMPLE_INDEX, 'cut -d ">" -f 2 | cut -d "<" -f 1 | grep "^d.*"', '|> field ">" 2 |> field "<" 1 |> grep "^d"'),
+    ('b\na\nb\n', 'sort | uniq', '|> sort |> unique'),
+    ('a\nb\nc\nd\n', 'head -n 2', '|> lines :2'),
+])
+def test_stages_match_shell_pipeline(output, pipeline, stages):
+    expected = subprocess.check_output(pipeline, shell=True, input=output.encode('utf-8')).decode('utf-8')
+
+    _, parsed = filters.parse_exec('cat ' + stages)
+
+    assert filters.apply_stages(output, parsed) == expected
+
+
+def test_extract_stage():
+    _, stages = filters.parse_exec('ls |> extract "name=(\\w+)" |> extract "\\d+"')
+
+    assert filters.apply_stages('name=a1\nother\nname=b22\n', stages) == '1\n22\n'
+
+
+def test_extract_stage_without_group_match():
+    command = 'printf "a1\\nb\\n" |> extract "(\\d)?[ab]"'
+
+    assert run_exec_command(command, timeout=5, prefix='') == (['a', 'b'], 'a\nb\n', 0)
+
+
+@pytest.mark.parametrize('body', [
+    'ls |> head 3',
+    'ls |> ',
+    'ls |> lines',
+    'ls |> field ":"',
+    'ls |> field ":" 0',
+    'ls |> grep "("',
+    'ls |> sort 1',
+])
+def test_parse_exec_wrong_stage(body):
+    with pytest.raises(ValueError):
+        filters.parse_exec(body)
+
+
+@pytest.mark.parametrize('command, expected_value', [
+    ('npm list -g --depth=1', ['npm', 'list', '-g', '--depth=1']),
+    ('echo "a b"', ['echo', 'a b']),
+    ('ls ~/', None),
+    ('npm ls | tail', None),
+    ('echo $HOME', None),
+    ('LANG=C ls', None),
+    ('echo "a', None),
+    ('', None),
+])
+def test_split_command(command, expected_value):
+    assert filters.split_command(command) == expected_value
+
+
+@pytest.mark.parametrize('command, expected_value', [
+    ('printf "b\\na\\nb\\n" |> sort |> unique', (['a', 'b'], 'a\nb\n', 0)),
+    ('printf "b\\na\\n" | sort |> lines 1:', (['b'], 'b\n', 0)),
+    ('printf "a\\nb\\na\\n"', (['a', 'b'], 'a\nb\na\n', 0)),
+    ('yes |> lines :2', (['y'], 'y\ny\n', 0)),
+    ('missing-sufler-command', ([], None, 127)),
+    ('ls |> head', ([], None, 1)),
+])
+def test_run_exec_command_with_stages(command, expected_value):
+    assert run_exec_command(command, timeout=5) == expected_value
+
+
+def test_run_exec_command_streams_matching_lines():
+    started = time.time()
+
+    candidates, output, returncode = run_exec_command(
+        'seq 1000000000 |> replace "^" "line"', timeout=5, prefix='line2', limit=3,
+    )
+
+    assert candidates == ['line2', 'line20', 'line21']
+    assert output is None
+    assert returncode == 0
+    assert time.time() - started < 2
+
+
+def test_run_exec_command_bounded_output(monkeypatch):
+    monkeypatch.setattr(base, 'EXEC_OUTPUT_LIMIT', 10)
+
+    candidates, output, returncode = run_exec_command('seq 1000 |> grep "^5"', timeout=5, prefix='50')
+
+    assert candidates == ['50', '500', '501', '502', '503', '504', '505', '506', '507', '508', '509']
+    assert output is None
+
+
+def test_run_exec_command_bounded_candidates(monkeypatch):
+    monkeypatch.setattr(base, 'EXEC_CANDIDATES_LIMIT', 3)
+    started = time.time()
+
+    candidates, output, returncode = run_exec_command('seq 1000000000', timeout=5)
+
+    assert candidates == ['1', '2', '3']
+    assert output is None
+    assert returncode == 0
+    assert time.time() - started < 2
+
+
+@pytest.mark.parametrize('command, expected_value', [
+    ('sleep 5', ([], None, None)),
+    ('seq 3; sleep 5', (['1', '2', '3'], None, None)),
+])
+def test_run_exec_command_timeout(command, expected_value):
+    assert run_exec_command(command, timeout=0.5) == expected_value
@@ -0,0 +1,80 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+PACKAGE_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# completion without daemon imports backend and then sufler.base with
+# spec loader and cache, it has to stay well below import of the cli
+IMPORT_TIME_RATIO = 0.5
+
+HEAVY_MODULES = {
+    'click', 'concurrent', 'hashlib', 'requests', 'six', 'subprocess', 'yaml', 'zipfile',
+}
+
+
+def import_time(*modules):
+    """ Import modules in fresh interpreter with -X importtime
+
+    :param modules: Modules imported one after another
+    :return: Tuple with cumulative time of all modules in microseconds
+        and set of modules imported by them
+    """
+    output = subprocess.check_output(
+        [sys.executable, '-X', 'importtime', '-c', 'import ' + ', '.join(modules)],
+        cwd=PACKAGE_PATH, stderr=subprocess.STDOUT,
+    ).decode('utf-8')
+
+    total = 0
+    found = set()
+    imported = set()
+    nested = set()
+    for line in output.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+
+        _, cumulative, name = line.split('|')
+        if name.strip() in modules and not name.startswith('  '):
+            total += int(cumulative)
+            found.add(name.strip())
+            imported |= nested
+            nested = set()
+            continue
+
+        # top level import before modules, e.g. from site
+        if not name.startswith('  '):
+            nested = set()
+        else:
+            nested.add(name.strip().split('.')[0])
+
+    missing = set(modules) - found
+    if missing:
+        raise AssertionError('{0} not found in output of importtime'.format(', '.join(sorted(missing))))
+    return total, imported
+
+
+def best_import_time(*modules):
+    return min(import_time(*modules)[0] for _ in range(3))
+
+
+@pytest.mark.parametrize('module', [
+    'sufler.backends.bash.bash',
+    'sufler.backends.fish.fish',
+    'sufler.backends.powershell.powershell',
+])
+def test_completion_import_time(module):
+    cumulative = best_import_time(module, 'sufler.base')
+
+    assert cumulative < best_import_time('sufler.cli') * IMPORT_TIME_RATIO
+
+
+@pytest.mark.parametrize('modules', [
+    ('sufler.backends.bash.bash',),
+    ('sufler.backends.bash.bash', 'sufler.base'),
+])
+def test_completion_does_not_import_heavy_modules(modules):
+    _, imported = import_time(*modules)
+
+    assert not imported & HEAVY_MODULES
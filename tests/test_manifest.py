@@ -0,0 +1,54 @@
+import pytest
+
+from sufler import manifest
+
+
+@pytest.fixture
+def manifest_path(tmpdir, monkeypatch):
+    monkeypatch.setenv('HOME', str(tmpdir))
+    tmpdir.mkdir('.sufler')
+    return tmpdir.join('.sufler', 'manifest.json')
+
+
+def test_write_and_read_manifest(manifest_path):
+    data = manifest.empty_manifest()
+    data['specs']['food'] = manifest.hash_content('food')
+
+    manifest.write_manifest(data)
+
+    assert manifest_path.check()
+    assert manifest.read_manifest() == data
+
+
+@pytest.mark.parametrize('content', [
+    '',
+    '{"specs": ',
+    '[]',
+    '{"version": 0, "specs": {"food": "x"}, "shells": {}}',
+])
+def test_read_manifest_broken(manifest_path, content):
+    manifest_path.write(content)
+
+    assert manifest.read_manifest() == manifest.empty_manifest()
+
+
+def test_hash_file(tmpdir):
+    path = tmpdir.join('completer')
+    path.write('complete')
+
+    assert manifest.hash_file(str(path)) == manifest.hash_content(b'complete')
+    assert manifest.hash_file(str(tmpdir.join('missing'))) is None
+
+
+def test_artifacts_unchanged(tmpdir):
+    path = tmpdir.join('completer')
+    path.write('complete')
+    artifacts = {str(path): manifest.hash_file(str(path))}
+
+    assert manifest.artifacts_unchanged(artifacts)
+
+    path.write('changed')
+    assert not manifest.artifacts_unchanged(artifacts)
+
+    path.remove()
+    assert not manifest.artifacts_unchanged(artifacts)
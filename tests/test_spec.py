@@ -0,0 +1,128 @@
+import os
+
+import mock
+import pytest
+
+from sufler import spec
+
+TEST_DATA_PATH = os.path.abspath(os.path.dirname(__file__)) + '/test_data.yml'
+
+
+def test_parse_spec_keeps_anchors():
+    documents = spec.parse_spec(TEST_DATA_PATH)
+    food = documents[0]['food']
+    assert food['fruit']['orange'] is food['fruit']
+    assert food['-r']['<File>'] is food
+
+
+def test_load_spec_writes_cache(sufler_home):
+    documents = spec.load_spec('food')
+
+    assert os.path.isfile(spec.get_spec_cache_path('food'))
+    assert 'veg' in documents[0].children['food'].children
+
+
+def test_load_spec_reads_cache(sufler_home):
+    spec.load_spec('food')
+
+    with mock.patch('sufler.spec.parse_spec') as mock_parse_spec:
+        documents = spec.load_spec('food')
+
+    mock_parse_spec.assert_not_called()
+    fruit = documents[0].children['food'].children['fruit']
+    assert fruit.children['orange'] is fruit
+
+
+def test_load_spec_rebuilds_changed_cache(sufler_home):
+    spec.load_spec('food')
+
+    with open(spec.get_spec_path('food'), 'a') as f:
+        f.write("\n'drinks':\n")
+
+    documents = spec.load_spec('food')
+    assert 'drinks' in documents[0].children
+
+
+@mock.patch('sufler.spec.pickle.load', side_effect=EOFError)
+def test_read_spec_cache_broken_file(mock_load, sufler_home):
+    spec.load_spec('food')
+    header = spec.get_spec_header(spec.get_spec_path('food'))
+
+    assert spec.read_spec_cache(spec.get_spec_cache_path('food'), header) is None
+
+
+@pytest.mark.parametrize('key, expected_value', [
+    ('<Exec> ls', ('Exec', {}, ' ls')),
+    ('<Exec ttl=300> npm list', ('Exec', {'ttl': '300'}, ' npm list')),
+    ('<File rec>', ('File', {'rec': True}, '')),
+    ('<Regex>^\\d>*', ('Regex', {}, '^\\d>*')),
+])
+def test_parse_marker(key, expected_value):
+    assert spec.parse_marker(key) == expected_value
+
+
+def test_compile_tree_keeps_anchors():
+    food = spec.compile_tree(spec.parse_spec(TEST_DATA_PATH)[0]).children['food']
+
+    assert isinstance(food, spec.Node)
+    assert food.children['fruit'].children['orange'] is food.children['fruit']
+    file_marker = food.children['-r'].markers[0]
+    assert (file_marker.name, file_marker.child) == ('File', food)
+
+
+def test_compile_tree_splits_markers():
+    node = spec.compile_tree({'b': None, 'a': {'c': None}, '<Exec ttl=5> ls': None})
+
+    assert node.keys == ('b', 'a')
+    assert node.sorted_keys == ('a', 'b')
+    assert node.children['b'] is None
+    assert [(m.name, m.options, m.body) for m in node.markers] == [('Exec', {'ttl': '5'}, ' ls')]
+    with pytest.raises(AttributeError):
+        node.extra = None
+
+
+def test_compile_tree_indexes_keys_without_trailing_whitespace():
+    node = spec.compile_tree({'dairy: ': {'milk': None}, 'a': {'exact': None}, 'a ': {'spaced': None}})
+
+    assert node.keys == ('dairy: ', 'a', 'a ')
+    assert node.children['dairy:'] is node.children['dairy: ']
+    assert node.children['a'].keys == ('exact',)
+    assert node.children['a '].keys == ('spaced',)
+
+
+def test_compile_tree_numbers_nodes():
+    document = spec.parse_spec(TEST_DATA_PATH)[0]
+    root = spec.compile_tree(document)
+    food = root.children['food']
+
+    assert root.id == 0
+    assert food.children['fruit'].children['orange'].id == food.children['fruit'].id
+    assert spec.compile_tree(document).children['food'].children['veg'].id == food.children['veg'].id
+
+
+def test_compile_tree_compiles_patterns_once():
+    node = spec.compile_tree({'a': {'<Regex>^\\d+': None}, 'b': {'<Regex>^\\d+': None}, '<Regex>TREE~1.*': None})
+
+    pattern = node.children['a'].markers[0].pattern
+    assert pattern.match('123')
+    assert node.children['b'].markers[0].pattern is pattern
+    assert node.markers[0].pattern is None
+
+
+@mock.patch('sufler.spec.logger')
+def test_compile_tree_reports_invalid_pattern(mock_logger):
+    node = spec.compile_tree({'<Regex>[a-': None})
+
+    assert node.markers[0].pattern is None
+    assert '<Regex>[a-' in mock_logger.warning.call_args[0][0]
+
+
+def test_is_spec_cache_fresh(sufler_home):
+    assert not spec.is_spec_cache_fresh('food')
+
+    spec.load_spec('food')
+    assert spec.is_spec_cache_fresh('food')
+
+    with open(spec.get_spec_path('food'), 'a') as f:
+        f.write("\n'drinks':\n")
+    assert not spec.is_spec_cache_fresh('food')
@@ -0,0 +1,83 @@
+import json
+
+import pytest
+
+from sufler import trace
+
+
+@pytest.fixture
+def trace_path(tmpdir, monkeypatch):
+    path = tmpdir.join('.sufler', 'trace.log')
+    monkeypatch.setenv('SUFLER_TRACE_FILE', str(path))
+    return path
+
+
+@pytest.mark.parametrize('value, expected_value', [
+    ('1', True),
+    ('0', False),
+    ('', False),
+])
+def test_is_trace_enabled(monkeypatch, value, expected_value):
+    monkeypatch.setenv('SUFLER_TRACE', value)
+    assert trace.is_trace_enabled() == expected_value
+
+
+def test_start_trace_disabled(monkeypatch, trace_path):
+    monkeypatch.delenv('SUFLER_TRACE', raising=False)
+
+    completion_trace = trace.start_trace('food', '/food.yml')
+    completion_trace.add('load', 0)
+    completion_trace.write()
+
+    assert completion_trace is trace.NO_TRACE
+    assert not trace_path.check()
+
+
+def test_trace_write(monkeypatch, trace_path):
+    monkeypatch.setenv('SUFLER_TRACE', '1')
+
+    for _ in range(2):
+        completion_trace = trace.start_trace('food', '/food.yml')
+        completion_trace.add('exec', completion_trace.started, 'ls')
+        completion_trace.write()
+
+    lines = trace_path.read().splitlines()
+    assert len(lines) == 2
+    record = json.loads(lines[0])
+    assert (record['command'], record['spec']) == ('food', '/food.yml')
+    assert [(phase['phase'], phase['detail']) for phase in record['phases']] == [('exec', 'ls')]
+
+
+def test_read_traces_skips_broken_lines(trace_path):
+    trace_path.write('{"command": "food"}\n{"comm', ensure=True)
+
+    assert trace.read_traces(str(trace_path)) == [{'command': 'food'}]
+
+
+@pytest.mark.parametrize('percent, expected_value', [
+    (50, 5),
+    (95, 10),
+    (99, 10),
+    (10, 1),
+])
+def test_percentile(percent, expected_value):
+    assert trace.percentile(list(range(1, 11)), percent) == expected_value
+
+
+def test_aggregate_traces():
+    traces = [
+        {'command': 'food', 'total': 0.3, 'phases': [
+            {'phase': 'exec', 'duration': 0.1, 'detail': ' ls'},
+            {'phase': 'exec', 'duration': 0.1, 'detail': ' npm ls'},
+        ]},
+        {'command': 'food', 'total': 0.1, 'phases': [{'phase': 'load', 'duration': 0.05}]},
+        {'command': 'cargo', 'total': 0.2, 'phases': []},
+    ]
+
+    stats = trace.aggregate_traces(traces, 'command')
+
+    assert stats['food']['total'] == (2, 0.1, 0.3, 0.3)
+    assert stats['food']['exec'] == (1, 0.2, 0.2, 0.2)
+    assert stats['food']['exec npm ls'] == (1, 0.1, 0.1, 0.1)
+    assert stats['food']['load'] == (1, 0.05, 0.05, 0.05)
+    assert stats['cargo'] == {'total': (1, 0.2, 0.2, 0.2)}
@@ -0,0 +1,69 @@
+import os
+import shutil
+
+import mock
+from click import testing
+
+from sufler import base, cache, cli, spec, warm
+from sufler.spec import compile_tree
+
+TEST_DATA_PATH = os.path.abspath(os.path.dirname(__file__)) + '/test_data.yml'
+
+
+def test_collect_exec_commands():
+    documents = spec.parse_spec(TEST_DATA_PATH)
+
+    assert warm.collect_exec_commands([compile_tree(documents[0])]) == [
+        'ls ~/', ' echo $ASKBASH_TOKEN* ',
+    ]
+
+
+def test_collect_exec_commands_skips_dynamic_and_visits_cycles_once():
+    root = {}
+    root['next'] = {
+        '<Exec> ls': root,
+        '<Exec ttl=0> date': None,
+        '<Exec cwd> npm ls': None,
+        '<Exec> ls TREE~1': None,
+        'back': root,
+    }
+    root['<Exec swr=60> ls'] = root['next']
+
+    assert warm.collect_exec_commands([compile_tree(root), None]) == [' ls']
+
+
+def test_warm_exec_cache(sufler_home):
+    results = warm.warm_exec_cache(['echo one', 'exit 1'], workers=2)
+
+    assert [(command, status) for command, _, status in results] == [
+        ('echo one', 'ok'), ('exit 1', 'failed'),
+    ]
+    assert cache.read_exec_cache('echo one') == 'one\n'
+    assert cache.read_exec_cache('exit 1') is None
+
+
+def test_warm_command(sufler_home):
+    shutil.copyfile(TEST_DATA_PATH, spec.get_spec_path('food'))
+    sufler_home.join('.sufler', 'completions', 'drinks.yml').write(
+        "'drinks':\n    '<Exec> echo tea': \n"
+    )
+
+    result = testing.CliRunner().invoke(cli.cli, ['warm', '--name', 'drinks'])
+
+    assert result.exit_code == 0
+    assert 'ok' in result.output
+    assert 'Warmed 1 of 1 commands' in result.output
+    assert cache.read_exec_cache(' echo tea') == 'tea\n'
+
+
+def test_warm_exec_cache_serves_other_directory(sufler_home, monkeypatch):
+    documents = [{'food': {'<Exec> echo apple': None}}]
+    monkeypatch.chdir(sufler_home.mkdir('one'))
+    warm.warm_exec_cache(warm.collect_exec_commands([compile_tree(documents[0])]), workers=1)
+
+    monkeypatch.chdir(sufler_home.mkdir('two'))
+    with mock.patch('sufler.base.run_exec_command') as mock_run:
+        options = base.completion('food', ['path', '1', 'food', ''], documents=documents)
+
+    assert options == 'apple\n'
+    mock_run.assert_not_called()